@@ -0,0 +1,318 @@
+import os
+import time
+import uuid
+import random
+import threading
+from decimal import Decimal
+from contextlib import contextmanager
+
+# Admission control (virtual waiting room) for the ticket handlers
+# Deploy this file next to each handler (same zip or a Lambda layer).
+#
+# During an on-sale every buyer's agent calls GetAvailableSeats, TicketPurchase and TicketHold at once, and each
+# call would open its own Postgres connection. With ADMISSION_MODE=on:
+#   - queue: each new agent session takes the next ticket number from an atomic counter, and ticket numbers are
+#     admitted in order at ADMISSION_RATE per second. Up to ADMISSION_BURST unused admissions build up while the
+#     queue is idle, so normal traffic never waits. A caller that is not admitted yet gets its position and an
+#     ETA without touching the database (HTTP 429). Its ticket number is returned in sessionAttributes
+#     (queueTicket, with queuePosition and queueEtaSeconds), so calling again keeps its place. An admitted session stays admitted for ADMISSION_PASS_SECONDS.
+#   - slots: admitted purchases also need one of ADMISSION_MAX_CONCURRENT slots while they hold a database
+#     connection; a caller waits up to ADMISSION_SLOT_WAIT_SECONDS for one and is otherwise told to retry.
+#
+# The state is kept in memory, which covers one process (LocalServer.py, BenchmarkWaitingRoom.py, or a single
+# Lambda container). With ADMISSION_TABLE set it is kept in a DynamoDB table (partition key "pk" (S)) shared
+# by every container: one queue item whose ticket counter is taken with an atomic ADD (returning callers only
+# read it; the frontier is written back at most every ADMISSION_FRONTIER_WRITE_SECONDS), and the slots as leases
+# that lapse after ADMISSION_SLOT_SECONDS in case a container dies while holding one.
+
+SETTINGS = {
+    "mode": os.environ.get('ADMISSION_MODE', 'off'),
+    "rate": float(os.environ.get('ADMISSION_RATE', '20')),
+    "burst": int(os.environ.get('ADMISSION_BURST', '50')),
+    "maxConcurrent": int(os.environ.get('ADMISSION_MAX_CONCURRENT', '10')),
+    "passSeconds": float(os.environ.get('ADMISSION_PASS_SECONDS', '600')),
+    "slotWaitSeconds": float(os.environ.get('ADMISSION_SLOT_WAIT_SECONDS', '2')),
+    "slotSeconds": float(os.environ.get('ADMISSION_SLOT_SECONDS', '30')),
+    "frontierWriteSeconds": float(os.environ.get('ADMISSION_FRONTIER_WRITE_SECONDS', '1')),
+    "table": os.environ.get('ADMISSION_TABLE'),
+    "queue": os.environ.get('ADMISSION_QUEUE', 'ticket-onsale')
+}
+
+# DynamoDB errors that only mean the queue item is hot; the caller is told to retry (HTTP 429), not a 500
+BUSY_ERRORS = ("ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded",
+               "TransactionConflictException")
+
+
+class QueueBusy(Exception):
+    pass
+
+
+class Admission:
+    def __init__(self, admitted, ticket=None, position=0, eta_seconds=0.0):
+        self.admitted = admitted
+        self.ticket = ticket
+        self.position = position
+        self.eta_seconds = eta_seconds
+
+
+class MemoryQueue:
+    # issued: last ticket number handed out; frontier: tickets up to here are admitted
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.issued = 0
+        self.frontier = float(burst)
+        self.updated_at = time.time()
+        self.lock = threading.Lock()
+
+    def step(self, ticket, now):
+        with self.lock:
+            self.frontier = min(self.frontier + self.rate * (now - self.updated_at), self.issued + self.burst)
+            self.updated_at = now
+            if ticket is None or ticket > self.issued:
+                # New caller, or a ticket from another queue instance (e.g. a different container)
+                self.issued += 1
+                ticket = self.issued
+            return ticket, self.frontier
+
+
+class DynamoQueue:
+    # Only new callers write: their ticket number comes from one atomic UpdateItem (ADD), so they never retry
+    # against each other. Returning callers just read the item. The frontier is derived from the stored one and
+    # written back at most every frontier_write_seconds, and only if nobody moved it meanwhile; losing that race is
+    # harmless, the winner stored (almost) the same value.
+
+    def __init__(self, table, name, rate, burst, frontier_write_seconds):
+        self.table = table
+        self.key = {"pk": f"queue#{name}"}
+        self.rate = rate
+        self.burst = burst
+        self.frontier_write_seconds = frontier_write_seconds
+
+    def step(self, ticket, now):
+        from botocore.exceptions import ClientError
+        try:
+            if ticket is None:
+                item = self.take_ticket()
+                ticket = int(item["issued"])
+            else:
+                item = self.table.get_item(Key=self.key).get("Item") or {}
+                if ticket > int(item.get("issued", 0)):
+                    # A ticket from another queue (e.g. after the table was reset): take a new one
+                    item = self.take_ticket()
+                    ticket = int(item["issued"])
+            issued = int(item["issued"])
+
+            updated_at = float(item["updatedAt"]) if "updatedAt" in item else None
+            frontier = float(item["frontier"]) if "frontier" in item else float(self.burst)
+            frontier = min(frontier + self.rate * max(now - (updated_at or now), 0), issued + self.burst)
+            if updated_at is None or now - updated_at >= self.frontier_write_seconds:
+                self.store_frontier(frontier, now, updated_at)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in BUSY_ERRORS:
+                raise QueueBusy(str(e))
+            raise
+        return ticket, frontier
+
+    def take_ticket(self):
+        return self.table.update_item(
+            Key=self.key,
+            UpdateExpression="ADD issued :one",
+            ExpressionAttributeValues={":one": 1},
+            ReturnValues="ALL_NEW"
+        )["Attributes"]
+
+    def store_frontier(self, frontier, now, seen_updated_at):
+        from botocore.exceptions import ClientError
+        if seen_updated_at is None:
+            condition, values = "attribute_not_exists(updatedAt)", {}
+        else:
+            condition, values = "updatedAt = :seen", {":seen": Decimal(f"{seen_updated_at:.3f}")}
+        try:
+            self.table.update_item(
+                Key=self.key,
+                UpdateExpression="SET frontier = :frontier, updatedAt = :now",
+                ConditionExpression=condition,
+                ExpressionAttributeValues={**values, ":frontier": Decimal(f"{frontier:.3f}"),
+                                           ":now": Decimal(f"{now:.3f}")}
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+
+
+class MemorySlots:
+    def __init__(self, max_concurrent):
+        self.semaphore = threading.BoundedSemaphore(max_concurrent)
+
+    def acquire(self, wait_seconds):
+        return self.semaphore.acquire(timeout=wait_seconds) and "local"
+
+    def release(self, lease):
+        self.semaphore.release()
+
+
+class DynamoSlots:
+    def __init__(self, table, name, max_concurrent, lease_seconds):
+        self.table = table
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.lease_seconds = lease_seconds
+
+    def try_slot(self, slot, holder, now):
+        from botocore.exceptions import ClientError
+        try:
+            self.table.put_item(
+                Item={"pk": f"slot#{self.name}#{slot}", "holder": holder,
+                      "expiresAt": Decimal(f"{now + self.lease_seconds:.3f}")},
+                ConditionExpression="attribute_not_exists(pk) OR expiresAt < :now",
+                ExpressionAttributeValues={":now": Decimal(f"{now:.3f}")}
+            )
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+            return False
+
+    def acquire(self, wait_seconds):
+        holder = uuid.uuid4().hex
+        deadline = time.time() + wait_seconds
+        while True:
+            start = random.randrange(self.max_concurrent)
+            for offset in range(self.max_concurrent):
+                slot = (start + offset) % self.max_concurrent
+                if self.try_slot(slot, holder, time.time()):
+                    return (slot, holder)
+            if time.time() >= deadline:
+                return None
+            time.sleep(0.05)
+
+    def release(self, lease):
+        from botocore.exceptions import ClientError
+        slot, holder = lease
+        try:
+            self.table.delete_item(Key={"pk": f"slot#{self.name}#{slot}"},
+                                   ConditionExpression="holder = :holder",
+                                   ExpressionAttributeValues={":holder": holder})
+        except ClientError:
+            # Lease already lapsed and taken over; nothing to give back
+            pass
+
+
+_queue = None
+_slots = None
+_init_lock = threading.Lock()
+
+
+def configure(**settings):
+    # Overrides SETTINGS (keys as above) and starts a fresh queue; used by the benchmarks
+    global _queue, _slots
+    with _init_lock:
+        SETTINGS.update(settings)
+        _queue = None
+        _slots = None
+
+
+def enabled():
+    return SETTINGS["mode"] == "on"
+
+
+def _state():
+    global _queue, _slots
+    with _init_lock:
+        if _queue is None:
+            if SETTINGS["table"]:
+                import boto3
+                table = boto3.resource('dynamodb', region_name=os.environ.get('MY_AWS_REGION', 'us-east-1')).Table(
+                    SETTINGS["table"])
+                _queue = DynamoQueue(table, SETTINGS["queue"], SETTINGS["rate"], SETTINGS["burst"],
+                                     SETTINGS["frontierWriteSeconds"])
+                _slots = DynamoSlots(table, SETTINGS["queue"], SETTINGS["maxConcurrent"], SETTINGS["slotSeconds"])
+            else:
+                _queue = MemoryQueue(SETTINGS["rate"], SETTINGS["burst"])
+                _slots = MemorySlots(SETTINGS["maxConcurrent"])
+        return _queue, _slots
+
+
+def admit(event):
+    # Call before opening a database connection. The queue fields are written to event['sessionAttributes'], so
+    # session_attributes(event) returns them to the agent with the handler's response.
+    if not enabled():
+        return Admission(True)
+
+    attributes = event.setdefault('sessionAttributes', {})
+    if attributes is None:
+        attributes = event['sessionAttributes'] = {}
+    now = time.time()
+    if now - float(attributes.get('admittedAt', 0)) < SETTINGS["passSeconds"]:
+        return Admission(True, int(attributes.get('queueTicket', 0)) or None)
+
+    ticket = int(attributes['queueTicket']) if attributes.get('queueTicket') else None
+    queue, _ = _state()
+    try:
+        ticket, frontier = queue.step(ticket, now)
+    except QueueBusy as e:
+        # Throttled on the shared queue item: nobody was admitted or lost their place, so ask for a retry
+        print(f"Waiting room busy: {str(e)}")
+        return Admission(False, ticket)
+    attributes['queueTicket'] = str(ticket)
+
+    if ticket <= frontier:
+        attributes['admittedAt'] = str(now)
+        return Admission(True, ticket)
+
+    position = ticket - int(frontier)
+    return Admission(False, ticket, position, position / SETTINGS["rate"])
+
+
+@contextmanager
+def purchase_slot():
+    # Yields True while holding one of the ADMISSION_MAX_CONCURRENT slots, False if none freed up in time
+    if not enabled():
+        yield True
+        return
+
+    _, slots = _state()
+    lease = slots.acquire(SETTINGS["slotWaitSeconds"])
+    if not lease:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        slots.release(lease)
+
+
+def waiting_room_response(event, admission, action_group, api_path, http_method):
+    # Answer for a caller that was not admitted (its place in admission.position, 0 when the shared queue was
+    # throttled) or, admitted, found every slot busy
+    if not admission.admitted and not admission.position:
+        body = "The ticket on-sale is very busy right now. Please try again in a few seconds."
+    elif admission.position:
+        retry_seconds = max(1, min(30, int(admission.eta_seconds)))
+        body = (f"The ticket on-sale is very busy and you are in the waiting room. Your place in line is "
+                f"{admission.position} (queue ticket {admission.ticket}), estimated wait about "
+                f"{max(1, round(admission.eta_seconds))} seconds. Please try again in {retry_seconds} seconds; "
+                f"your place is kept.")
+    else:
+        body = ("All checkout lanes are busy right now. You have been admitted; please try again in a few "
+                "seconds and your place is kept.")
+
+    return {
+        "messageVersion": "1.0",
+        "response": {
+            "actionGroup": event.get("actionGroup", action_group),
+            "apiPath": event.get("apiPath", api_path),
+            "httpMethod": event.get("httpMethod", http_method),
+            "httpStatusCode": 429,
+            "responseBody": {
+                "application/json": {
+                    "body": body
+                }
+            }
+        },
+        "sessionAttributes": {**(event.get('sessionAttributes') or {}),
+                              "queuePosition": str(admission.position),
+                              "queueEtaSeconds": f"{admission.eta_seconds:.1f}"}
+    }
@@ -4,6 +4,7 @@ import json
 import time
 from botocore.config import Config
 from botocore.exceptions import ReadTimeoutError, ClientError
+from IntentRouter import route, call, LambdaInvoker, InProcessInvoker
 
 # ---------------------------
 # Streamlit UI
@@ -26,6 +27,21 @@ with st.sidebar:
     st.header("⚙️ Advanced Settings")
     timeout_seconds = st.slider("Request Timeout (seconds)", 60, 600, 300)
     max_retries = st.slider("Max Retries", 1, 5, 3)
+    enable_trace = st.checkbox("Show latency trace", value=True,
+                               help="Request agent traces and show which collaborator/action group ran and how long each step took")
+
+    # Fast path: simple lookups call the action-group handler directly instead of going through the agents
+    st.header("⚡ Fast Path")
+    enable_fast_path = st.checkbox("Answer simple lookups directly", value=False,
+                                   help="Balance of account N, accounts of user N and available seats skip the supervisor and collaborator agents")
+    fast_path_mode = st.radio("Call handlers via", ["Lambda", "In-process"], horizontal=True, disabled=not enable_fast_path,
+                              help="Lambda invokes the deployed functions; In-process imports the handlers and needs the PG_* environment variables")
+    lambda_prefix = st.text_input("Lambda function name prefix", value="", disabled=not enable_fast_path or fast_path_mode != "Lambda",
+                                  help="Function names are this prefix followed by the handler name, e.g. GetAccountBalance")
+
+# Agent round-trip times of this session, used to show the latency the fast path saved
+if 'agent_latency_ms' not in st.session_state:
+    st.session_state.agent_latency_ms = []
 
 # User query
 user_query = st.text_area("💬 Enter your query:", height=100)
@@ -49,7 +65,7 @@ def create_bedrock_client(access_key, secret_key, region, timeout_sec, retries):
         config=config
     )
 
-def invoke_agent_with_retry(client, agent_id, alias_id, query, max_attempts=3):
+def invoke_agent_with_retry(client, agent_id, alias_id, query, max_attempts=3, enable_trace=False):
     """Invoke agent with retry logic"""
     for attempt in range(max_attempts):
         try:
@@ -59,7 +75,8 @@ def invoke_agent_with_retry(client, agent_id, alias_id, query, max_attempts=3):
                 agentId=agent_id,
                 agentAliasId=alias_id,
                 sessionId=f"streamlit-session-{int(time.time())}",
-                inputText=query
+                inputText=query,
+                enableTrace=enable_trace
             )
             return response
             
@@ -88,26 +105,209 @@ def invoke_agent_with_retry(client, agent_id, alias_id, query, max_attempts=3):
     
     return None
 
-def process_streaming_response(response):
+@st.cache_resource
+def create_lambda_client(access_key, secret_key, region):
+    """Lambda client for the fast path, created once per set of credentials"""
+    return boto3.client(
+        "lambda",
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        region_name=region,
+        config=Config(connect_timeout=5, read_timeout=30, retries={'max_attempts': 2, 'mode': 'standard'})
+    )
+
+@st.cache_resource
+def create_in_process_invoker():
+    return InProcessInvoker()
+
+def answer_fast_path(fast_route):
+    """Call the handler for a fast-path intent; returns False (fall back to the agent) if that is not possible"""
+    if fast_path_mode == "Lambda":
+        if not all([aws_access_key, aws_secret_key, aws_region]):
+            st.caption("🧭 Fast path needs AWS credentials in Lambda mode; using the agent")
+            return False
+        invoker = LambdaInvoker(create_lambda_client(aws_access_key, aws_secret_key, aws_region), lambda_prefix)
+    else:
+        invoker = create_in_process_invoker()
+
+    st.info(f"⚡ Fast path: {fast_route.describe()}")
+    try:
+        status, output_text, elapsed_ms = call(fast_route, invoker, f"streamlit-fastpath-{int(time.time())}")
+    except Exception as e:
+        st.warning(f"⚠️ Fast path failed ({str(e)}); using the agent")
+        return False
+
+    if status == 400:
+        # The pattern matched but the handler rejected the input: let the agent ask the user
+        st.caption(f"🧭 Fast path rejected the input ({output_text}); using the agent")
+        return False
+
+    st.markdown("**🤖 AI Assistant Response:**")
+    st.text(output_text)
+    if status == 200:
+        st.success("✅ Response completed successfully!")
+    else:
+        st.error(f"❌ {fast_route.intent.handler} returned HTTP {status}")
+
+    agent_latencies = st.session_state.agent_latency_ms
+    col1, col2 = st.columns(2)
+    col1.metric("Fast path time", f"{elapsed_ms:.0f} ms")
+    if agent_latencies:
+        agent_average_ms = sum(agent_latencies) / len(agent_latencies)
+        col2.metric("Saved vs agent", f"{(agent_average_ms - elapsed_ms) / 1000.0:.2f} s",
+                    help=f"Average agent round trip this session: {agent_average_ms / 1000.0:.2f} s over {len(agent_latencies)} queries")
+    else:
+        col2.metric("Saved vs agent", "n/a", help="Shown after the first agent query of this session")
+    return True
+
+def describe_trace_step(trace_event):
+    """Turn one Bedrock trace event into (agent, kind, name, phase) for the timeline"""
+    agent = trace_event.get("collaboratorName") or "Supervisor"
+    trace = trace_event.get("trace", {})
+
+    if "orchestrationTrace" in trace:
+        orchestration = trace["orchestrationTrace"]
+        if "modelInvocationInput" in orchestration:
+            return agent, "model", "orchestration", "start"
+        if "modelInvocationOutput" in orchestration:
+            return agent, "model", "orchestration", "end"
+        if "rationale" in orchestration:
+            return agent, "rationale", "", "point"
+        if "invocationInput" in orchestration:
+            invocation = orchestration["invocationInput"]
+            if "actionGroupInvocationInput" in invocation:
+                action = invocation["actionGroupInvocationInput"]
+                return agent, "action group", f"{action.get('actionGroupName', '')} {action.get('apiPath', '')}".strip(), "start"
+            if "agentCollaboratorInvocationInput" in invocation:
+                collaborator = invocation["agentCollaboratorInvocationInput"]
+                return agent, "collaborator", collaborator.get("agentCollaboratorName", ""), "start"
+            if "knowledgeBaseLookupInput" in invocation:
+                return agent, "knowledge base", invocation["knowledgeBaseLookupInput"].get("knowledgeBaseId", ""), "start"
+            return agent, invocation.get("invocationType", "invocation").lower(), "", "start"
+        if "observation" in orchestration:
+            observation = orchestration["observation"]
+            if "actionGroupInvocationOutput" in observation:
+                return agent, "action group", "", "end"
+            if "agentCollaboratorInvocationOutput" in observation:
+                collaborator = observation["agentCollaboratorInvocationOutput"]
+                return agent, "collaborator", collaborator.get("agentCollaboratorName", ""), "end"
+            if "knowledgeBaseLookupOutput" in observation:
+                return agent, "knowledge base", "", "end"
+            return agent, observation.get("type", "observation").lower(), "", "point"
+
+    for name in ("preProcessingTrace", "postProcessingTrace", "routingClassifierTrace"):
+        if name in trace:
+            step = trace[name]
+            if "modelInvocationInput" in step:
+                return agent, "model", name.replace("Trace", ""), "start"
+            if "modelInvocationOutput" in step:
+                return agent, "model", name.replace("Trace", ""), "end"
+            return agent, name.replace("Trace", ""), "", "point"
+
+    if "failureTrace" in trace:
+        return agent, "failure", trace["failureTrace"].get("failureReason", ""), "point"
+    if "guardrailTrace" in trace:
+        return agent, "guardrail", trace["guardrailTrace"].get("action", ""), "point"
+    return agent, "other", ", ".join(trace.keys()), "point"
+
+
+class TraceTimeline:
+    """Collects trace events with client-side arrival times and pairs start/end steps into durations"""
+
+    def __init__(self, request_started):
+        self.request_started = request_started
+        self.rows = []
+        self.raw_events = []
+        self.open_steps = {}
+        self.first_chunk_ms = None
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.request_started) * 1000.0
+
+    def add_chunk(self):
+        if self.first_chunk_ms is None:
+            self.first_chunk_ms = self.elapsed_ms()
+
+    def add_trace(self, trace_event):
+        at_ms = self.elapsed_ms()
+        self.raw_events.append({"receivedAtMs": round(at_ms, 1), "trace": trace_event})
+        agent, kind, name, phase = describe_trace_step(trace_event)
+
+        if phase == "start":
+            row = {"atMs": round(at_ms, 1), "agent": agent, "step": kind, "name": name, "durationMs": None}
+            self.rows.append(row)
+            self.open_steps.setdefault((agent, kind), []).append((at_ms, row))
+        elif phase == "end" and self.open_steps.get((agent, kind)):
+            started_ms, row = self.open_steps[(agent, kind)].pop()
+            row["durationMs"] = round(at_ms - started_ms, 1)
+            if name and not row["name"]:
+                row["name"] = name
+        else:
+            self.rows.append({"atMs": round(at_ms, 1), "agent": agent, "step": kind, "name": name, "durationMs": None})
+        return agent, kind, name
+
+    def to_json(self, total_ms):
+        return json.dumps({
+            "totalMs": round(total_ms, 1),
+            "timeToFirstChunkMs": round(self.first_chunk_ms, 1) if self.first_chunk_ms is not None else None,
+            "timeline": self.rows,
+            "events": self.raw_events
+        }, indent=2, default=str)
+
+
+def render_trace_timeline(timeline, total_ms):
+    """Show the per-request latency breakdown"""
+    st.markdown("**⏱️ Latency breakdown**")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total time", f"{total_ms / 1000.0:.2f} s")
+    col2.metric("Time to first chunk",
+                f"{timeline.first_chunk_ms / 1000.0:.2f} s" if timeline.first_chunk_ms is not None else "n/a")
+    col3.metric("Tool / collaborator calls",
+                sum(1 for row in timeline.rows if row["step"] in ("action group", "collaborator", "knowledge base")))
+
+    if not timeline.rows:
+        st.caption("No trace events received (is tracing enabled for this agent alias?)")
+        return
+
+    with st.expander("🧭 Orchestration timeline", expanded=True):
+        st.dataframe(timeline.rows, use_container_width=True)
+
+        timed = [row for row in timeline.rows if row["durationMs"] is not None]
+        if timed:
+            st.caption("Slowest steps")
+            slowest = sorted(timed, key=lambda row: row["durationMs"], reverse=True)[:10]
+            st.bar_chart({
+                "step": [f"{row['agent']} · {row['step']} {row['name']}".strip() for row in slowest],
+                "durationMs": [row["durationMs"] for row in slowest]
+            }, x="step", y="durationMs")
+
+    st.download_button("⬇️ Download trace (JSON)",
+                       data=timeline.to_json(total_ms),
+                       file_name=f"agent-trace-{int(time.time())}.json",
+                       mime="application/json")
+
+
+def process_streaming_response(response, request_started=None, show_trace=False):
     """Process streaming response with proper error handling and fixed text formatting"""
     if not response:
         return
     
     output_text = ""
+    timeline = TraceTimeline(request_started or time.perf_counter())
     
     # Create a container for the response with proper styling
     st.markdown("**🤖 AI Assistant Response:**")
     response_container = st.empty()
     
     try:
-        # Create a progress bar for visual feedback
-        progress_bar = st.progress(0)
-        chunk_count = 0
+        # Live status line: elapsed time and the step the agent is on
+        status_line = st.empty()
         
         for event in response["completion"]:
             if "chunk" in event:
                 chunk_bytes = event["chunk"].get("bytes", b"")
                 if chunk_bytes:
+                    timeline.add_chunk()
                     chunk_text = chunk_bytes.decode("utf-8")
                     output_text += chunk_text
                     
@@ -115,16 +315,14 @@ def process_streaming_response(response):
                     # This prevents markdown interpretation and displays text as-is
                     with response_container.container():
                         st.text(output_text)
-                    
-                    chunk_count += 1
-                    # Update progress (arbitrary - since we don't know total chunks)
-                    progress_bar.progress(min(chunk_count * 5, 100))
-                    
-                    # Small delay to make streaming visible
-                    time.sleep(0.1)
+            elif "trace" in event:
+                agent, kind, name = timeline.add_trace(event["trace"])
+                status_line.caption(f"⏱️ {timeline.elapsed_ms() / 1000.0:.1f}s · {agent} · {kind} {name}".strip())
         
-        # Clear progress bar when done
-        progress_bar.empty()
+        total_ms = timeline.elapsed_ms()
+        status_line.empty()
+        if output_text:
+            st.session_state.agent_latency_ms.append(total_ms)
         
         if not output_text:
             st.warning("⚠️ No response received from the agent")
@@ -134,12 +332,21 @@ def process_streaming_response(response):
             # Optional: Also display in a code block for better readability
             with st.expander("📋 Response in formatted view"):
                 st.code(output_text, language=None)
+        
+        if show_trace:
+            render_trace_timeline(timeline, total_ms)
             
     except Exception as e:
         st.error(f"❌ Error processing response: {str(e)}")
 
 if st.button("Send to AI Assistant"):
-    if not all([aws_access_key, aws_secret_key, aws_region, agent_id, agent_alias_id, user_query]):
+    fast_route = route(user_query) if enable_fast_path else None
+    if enable_fast_path and user_query and fast_route is None:
+        st.caption("🧭 No fast-path intent matched; using the agent")
+
+    if fast_route is not None and answer_fast_path(fast_route):
+        pass
+    elif not all([aws_access_key, aws_secret_key, aws_region, agent_id, agent_alias_id, user_query]):
         st.error("⚠️ Please fill in all fields and enter a query.")
     else:
         try:
@@ -158,19 +365,21 @@ if st.button("Send to AI Assistant"):
                 st.info("🔗 Testing connection to AWS Bedrock...")
                 
             # Invoke agent with retry logic
+            request_started = time.perf_counter()
             with st.spinner('🤖 AI Assistant is processing your query...'):
                 response = invoke_agent_with_retry(
                     client, 
                     agent_id, 
                     agent_alias_id, 
                     user_query,
-                    max_retries
+                    max_retries,
+                    enable_trace
                 )
             
             # Process the streaming response
             if response:
                 st.info("📡 Receiving response...")
-                process_streaming_response(response)
+                process_streaming_response(response, request_started, enable_trace)
             
         except Exception as e:
             st.error(f"❌ Unexpected error: {str(e)}")
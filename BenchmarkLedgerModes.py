@@ -0,0 +1,129 @@
+import os
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pg8000.native
+from LoadTest import build_event, load_handlers, percentile
+from ReconcileBalances import reconcile
+
+# Benchmark: in-place balance updates vs the append-only ledger (Ledger.py, LEDGER_MODE)
+# Hammers one busy account with writes from many threads, once per mode, calling the handlers in-process
+# against a local Postgres with Postgresql_DDLs.txt and Postgresql_DDLs_ForReconciliation.txt applied.
+# Also times GetAccountBalance on that account in append_only mode before and after the checkpoint is
+# compacted by ReconcileBalances.
+#
+#   PG_HOST=localhost PG_DATABASE=bank PG_USER=postgres PG_PASSWORD=postgres \
+#       python BenchmarkLedgerModes.py --threads 16 --duration 30 --operation transfer
+#
+# The writes stay in the ledger. At the end accounts.balance is brought back in line with it by a repair run
+# of ReconcileBalances in in_place mode.
+
+MODES = ("in_place", "append_only")
+
+
+def connect():
+    return pg8000.native.Connection(
+        host=os.environ['PG_HOST'],
+        database=os.environ['PG_DATABASE'],
+        user=os.environ['PG_USER'],
+        password=os.environ['PG_PASSWORD']
+    )
+
+
+def write_event(operation, account_id, other_account_id):
+    if operation == "transfer":
+        return "TransferFunds", build_event("TransferFunds", "/transfer-funds",
+                                            {"fromAccountId": account_id, "toAccountId": other_account_id,
+                                             "amount": 0.01, "description": "Ledger benchmark transfer"})
+    return "InsertTransaction", build_event("InsertTransaction", "/insert-transaction",
+                                            {"accountId": account_id, "amount": 0.01, "transactionType": "Credit",
+                                             "description": "Ledger benchmark", "relatedParty": "Benchmark"})
+
+
+def run_writes(handlers, operation, account_id, other_account_id, threads, duration):
+    results = []
+    results_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            name, event = write_event(operation, account_id, other_account_id)
+            started = time.perf_counter()
+            response = handlers[name](event, None)
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            with results_lock:
+                results.append((elapsed_ms, response["response"]["httpStatusCode"]))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for future in [pool.submit(worker) for _ in range(threads)]:
+            future.result()
+    wall_seconds = time.perf_counter() - started
+
+    latencies = sorted(r[0] for r in results)
+    return {
+        "writes": len(results),
+        "errors": sum(1 for r in results if r[1] != 200),
+        "writesPerSecond": round(len(results) / wall_seconds, 1),
+        "p50Ms": round(percentile(latencies, 50), 2),
+        "p95Ms": round(percentile(latencies, 95), 2),
+        "p99Ms": round(percentile(latencies, 99), 2)
+    }
+
+
+def time_balance_reads(handler, account_id, reads):
+    latencies = []
+    balance = None
+    for _ in range(reads):
+        event = build_event("GetAccountBalance", "/accountBalance", {"accountId": account_id})
+        started = time.perf_counter()
+        response = handler(event, None)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+        balance = response["response"]["responseBody"]["application/json"]["body"]
+    latencies.sort()
+    return {"p50Ms": round(percentile(latencies, 50), 2), "p95Ms": round(percentile(latencies, 95), 2),
+            "lastResponse": balance}
+
+
+def compact(conn):
+    # The first run records the current max transactionid, the second folds everything up to it
+    reconcile(conn)
+    return reconcile(conn)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare write throughput of the in_place and append_only ledger modes")
+    parser.add_argument("--account-id", type=int, default=1, help="the busy account")
+    parser.add_argument("--other-account-id", type=int, default=2, help="transfer destination")
+    parser.add_argument("--operation", choices=["insert", "transfer"], default="insert")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of writes per mode")
+    parser.add_argument("--reads", type=int, default=200, help="GetAccountBalance calls per read measurement")
+    args = parser.parse_args()
+
+    handlers = load_handlers(["GetAccountBalance", "InsertTransaction", "TransferFunds"], 0)
+
+    conn = connect()
+
+    # Every account needs a checkpoint before append_only balances can be derived
+    os.environ["LEDGER_MODE"] = "in_place"
+    compact(conn)
+
+    for mode in MODES:
+        os.environ["LEDGER_MODE"] = mode
+        print(f"\n{mode}: {args.threads} threads, {args.duration}s of {args.operation} writes on account {args.account_id}")
+        print(f"  writes: {run_writes(handlers, args.operation, args.account_id, args.other_account_id, args.threads, args.duration)}")
+
+        if mode == "append_only":
+            print(f"  balance reads, uncompacted tail: "
+                  f"{time_balance_reads(handlers['GetAccountBalance'], args.account_id, args.reads)}")
+            print(f"  compaction: {compact(conn)}")
+            print(f"  balance reads, after compaction: "
+                  f"{time_balance_reads(handlers['GetAccountBalance'], args.account_id, args.reads)}")
+
+    # accounts.balance did not move during the append_only run; fold the ledger back into it
+    os.environ["LEDGER_MODE"] = "in_place"
+    report = reconcile(conn, repair=True)
+    print(f"\nRestored in_place balances for {len(report['repairedAccounts'])} account(s)")
+    conn.close()
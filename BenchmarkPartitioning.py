@@ -0,0 +1,175 @@
+import os
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+import pg8000.native
+
+# Benchmark: unpartitioned vs monthly-partitioned transactions table
+# Builds the same synthetic ledger twice (schemas bench_flat and bench_part) with server-side generate_series,
+# then compares recent-history query latency (the GetRecentTransactions query) and the cost of vacuuming after
+# churn in the current month.
+#
+#   PG_HOST=localhost PG_DATABASE=bank PG_USER=postgres PG_PASSWORD=postgres \
+#       python BenchmarkPartitioning.py --rows 100000000 --accounts 3000000 --months 36
+#
+# Needs roughly 2 x 12 GB of disk at 100M rows. Use --keep to reuse the tables in a later run with --skip-load.
+
+CHUNK_ROWS = 5000000
+
+TABLE_COLUMNS = """
+    transactionid BIGINT NOT NULL,
+    accountid INT NOT NULL,
+    amount NUMERIC(18,2) NOT NULL,
+    transactiontype VARCHAR(50) NOT NULL,
+    description VARCHAR(255),
+    relatedparty VARCHAR(100),
+    createdat TIMESTAMP NOT NULL
+"""
+
+GENERATE_ROWS = """
+INSERT INTO {schema}.transactions
+    (transactionid, accountid, amount, transactiontype, description, relatedparty, createdat)
+SELECT g,
+       1 + (hashint8(g) & 2147483647) % :accounts,
+       CASE WHEN g % 10 = 0 THEN round((random() * 5000)::numeric, 2) ELSE -round((random() * 200)::numeric, 2) END,
+       CASE WHEN g % 10 = 0 THEN 'Credit' ELSE 'Debit' END,
+       'Benchmark transaction',
+       'Merchant ' || (g % 500),
+       CAST(:start_at AS timestamp) + (g - 1) * CAST(:step AS interval)
+FROM generate_series(CAST(:lo AS bigint), CAST(:hi AS bigint)) g
+"""
+
+RECENT_QUERY = """
+SELECT transactionid, amount, transactiontype, description, relatedparty, createdat
+FROM {schema}.transactions
+WHERE accountid = :account_id
+AND createdat >= :since
+ORDER BY createdat DESC
+LIMIT :limit_val
+"""
+
+
+def connect():
+    return pg8000.native.Connection(
+        host=os.environ['PG_HOST'],
+        database=os.environ['PG_DATABASE'],
+        user=os.environ['PG_USER'],
+        password=os.environ['PG_PASSWORD']
+    )
+
+
+def month_starts(start_at, end_at):
+    month = start_at.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month <= end_at:
+        following = (month + timedelta(days=32)).replace(day=1)
+        yield month, following
+        month = following
+
+
+def create_tables(conn, start_at, end_at):
+    conn.run("DROP SCHEMA IF EXISTS bench_flat CASCADE")
+    conn.run("DROP SCHEMA IF EXISTS bench_part CASCADE")
+    conn.run("CREATE SCHEMA bench_flat")
+    conn.run("CREATE SCHEMA bench_part")
+
+    conn.run(f"CREATE TABLE bench_flat.transactions ({TABLE_COLUMNS}, PRIMARY KEY (transactionid))")
+    conn.run(f"CREATE TABLE bench_part.transactions ({TABLE_COLUMNS}, PRIMARY KEY (transactionid, createdat)) "
+             "PARTITION BY RANGE (createdat)")
+    for month, following in month_starts(start_at, end_at):
+        conn.run(f"CREATE TABLE bench_part.transactions_y{month:%Y}m{month:%m} PARTITION OF bench_part.transactions "
+                 f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')")
+
+
+def load(conn, rows, accounts, start_at, end_at):
+    step_seconds = (end_at - start_at).total_seconds() / rows
+    for schema in ("bench_flat", "bench_part"):
+        started = time.perf_counter()
+        for lo in range(1, rows + 1, CHUNK_ROWS):
+            hi = min(rows, lo + CHUNK_ROWS - 1)
+            conn.run(GENERATE_ROWS.format(schema=schema), accounts=accounts, start_at=start_at,
+                     step=f"{step_seconds} seconds", lo=lo, hi=hi)
+            print(f"  {schema}: {hi:,}/{rows:,} rows")
+        conn.run(f"CREATE INDEX ON {schema}.transactions (accountid, createdat)")
+        conn.run(f"VACUUM ANALYZE {schema}.transactions")
+        print(f"{schema}: loaded in {time.perf_counter() - started:.1f}s")
+
+
+def percentile(sorted_values, pct):
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def time_recent_history(conn, schema, accounts, end_at, lookback_days, queries, seed):
+    rng = random.Random(seed)
+    since = end_at - timedelta(days=lookback_days)
+    latencies = []
+    for _ in range(queries):
+        started = time.perf_counter()
+        conn.run(RECENT_QUERY.format(schema=schema), account_id=rng.randint(1, accounts), since=since, limit_val=100)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    latencies.sort()
+    return {"p50Ms": round(percentile(latencies, 50), 3),
+            "p95Ms": round(percentile(latencies, 95), 3),
+            "p99Ms": round(percentile(latencies, 99), 3)}
+
+
+def time_vacuum(conn, end_at, churn_fraction):
+    # Same churn in both tables: update a slice of the newest month, then vacuum
+    month_start = end_at.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    results = {}
+    for schema in ("bench_flat", "bench_part"):
+        conn.run(f"UPDATE {schema}.transactions SET description = 'Benchmark churn' "
+                 "WHERE createdat >= :month_start AND random() < :fraction",
+                 month_start=month_start, fraction=churn_fraction)
+        started = time.perf_counter()
+        conn.run(f"VACUUM {schema}.transactions")
+        results[f"{schema}.transactions"] = round(time.perf_counter() - started, 3)
+
+    # With partitions only the hot month needs vacuuming
+    conn.run("UPDATE bench_part.transactions SET description = 'Benchmark churn 2' "
+             "WHERE createdat >= :month_start AND random() < :fraction",
+             month_start=month_start, fraction=churn_fraction)
+    partition = f"bench_part.transactions_y{month_start:%Y}m{month_start:%m}"
+    started = time.perf_counter()
+    conn.run(f"VACUUM {partition}")
+    results[partition] = round(time.perf_counter() - started, 3)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare partitioned and unpartitioned transactions tables")
+    parser.add_argument("--rows", type=int, default=10000000)
+    parser.add_argument("--accounts", type=int, default=300000)
+    parser.add_argument("--months", type=int, default=36, help="months of history the rows are spread over")
+    parser.add_argument("--lookback-days", type=int, default=90)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--churn", type=float, default=0.05, help="fraction of the newest month updated before VACUUM")
+    parser.add_argument("--skip-load", action="store_true", help="reuse tables from a previous --keep run")
+    parser.add_argument("--keep", action="store_true", help="keep the bench_flat/bench_part schemas afterwards")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    end_at = datetime.now().replace(microsecond=0)
+    start_at = end_at - timedelta(days=30 * args.months)
+
+    conn = connect()
+    # VACUUM cannot run inside a transaction block; pg8000.native runs each statement in autocommit mode
+    if not args.skip_load:
+        create_tables(conn, start_at, end_at)
+        load(conn, args.rows, args.accounts, start_at, end_at)
+
+    print(f"\nRecent history ({args.lookback_days} day window, LIMIT 100), {args.queries} queries each:")
+    for schema in ("bench_flat", "bench_part"):
+        # Warm-up pass so both tables are measured with a warm cache
+        time_recent_history(conn, schema, args.accounts, end_at, args.lookback_days, min(200, args.queries), args.seed)
+        print(f"  {schema}: {time_recent_history(conn, schema, args.accounts, end_at, args.lookback_days, args.queries, args.seed)}")
+
+    print(f"\nVACUUM after updating {args.churn:.0%} of the newest month (seconds):")
+    for table, seconds in time_vacuum(conn, end_at, args.churn).items():
+        print(f"  {table}: {seconds}")
+
+    if not args.keep:
+        conn.run("DROP SCHEMA bench_flat CASCADE")
+        conn.run("DROP SCHEMA bench_part CASCADE")
+    conn.close()
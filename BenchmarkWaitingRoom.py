@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+import pg8000.native
+import LoadTest
+from LoadTest import build_event, load_handlers, percentile
+import AdmissionControl
+
+# Benchmark: ticket on-sale with and without the waiting room (AdmissionControl.py)
+# Buyer threads, --oversubscription times ADMISSION_MAX_CONCURRENT of them, each buy one seat after another
+# through TicketPurchase, retrying with the returned sessionAttributes while they are queued, as an agent
+# would. Runs once with ADMISSION_MODE=off and once with it on, calling the handler in-process against a local
+# Postgres with Postgresql_DDLs_ForTicketMaster.txt and Postgresql_DDLs_ForSeatMaps.txt applied, and reports
+# purchase throughput per second (and how much it varies), latency, errors and the peak number of open
+# database connections.
+#
+#   PG_HOST=localhost PG_DATABASE=bank PG_USER=postgres PG_PASSWORD=postgres \
+#       python BenchmarkWaitingRoom.py --max-concurrent 8 --oversubscription 10 --rate 200 --duration 30
+#
+# The purchases go to a dedicated section (--section), which is emptied and refilled before each run.
+
+MODES = ("off", "on")
+
+
+class TrackingConnection(LoadTest.CountingConnection):
+    # Counts database connections open at the same time across all threads
+    lock = threading.Lock()
+    open_now = 0
+    peak = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        with TrackingConnection.lock:
+            TrackingConnection.open_now += 1
+            TrackingConnection.peak = max(TrackingConnection.peak, TrackingConnection.open_now)
+
+    def close(self):
+        with TrackingConnection.lock:
+            TrackingConnection.open_now -= 1
+        super().close()
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.open_now = 0
+            cls.peak = 0
+
+
+def connect():
+    return pg8000.native.Connection(
+        host=os.environ['PG_HOST'],
+        database=os.environ['PG_DATABASE'],
+        user=os.environ['PG_USER'],
+        password=os.environ['PG_PASSWORD']
+    )
+
+
+def reset_section(section_number, seats):
+    conn = connect()
+    try:
+        conn.run("DELETE FROM ticket_transactions WHERE section_number = :section_number",
+                 section_number=section_number)
+        conn.run("""
+            INSERT INTO ticket_availability (section_number, total_available_seats, how_far_is_it_from_ground,
+                                             ticket_price, seat_capacity, seat_map)
+            VALUES (:section_number, :seats, '0-50 feet from ground', 100, :seats,
+                    CAST(repeat('0', CAST(:seats AS int)) AS varbit))
+            ON CONFLICT (section_number) DO UPDATE
+            SET total_available_seats = EXCLUDED.total_available_seats,
+                seat_capacity = EXCLUDED.seat_capacity,
+                seat_map = EXCLUDED.seat_map
+        """, section_number=section_number, seats=seats)
+    finally:
+        conn.close()
+
+
+def purchase_event(section_number, buyer):
+    return build_event("TicketPurchase", "/purchase-ticket",
+                       {"user_desired_section_number": section_number,
+                        "user_desired_number_of_seats": 1,
+                        "person_name": f"Buyer {buyer}",
+                        "person_phone": f"{buyer % 10000:04d}-MRS",
+                        "person_email": f"buyer{buyer}@bankofmars.mrs"})
+
+
+def run_onsale(handler, section_number, buyers, duration, max_retry_sleep):
+    calls = []        # (elapsed ms, status)
+    purchases = []    # (completed at, seconds from the buyer's first call)
+    results_lock = threading.Lock()
+    next_buyer = [0]
+    started = time.perf_counter()
+    deadline = started + duration
+
+    def buyer_thread():
+        while time.perf_counter() < deadline:
+            with results_lock:
+                next_buyer[0] += 1
+                buyer = next_buyer[0]
+            attributes = {}
+            first_call = time.perf_counter()
+            while time.perf_counter() < deadline:
+                event = purchase_event(section_number, buyer)
+                event["sessionAttributes"] = attributes
+                call_started = time.perf_counter()
+                response = handler(event, None)
+                now = time.perf_counter()
+                status = response["response"]["httpStatusCode"]
+                with results_lock:
+                    calls.append(((now - call_started) * 1000.0, status))
+                if status == 200:
+                    with results_lock:
+                        purchases.append((now - started, now - first_call))
+                    break
+                if status != 429:
+                    break
+                # Queued: come back around the ETA, keeping the queue ticket
+                attributes = response.get("sessionAttributes") or attributes
+                eta = float(attributes.get("queueEtaSeconds", 0)) or 0.05
+                time.sleep(min(eta, max_retry_sleep))
+
+    with ThreadPoolExecutor(max_workers=buyers) as pool:
+        for future in [pool.submit(buyer_thread) for _ in range(buyers)]:
+            future.result()
+    wall_seconds = time.perf_counter() - started
+
+    per_second = [0] * max(1, int(wall_seconds))
+    for completed_at, _ in purchases:
+        per_second[min(int(completed_at), len(per_second) - 1)] += 1
+    purchase_latencies = sorted(ms for ms, status in calls if status == 200)
+    waits = sorted(wait for _, wait in purchases)
+    return {
+        "buyers": buyers,
+        "wallSeconds": round(wall_seconds, 2),
+        "calls": len(calls),
+        "purchases": len(purchases),
+        "purchasesPerSecond": round(len(purchases) / wall_seconds, 1),
+        "perSecondMin": min(per_second),
+        "perSecondMax": max(per_second),
+        "perSecondStdev": round(statistics.pstdev(per_second), 1),
+        "queuedResponses": sum(1 for _, status in calls if status == 429),
+        "errors": sum(1 for _, status in calls if status not in (200, 429)),
+        "purchaseP50Ms": round(percentile(purchase_latencies, 50), 2),
+        "purchaseP95Ms": round(percentile(purchase_latencies, 95), 2),
+        "buyerWaitP50Seconds": round(percentile(waits, 50), 2),
+        "buyerWaitP95Seconds": round(percentile(waits, 95), 2),
+        "peakDbConnections": TrackingConnection.peak
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare a ticket on-sale with and without the waiting room")
+    parser.add_argument("--max-concurrent", type=int, default=8, help="ADMISSION_MAX_CONCURRENT")
+    parser.add_argument("--oversubscription", type=int, default=10, help="buyer threads per purchase slot")
+    parser.add_argument("--rate", type=float, default=200.0, help="ADMISSION_RATE (admissions per second)")
+    parser.add_argument("--burst", type=int, default=20, help="ADMISSION_BURST")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--section", type=int, default=900, help="section used for the on-sale")
+    parser.add_argument("--seats", type=int, default=200000, help="seats in that section")
+    parser.add_argument("--max-retry-sleep", type=float, default=1.0, help="longest a queued buyer waits to retry")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    handlers = load_handlers(["TicketPurchase"], 0)
+    pg8000.native.Connection = TrackingConnection
+    buyers = args.max_concurrent * args.oversubscription
+
+    report = {}
+    for mode in MODES:
+        reset_section(args.section, args.seats)
+        TrackingConnection.reset()
+        AdmissionControl.configure(mode=mode, rate=args.rate, burst=args.burst, maxConcurrent=args.max_concurrent,
+                                   table=None)
+        report[mode] = run_onsale(handlers["TicketPurchase"], args.section, buyers, args.duration,
+                                  args.max_retry_sleep)
+        print(f"ADMISSION_MODE={mode}: {json.dumps(report[mode])}")
+
+    print(f"\n{'':<24}{'waiting room off':>18}{'waiting room on':>18}")
+    for key in ("purchases", "purchasesPerSecond", "perSecondMin", "perSecondMax", "perSecondStdev",
+                "queuedResponses", "errors", "purchaseP50Ms", "purchaseP95Ms", "buyerWaitP50Seconds",
+                "buyerWaitP95Seconds", "peakDbConnections"):
+        print(f"{key:<24}{report['off'][key]:>18}{report['on'][key]:>18}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
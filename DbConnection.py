@@ -0,0 +1,209 @@
+import os
+import time
+import threading
+import pg8000.native
+import pg8000.exceptions
+from Instrumentation import instrument_connection, mark
+
+# Shared Postgres connection routing for the Lambda handlers
+# Deploy this file next to each handler (same zip or a Lambda layer), together with Instrumentation.py.
+#
+# Writes always go to PG_HOST. Read-only handlers use connect_read(), which goes to the replica at
+# PG_READ_HOST when it is set, with two safety nets:
+#   - read-your-writes: write handlers return the primary's WAL position after COMMIT as the Bedrock session
+#     attribute lastWriteLsn. A later read in the same agent session only uses the replica once it has
+#     replayed past that LSN (skipped when the write is older than PG_READ_MAX_LAG_SECONDS).
+#   - fallback: if the replica cannot be reached, the read goes to the primary and the replica is not retried
+#     for PG_READ_RETRY_SECONDS.
+#
+# To try it locally, run a primary and a standby created with "pg_basebackup -R" (streaming replication),
+# point PG_HOST / PG_READ_HOST at them and replay LoadTest.py.
+#
+# In a long-lived process (LocalServer.py) set DB_POOL_SIZE to keep up to that many connections per host open
+# across requests: conn.close() in the handlers (always in a finally block) then hands the connection back to the
+# pool (rolling back a transaction left open) instead of closing it; a connection that is garbage collected
+# without close() is handed back too. Callers wait up to DB_POOL_WAIT_SECONDS for a free connection; idle
+# connections are closed after DB_POOL_IDLE_SECONDS. The default of 0 keeps one connection per call, which is
+# what a Lambda container wants.
+
+READ_MAX_LAG_SECONDS = float(os.environ.get('PG_READ_MAX_LAG_SECONDS', '30'))
+READ_RETRY_SECONDS = float(os.environ.get('PG_READ_RETRY_SECONDS', '30'))
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '0'))
+POOL_WAIT_SECONDS = float(os.environ.get('DB_POOL_WAIT_SECONDS', '10'))
+POOL_IDLE_SECONDS = float(os.environ.get('DB_POOL_IDLE_SECONDS', '300'))
+
+_replica_down_until = 0.0
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _connect(host):
+    return pg8000.native.Connection(
+        host=host,
+        database=os.environ['PG_DATABASE'],
+        user=os.environ['PG_USER'],
+        password=os.environ['PG_PASSWORD']
+    )
+
+
+class PooledConnection:
+    # Handed out by ConnectionPool; close() returns the underlying connection to the pool
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._in_transaction = False
+        self._broken = False
+        self._returned = False
+
+    def run(self, sql, **params):
+        try:
+            result = self._conn.run(sql, **params)
+        except pg8000.exceptions.InterfaceError:
+            # Network or protocol failure: the connection is not reused
+            self._broken = True
+            raise
+        statement = sql.lstrip()[:8].upper()
+        if statement.startswith("BEGIN"):
+            self._in_transaction = True
+        elif statement.startswith(("COMMIT", "ROLLBACK")):
+            self._in_transaction = False
+        return result
+
+    def close(self):
+        if not self._returned:
+            self._returned = True
+            self._pool.release(self._conn, self._in_transaction, self._broken)
+
+    def __del__(self):
+        # Safety net for a connection dropped without close(): its pool slot is not lost
+        if not self.__dict__.get("_returned", True):
+            print("Pooled connection was never closed, returning it to the pool")
+            self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class ConnectionPool:
+    def __init__(self, host, size):
+        self.host = host
+        self.size = size
+        self.idle = []   # (connection, time it was returned), most recent last
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.slots.acquire(timeout=POOL_WAIT_SECONDS):
+            raise Exception(f"No database connection to {self.host} free after {POOL_WAIT_SECONDS:.0f}s "
+                            f"(DB_POOL_SIZE={self.size})")
+        with self.lock:
+            now = time.time()
+            stale = [c for c, returned_at in self.idle if now - returned_at > POOL_IDLE_SECONDS]
+            self.idle = [(c, returned_at) for c, returned_at in self.idle if now - returned_at <= POOL_IDLE_SECONDS]
+            conn = self.idle.pop()[0] if self.idle else None
+        for candidate in stale:
+            _close_quietly(candidate)
+
+        if conn is None:
+            try:
+                conn = _connect(self.host)
+            except Exception:
+                self.slots.release()
+                raise
+        return PooledConnection(self, conn)
+
+    def release(self, conn, in_transaction, broken):
+        try:
+            if not broken and in_transaction:
+                conn.run("ROLLBACK")
+            if broken:
+                _close_quietly(conn)
+            else:
+                with self.lock:
+                    self.idle.append((conn, time.time()))
+        except Exception:
+            _close_quietly(conn)
+        finally:
+            self.slots.release()
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _open(host):
+    if POOL_SIZE <= 0:
+        return _connect(host)
+    with _pools_lock:
+        pool = _pools.get(host)
+        if pool is None:
+            pool = _pools[host] = ConnectionPool(host, POOL_SIZE)
+    return pool.acquire()
+
+
+def pool_stats():
+    # {host: {"size", "idle"}} for health checks
+    with _pools_lock:
+        return {host: {"size": pool.size, "idle": len(pool.idle)} for host, pool in _pools.items()}
+
+
+def connect_primary():
+    conn = instrument_connection(_open(os.environ['PG_HOST']))
+    mark("connect")
+    return conn
+
+
+def _replica_caught_up(conn, event):
+    attributes = event.get('sessionAttributes') or {}
+    last_write_lsn = attributes.get('lastWriteLsn')
+    if not last_write_lsn:
+        return True
+
+    last_write_at = float(attributes.get('lastWriteAt', 0))
+    if time.time() - last_write_at > READ_MAX_LAG_SECONDS:
+        return True
+
+    rows = conn.run("SELECT pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn)", lsn=last_write_lsn)
+    return bool(rows and rows[0][0])
+
+
+def connect_read(event):
+    global _replica_down_until
+
+    read_host = os.environ.get('PG_READ_HOST')
+    if not read_host or time.time() < _replica_down_until:
+        return connect_primary()
+
+    try:
+        conn = instrument_connection(_open(read_host))
+    except Exception as e:
+        print(f"Read replica {read_host} unavailable, using primary: {str(e)}")
+        _replica_down_until = time.time() + READ_RETRY_SECONDS
+        return connect_primary()
+    mark("connect")
+
+    try:
+        caught_up = _replica_caught_up(conn, event)
+    except Exception:
+        conn.close()
+        raise
+    if caught_up:
+        return conn
+
+    print("Read replica has not replayed this session's last write yet, using primary")
+    conn.close()
+    return connect_primary()
+
+
+def session_attributes(event, conn=None):
+    # Session attributes to return from a handler. Pass the primary connection after a committed write to record
+    # its WAL position for read-your-writes routing.
+    attributes = dict(event.get('sessionAttributes') or {})
+    if conn is not None and os.environ.get('PG_READ_HOST'):
+        attributes['lastWriteLsn'] = conn.run("SELECT CAST(pg_current_wal_lsn() AS text)")[0][0]
+        attributes['lastWriteAt'] = str(time.time())
+    return attributes
@@ -0,0 +1,250 @@
+import os
+import json
+import uuid
+import tempfile
+from datetime import datetime, date
+import boto3
+from Instrumentation import instrument, log_event, mark
+from DbConnection import connect_read
+from RequestValidator import RequestValidator, RequestValidationError
+
+try:
+    import pyarrow
+    import pyarrow.csv as pyarrow_csv
+    import pyarrow.parquet as pyarrow_parquet
+except ImportError:
+    pyarrow = None
+
+# ExportStatement function
+# Exports an account's full statement for a date range as a file and returns a link instead of the rows.
+# Rows are streamed out of Postgres with COPY ... TO STDOUT, so memory use does not grow with the statement:
+#   - csv: the COPY stream goes straight to the destination (S3 multipart parts of EXPORT_PART_SIZE_MB, or a file)
+#   - parquet: the COPY stream is spooled to a CSV file in /tmp, then converted block by block with pyarrow
+#     (needs a pyarrow layer and enough Lambda ephemeral storage for the statement)
+#
+# Environment:
+#   EXPORT_LOCATION             s3://bucket/prefix or a local directory (default /tmp/exports). Inside Lambda it
+#                               must be s3://: /tmp belongs to one container, so a file:// link there is useless
+#   EXPORT_LINK_EXPIRY_SECONDS  lifetime of the presigned S3 link (default 3600)
+#   EXPORT_PART_SIZE_MB         S3 multipart part size, at least 5 (default 8)
+
+EXPORT_LOCATION = os.environ.get('EXPORT_LOCATION', '/tmp/exports')
+IN_LAMBDA = 'AWS_LAMBDA_FUNCTION_NAME' in os.environ
+LINK_EXPIRY_SECONDS = int(os.environ.get('EXPORT_LINK_EXPIRY_SECONDS', '3600'))
+PART_SIZE = int(os.environ.get('EXPORT_PART_SIZE_MB', '8')) * 1024 * 1024
+CSV_BLOCK_SIZE = 16 * 1024 * 1024
+
+CONTENT_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+# Compiled once per container from ActionGroup_OpenAPIschema_JSON_ExportStatement.txt
+VALIDATOR = RequestValidator("ExportStatement")
+
+# COPY cannot take bind parameters, so the filters are formatted in from values already parsed as int/datetime
+EXPORT_QUERY = """
+COPY (
+    SELECT transactionid, createdat, transactiontype, amount, description, relatedparty
+    FROM public.transactions
+    WHERE accountid = {account_id}
+    AND createdat >= TIMESTAMP '{start}' AND createdat < TIMESTAMP '{end}'
+    ORDER BY createdat, transactionid
+) TO STDOUT WITH (FORMAT csv, HEADER true)
+"""
+
+
+def parquet_column_types():
+    return {
+        "transactionid": pyarrow.int64(),
+        "createdat": pyarrow.timestamp("us"),
+        "transactiontype": pyarrow.string(),
+        "amount": pyarrow.decimal128(18, 2),
+        "description": pyarrow.string(),
+        "relatedparty": pyarrow.string()
+    }
+
+
+class S3MultipartWriter:
+    # File-like sink for the COPY stream: holds at most one part in memory and uploads it as a multipart part
+
+    def __init__(self, s3_client, bucket, key, content_type):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key,
+                                                           ContentType=content_type)['UploadId']
+        self.buffer = bytearray()
+        self.parts = []
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= PART_SIZE:
+            self.upload_part()
+        return len(data)
+
+    def upload_part(self):
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                              PartNumber=part_number, Body=bytes(self.buffer))
+        self.parts.append({"ETag": response['ETag'], "PartNumber": part_number})
+        self.buffer = bytearray()
+
+    def close(self):
+        if self.buffer or not self.parts:
+            self.upload_part()
+        self.s3_client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                 MultipartUpload={"Parts": self.parts})
+
+    def abort(self):
+        self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+def export_csv(conn, copy_query, s3_client, bucket, key, local_path):
+    if s3_client is None:
+        with open(local_path, 'wb') as f:
+            conn.run(copy_query, stream=f)
+        return conn.row_count
+
+    writer = S3MultipartWriter(s3_client, bucket, key, CONTENT_TYPES["csv"])
+    try:
+        conn.run(copy_query, stream=writer)
+        row_count = conn.row_count
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    return row_count
+
+
+def export_parquet(conn, copy_query, s3_client, bucket, key, local_path):
+    with tempfile.TemporaryDirectory() as spool_dir:
+        csv_path = os.path.join(spool_dir, "statement.csv")
+        with open(csv_path, 'wb') as f:
+            conn.run(copy_query, stream=f)
+        row_count = conn.row_count
+
+        # Convert one CSV block (one Parquet row group) at a time
+        parquet_path = local_path if s3_client is None else os.path.join(spool_dir, "statement.parquet")
+        reader = pyarrow_csv.open_csv(
+            csv_path,
+            read_options=pyarrow_csv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+            convert_options=pyarrow_csv.ConvertOptions(column_types=parquet_column_types())
+        )
+        with pyarrow_parquet.ParquetWriter(parquet_path, reader.schema, compression="zstd") as writer:
+            for batch in reader:
+                writer.write_table(pyarrow.Table.from_batches([batch]))
+
+        if s3_client is not None:
+            # upload_file streams the file from disk in multipart chunks
+            s3_client.upload_file(parquet_path, bucket, key,
+                                  ExtraArgs={"ContentType": CONTENT_TYPES["parquet"]})
+    return row_count
+
+
+@instrument("ExportStatement")
+def lambda_handler(event, context):
+    try:
+        log_event(event)
+
+        # Validate the parameters against the OpenAPI schema before any I/O (400 on bad input)
+        params = VALIDATOR.validate(event)
+        account_id = params['accountId']
+        start_date = params.get('startDate')
+        end_date = params.get('endDate')
+        export_format = params.get('format', "csv")  # default
+
+        if export_format == "parquet" and pyarrow is None:
+            raise RequestValidationError("Parquet export needs pyarrow; use format csv")
+
+        # Default range is everything up to now
+        start = datetime.combine(start_date or date(1970, 1, 1), datetime.min.time())
+        end = datetime.combine(end_date, datetime.min.time()) if end_date else datetime.now()
+
+        file_name = f"account-{account_id}-{start:%Y%m%d}-{end:%Y%m%d}-{uuid.uuid4().hex[:8]}.{export_format}"
+        if EXPORT_LOCATION.startswith("s3://"):
+            bucket, _, prefix = EXPORT_LOCATION[len("s3://"):].partition("/")
+            key = f"{prefix.rstrip('/')}/{file_name}" if prefix else file_name
+            s3_client = boto3.client('s3', region_name=os.environ.get('MY_AWS_REGION', 'us-east-1'))
+            local_path = None
+            location = f"s3://{bucket}/{key}"
+        elif IN_LAMBDA:
+            raise RuntimeError(f"EXPORT_LOCATION is {EXPORT_LOCATION}, but exports from Lambda need an "
+                               f"s3://bucket/prefix location; set EXPORT_LOCATION on the function")
+        else:
+            bucket = key = s3_client = None
+            os.makedirs(EXPORT_LOCATION, exist_ok=True)
+            local_path = os.path.abspath(os.path.join(EXPORT_LOCATION, file_name))
+            location = local_path
+
+        print(f"Exporting accountId: {account_id} from {start} to {end} as {export_format} to {location}")
+
+        mark("parse")
+
+        # Connect to PostgreSQL
+        conn = connect_read(event)
+
+        copy_query = EXPORT_QUERY.format(account_id=account_id, start=start.isoformat(sep=' '),
+                                         end=end.isoformat(sep=' '))
+        try:
+            if export_format == "parquet":
+                row_count = export_parquet(conn, copy_query, s3_client, bucket, key, local_path)
+            else:
+                row_count = export_csv(conn, copy_query, s3_client, bucket, key, local_path)
+        finally:
+            conn.close()
+
+        if s3_client is not None:
+            link = s3_client.generate_presigned_url('get_object', Params={"Bucket": bucket, "Key": key},
+                                                    ExpiresIn=LINK_EXPIRY_SECONDS)
+        else:
+            link = f"file://{local_path}"
+
+        response_data = {
+            "accountId": account_id,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "format": export_format,
+            "rowCount": row_count,
+            "location": location,
+            "link": link
+        }
+        if s3_client is not None:
+            response_data["linkExpiresInSeconds"] = LINK_EXPIRY_SECONDS
+        response_text = json.dumps(response_data)
+
+        mark("format")
+
+        # Return in Bedrock's expected format
+        return {
+            "messageVersion": "1.0",
+            "response": {
+                "actionGroup": event["actionGroup"],
+                "apiPath": event["apiPath"],
+                "httpMethod": event["httpMethod"],
+                "httpStatusCode": 200,
+                "responseBody": {
+                    "application/json": {
+                        "body": response_text
+                    }
+                }
+            }
+        }
+
+    except RequestValidationError as e:
+        print(f"Invalid request: {str(e)}")
+        return VALIDATOR.error_response(event, e)
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return {
+            "messageVersion": "1.0",
+            "response": {
+                "actionGroup": event.get("actionGroup", "ExportStatement"),
+                "apiPath": event.get("apiPath", "/export-statement"),
+                "httpMethod": event.get("httpMethod", "POST"),
+                "httpStatusCode": 500,
+                "responseBody": {
+                    "application/json": {
+                        "body": f"Error exporting statement: {str(e)}"
+                    }
+                }
+            }
+        }
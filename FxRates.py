@@ -0,0 +1,93 @@
+import os
+import time
+import threading
+from decimal import Decimal, ROUND_HALF_EVEN
+
+# Cached FX rates shared by TransferFunds and ListAccounts
+# Deploy this file next to each handler (same zip or a Lambda layer). Tables are created by
+# Postgresql_DDLs_ForFxRates.txt.
+#
+# public.fx_rates holds the USD value of one unit of each currency; any change to it bumps the single
+# public.fx_rates_version row (statement trigger). The rates are kept in memory per container: at most once per
+# FX_VERSION_CHECK_SECONDS the version is read, and the rates are reloaded only when it has moved. Conversions
+# therefore cost no round trip. Writers that must not use stale rates guard their statement with the version
+# they converted with (see TransferFunds.py) and call refresh(conn, force=True) when the guard fails.
+#
+# Account currencies never change, so they are cached per container too.
+
+VERSION_CHECK_SECONDS = float(os.environ.get('FX_VERSION_CHECK_SECONDS', '30'))
+CENT = Decimal("0.01")
+MAX_CACHED_ACCOUNTS = 100000
+
+_lock = threading.Lock()
+_rates = {}
+_version = None
+_checked_at = 0.0
+_account_currencies = {}
+
+
+def refresh(conn, force=False):
+    # Returns (rates, version)
+    global _rates, _version, _checked_at
+
+    now = time.time()
+    if not force and _version is not None and now - _checked_at < VERSION_CHECK_SECONDS:
+        return _rates, _version
+
+    version = conn.run("SELECT version FROM public.fx_rates_version")[0][0]
+    if version != _version:
+        # Version and rates from the same statement, so they always belong together
+        rows = conn.run("""
+            SELECT v.version, r.currency, r.usd_rate
+            FROM public.fx_rates_version v
+            CROSS JOIN public.fx_rates r
+        """)
+        with _lock:
+            _rates = {row[1]: row[2] for row in rows}
+            _version = rows[0][0] if rows else version
+    _checked_at = now
+    return _rates, _version
+
+
+def rate(rates, from_currency, to_currency):
+    if from_currency == to_currency:
+        return Decimal(1)
+    for currency in (from_currency, to_currency):
+        if currency not in rates:
+            raise Exception(f"No FX rate for currency {currency}")
+    return rates[from_currency] / rates[to_currency]
+
+
+def convert(amount, from_currency, to_currency, rates):
+    # Money is converted in Decimal and rounded to cents (banker's rounding)
+    amount = amount if isinstance(amount, Decimal) else Decimal(str(amount))
+    return (amount * rate(rates, from_currency, to_currency)).quantize(CENT, rounding=ROUND_HALF_EVEN)
+
+
+def account_currencies(conn, account_ids):
+    # {account id: currency} for the accounts that exist; one query for the ones not cached yet
+    found = {account_id: _account_currencies[account_id] for account_id in account_ids
+             if account_id in _account_currencies}
+    missing = [account_id for account_id in account_ids if account_id not in found]
+    if missing:
+        rows = conn.run("SELECT accountid, currency FROM public.accounts WHERE accountid = ANY(:account_ids)",
+                        account_ids=missing)
+        with _lock:
+            if len(_account_currencies) + len(rows) > MAX_CACHED_ACCOUNTS:
+                _account_currencies.clear()
+            for account_id, currency in rows:
+                _account_currencies[account_id] = currency
+                found[account_id] = currency
+    return found
+
+
+def consolidated_total(balances, target_currency, rates):
+    # balances: [(amount, currency)]. Returns (total in target_currency, currencies without a rate)
+    total = Decimal(0)
+    missing = set()
+    for amount, currency in balances:
+        if currency != target_currency and (currency not in rates or target_currency not in rates):
+            missing.add(currency)
+            continue
+        total += convert(amount, currency, target_currency, rates)
+    return total, sorted(missing)
@@ -0,0 +1,351 @@
+import io
+import os
+import csv
+import math
+import time
+import bisect
+import random
+import argparse
+import itertools
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+import pg8000.native
+
+# Benchmark data generator
+# Fills users, accounts, transactions, ticket_availability and ticket_transactions with configurable volumes
+# and realistic skew, loading every table with COPY ... FROM STDIN from parallel worker processes. Rows are
+# generated lazily while COPY reads them, so each worker holds a few hundred KB regardless of volume.
+#
+#   PG_HOST=localhost PG_DATABASE=bank PG_USER=postgres PG_PASSWORD=postgres \
+#       python GenerateBenchmarkData.py --truncate --users 1000000 --accounts 3000000 \
+#           --transactions 500000000 --sections 5000 --tickets 2000000 --workers 16
+#
+# Shape of the data:
+#   - hot accounts: the first --hot-accounts accounts receive --hot-share of all transactions (LoadTest.py and
+#     BenchmarkLedgerModes.py also treat the lowest account ids as the busy ones)
+#   - paycheck cycles: employers pay checking accounts on the 1st and 15th of each month
+#   - merchants: Zipf-weighted, so a few merchants see most card spend; amounts are log-normal per merchant
+#   - ticket sections: prices and sell-outs by distance from the ground, sales skewed to the cheap seats
+# Transaction ids and createdat grow together, as in production, over --months of history.
+#
+# Notes for large loads:
+#   - the tables must be empty (or pass --truncate, which also clears the checkpoint/rollup tables)
+#   - secondary indexes and the daily rollup trigger (Postgresql_DDLs_ForAccountSummary.txt) slow COPY down a
+#     lot; create or backfill them after loading
+#   - with a partitioned public.transactions, create the partitions first:
+#       SELECT public.create_transactions_partitions(3, CURRENT_DATE - INTERVAL '<months> months')
+
+CHUNK_ROWS = 1000000
+ROWS_PER_FILL = 1000
+
+FIRST_NAMES = ["Val", "Tara", "Leo", "Nova", "Ruby", "Jade", "Orion", "Sandy", "Andromeda", "Hal", "Mira",
+               "Cosmo", "Vega", "Marsella", "Phoebe", "Stella", "Zen", "Gaia", "Atlas", "Cassi", "Io", "Rhea",
+               "Deimos", "Luna", "Sol", "Titania", "Kepler", "Halley", "Ceres", "Juno"]
+LAST_NAMES = ["Marsden", "Redrock", "Bluestone", "Solis", "Sunwalker", "Mercury", "Zephyr", "Saturn", "Star",
+              "Terra", "Titan", "Ray", "Orb", "Red", "Luna", "Ceres", "Neptunian", "Nova", "Vulcan", "Sol",
+              "Crater", "Dustrunner", "Olympus", "Valles", "Hellas", "Tharsis", "Elysium", "Phobos"]
+EMAIL_DOMAINS = [("bankofmars.mrs", "MRS", "MCR"), ("terrafinance.earth", "EAR", "ECR"),
+                 ("lunaaccount.lun", "LUN", "LCR"), ("bankofvenus.vns", "VNS", "VCR"),
+                 ("ringedbank.sat", "SAT", "SCR"), ("spacefarer.mrs", "MRS", "USD")]
+DOMAIN_WEIGHTS = [50, 15, 10, 10, 5, 10]
+
+# 50% checking, 30% savings, 20% credit; the kind is derived from the account id, so every worker agrees on it
+ACCOUNT_KINDS = ["Checking"] * 5 + ["Savings"] * 3 + ["Credit"] * 2
+
+EMPLOYERS = ["Mars Mining Corp", "Saturn Bank", "Earth Bank", "Galactic Bank", "Olympus Terraforming",
+             "Phobos Logistics", "Red Planet Rail", "Valles Water Works"]
+
+# (merchant, description, median amount): weights follow Zipf by position
+MERCHANTS = [
+    ("Galactic Grocers", "Groceries", 70), ("Starlite Café", "Coffee", 6), ("Mars Metro", "Metro fare", 4),
+    ("Cosmos Pizza", "Pizza dinner", 30), ("Solarstream", "Video streaming", 15),
+    ("Neptune Net", "Satellite Internet", 90), ("Terra Tunes", "Music subscription", 12),
+    ("Mercury Messenger", "Meal delivery", 35), ("Domino Pizza", "Pizza dinner", 28),
+    ("Saturn Gym", "Gym membership", 40), ("Lunar Lift", "Airport Shuttle", 30),
+    ("Venus Ventures", "Shopping order", 120), ("Asteroid Apparel", "Clothing", 80),
+    ("AMC theatres", "Movie Tickets", 45), ("Sun Systems", "Software renewal", 90),
+    ("Cars-Of-Mars", "Auto Loan Payment", 650), ("Delta Airlines", "Air Ticket", 900),
+    ("Tampa Bucs", "NFL ticket", 300), ("Miami Dolphins", "NFL ticket", 280), ("Galactic Games", "Game purchase", 60)
+]
+MERCHANT_CUM_WEIGHTS = list(itertools.accumulate(1.0 / rank for rank in range(1, len(MERCHANTS) + 1)))
+
+# Same four distances as the CHECK constraint on ticket_availability, with base prices
+SECTION_BANDS = [("0-50 feet from ground", 1000), ("51-100 feet from ground", 500),
+                 ("100-150 feet from ground", 200), ("Flying plane is closer to you than the ground", 75)]
+BAND_SALES_WEIGHTS = [1, 2, 4, 8]
+
+TABLE_COLUMNS = {
+    "users": "userid, fullname, email, phone, createdat",
+    "accounts": "accountid, userid, accounttype, currency, balance, createdat",
+    "transactions": "transactionid, accountid, amount, transactiontype, description, relatedparty, createdat",
+    "ticket_availability": "section_number, total_available_seats, how_far_is_it_from_ground, ticket_price",
+    "ticket_transactions": "transaction_id, section_number, seat_number, purchased_price, purchased_timestamp, "
+                           "purchaser_name, purchaser_phone, purchaser_email"
+}
+
+# Loaded in this order because of the foreign keys
+PHASES = ["users", "accounts", "ticket_availability", "transactions", "ticket_transactions"]
+
+SERIAL_COLUMNS = [("public.users", "userid"), ("public.accounts", "accountid"),
+                  ("public.transactions", "transactionid"), ("ticket_availability", "section_number"),
+                  ("ticket_transactions", "transaction_id")]
+
+_worker = {}
+
+
+def connect():
+    return pg8000.native.Connection(
+        host=os.environ['PG_HOST'],
+        database=os.environ['PG_DATABASE'],
+        user=os.environ['PG_USER'],
+        password=os.environ['PG_PASSWORD']
+    )
+
+
+class CsvRowStream(io.TextIOBase):
+    # Read-only text stream over a row generator, consumed by pg8000's COPY ... FROM STDIN
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator="\n")
+        self.pending = ""
+
+    def readable(self):
+        return True
+
+    def fill(self, size):
+        while len(self.pending) < size:
+            for row in itertools.islice(self.rows, ROWS_PER_FILL):
+                self.writer.writerow(row)
+            data = self.buffer.getvalue()
+            if not data:
+                return
+            self.buffer.seek(0)
+            self.buffer.truncate()
+            self.pending += data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = 1 << 20
+        self.fill(size)
+        chunk, self.pending = self.pending[:size], self.pending[size:]
+        return chunk
+
+    def readline(self, size=-1):
+        self.fill(1)
+        end = self.pending.find("\n") + 1 or len(self.pending)
+        line, self.pending = self.pending[:end], self.pending[end:]
+        return line
+
+
+def account_kind(account_id):
+    return ACCOUNT_KINDS[(account_id - 1) % len(ACCOUNT_KINDS)]
+
+
+def section_attributes(section_number, seed):
+    # Deterministic per section, so ticket workers price sales the same way the section loader did
+    rng = random.Random(seed * 7919 + section_number)
+    band = min(len(SECTION_BANDS) - 1, int(rng.random() ** 0.7 * len(SECTION_BANDS)))
+    distance, base_price = SECTION_BANDS[band]
+    seats = 0 if rng.random() < 0.1 else rng.randint(50, 500)
+    return seats, distance, int(base_price * rng.uniform(0.8, 1.25)), band
+
+
+def user_rows(lo, hi, opts, rng):
+    start_at = opts["start_at"]
+    for user_id in range(lo, hi + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        domain, planet, _ = rng.choices(EMAIL_DOMAINS, DOMAIN_WEIGHTS)[0]
+        created = start_at - timedelta(days=rng.randint(0, 1500), seconds=rng.randint(0, 86399))
+        yield (user_id, f"{first} {last}", f"{first.lower()}.{last.lower()}{user_id}@{domain}",
+               f"{user_id % 10000:04d}-{planet}", created.isoformat(sep=' '))
+
+
+def account_rows(lo, hi, opts, rng):
+    users, start_at = opts["users"], opts["start_at"]
+    for account_id in range(lo, hi + 1):
+        # Every user gets one account, the rest go to a long tail of users with several
+        user_id = account_id if account_id <= users else 1 + int(users * rng.random() ** 1.5)
+        kind = account_kind(account_id)
+        currency = rng.choices(EMAIL_DOMAINS, DOMAIN_WEIGHTS)[0][2]
+        if kind == "Credit":
+            balance = -round(rng.uniform(0, 3000), 2)
+        else:
+            balance = round(rng.lognormvariate(math.log(5000 if kind == "Checking" else 12000), 1.0), 2)
+        created = start_at - timedelta(days=rng.randint(0, 1000), seconds=rng.randint(0, 86399))
+        yield (account_id, user_id, kind, currency, balance, created.isoformat(sep=' '))
+
+
+def pick_account(rng, opts):
+    if rng.random() < opts["hot_share"]:
+        return rng.randint(1, opts["hot_accounts"])
+    return rng.randint(1, opts["accounts"])
+
+
+def transaction_rows(lo, hi, opts, rng):
+    start_at, step, accounts = opts["start_at"], opts["step_seconds"], opts["accounts"]
+    for transaction_id in range(lo, hi + 1):
+        created = start_at + timedelta(seconds=int((transaction_id - 1) * step))
+        account_id = pick_account(rng, opts)
+        roll = rng.random()
+
+        if created.day in (1, 15) and roll < opts["payday_share"]:
+            # Paycheck into the checking account of the same block of accounts
+            account_id = min(accounts, account_id - (account_id - 1) % len(ACCOUNT_KINDS) + rng.randint(0, 4))
+            yield (transaction_id, account_id, round(rng.lognormvariate(math.log(2500), 0.5), 2), "Credit",
+                   "Paycheck deposit", EMPLOYERS[account_id % len(EMPLOYERS)], created.isoformat(sep=' '))
+            continue
+
+        kind = account_kind(account_id)
+        if kind == "Savings":
+            if roll < 0.05:
+                row = (round(rng.uniform(1, 40), 2), "Credit", "Interest", "Bank of Mars")
+            else:
+                amount = round(rng.lognormvariate(math.log(300), 0.8), 2)
+                row = (amount if roll < 0.6 else -amount, "Transfer", "Savings transfer", "Own account")
+        elif kind == "Credit" and roll < 0.08:
+            row = (round(rng.lognormvariate(math.log(800), 0.6), 2), "Payment", "Card payment", "Own account")
+        elif roll < 0.06:
+            row = (-round(rng.lognormvariate(math.log(150), 1.0), 2), "Transfer", "Transfer out",
+                   f"Account {rng.randint(1, accounts)}")
+        else:
+            index = bisect.bisect(MERCHANT_CUM_WEIGHTS, rng.random() * MERCHANT_CUM_WEIGHTS[-1])
+            merchant, description, median = MERCHANTS[index]
+            row = (-round(rng.lognormvariate(math.log(median), 0.6), 2), "Debit", description, merchant)
+
+        yield (transaction_id, account_id, row[0], row[1], row[2], row[3], created.isoformat(sep=' '))
+
+
+def section_rows(lo, hi, opts, rng):
+    for section_number in range(lo, hi + 1):
+        seats, distance, price, _ = section_attributes(section_number, opts["seed"])
+        yield (section_number, seats, distance, price)
+
+
+def ticket_rows(lo, hi, opts, rng):
+    sections, users, seed = opts["sections"], opts["users"], opts["seed"]
+    end_at = opts["end_at"]
+    for ticket_id in range(lo, hi + 1):
+        # Sales skew toward the cheap bands: reject by band weight
+        while True:
+            section_number = rng.randint(1, sections)
+            _, _, price, band = section_attributes(section_number, seed)
+            if rng.random() * BAND_SALES_WEIGHTS[-1] < BAND_SALES_WEIGHTS[band]:
+                break
+        user_id = rng.randint(1, users)
+        purchased = end_at - timedelta(seconds=rng.randint(0, 180 * 86400))
+        yield (ticket_id, section_number, ticket_id, price, purchased.isoformat(sep=' ') + "+00",
+               f"User {user_id}", f"{user_id % 10000:04d}-MRS", f"user{user_id}@bankofmars.mrs")
+
+
+ROW_GENERATORS = {
+    "users": user_rows,
+    "accounts": account_rows,
+    "transactions": transaction_rows,
+    "ticket_availability": section_rows,
+    "ticket_transactions": ticket_rows
+}
+
+
+def table_name(table):
+    return table if table.startswith("ticket_") else f"public.{table}"
+
+
+def init_worker(opts):
+    _worker["opts"] = opts
+    _worker["conn"] = connect()
+
+
+def load_chunk(task):
+    table, lo, hi = task
+    opts = _worker["opts"]
+    rng = random.Random(f"{opts['seed']}:{table}:{lo}")
+    stream = CsvRowStream(ROW_GENERATORS[table](lo, hi, opts, rng))
+    started = time.perf_counter()
+    _worker["conn"].run(f"COPY {table_name(table)} ({TABLE_COLUMNS[table]}) FROM STDIN WITH (FORMAT csv)",
+                        stream=stream)
+    return table, hi - lo + 1, time.perf_counter() - started
+
+
+def prepare_tables(conn, truncate):
+    if truncate:
+        conn.run("TRUNCATE public.transactions, public.accounts, public.users RESTART IDENTITY CASCADE")
+        conn.run("TRUNCATE ticket_transactions, ticket_availability RESTART IDENTITY CASCADE")
+        if conn.run("SELECT to_regclass('public.reconciliation_state') IS NOT NULL")[0][0]:
+            conn.run("UPDATE public.reconciliation_state SET last_transactionid = NULL, pending_transactionid = NULL")
+        return
+
+    for table in PHASES:
+        if conn.run(f"SELECT EXISTS (SELECT 1 FROM {table_name(table)})")[0][0]:
+            raise SystemExit(f"{table_name(table)} is not empty; rerun with --truncate")
+
+
+def reset_sequences(conn):
+    for table, column in SERIAL_COLUMNS:
+        conn.run(f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                 f"(SELECT COALESCE(MAX({column}), 0) + 1 FROM {table}), false)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate and COPY-load skewed benchmark data")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--accounts", type=int, default=300000)
+    parser.add_argument("--transactions", type=int, default=10000000)
+    parser.add_argument("--sections", type=int, default=1000)
+    parser.add_argument("--tickets", type=int, default=100000)
+    parser.add_argument("--months", type=int, default=24, help="months of transaction history")
+    parser.add_argument("--hot-accounts", type=int, default=100, help="number of busy accounts (lowest ids)")
+    parser.add_argument("--hot-share", type=float, default=0.2, help="fraction of transactions on the busy accounts")
+    parser.add_argument("--payday-share", type=float, default=0.3,
+                        help="fraction of transactions on the 1st/15th that are paychecks")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per COPY")
+    parser.add_argument("--truncate", action="store_true", help="empty the tables first")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.accounts < args.users:
+        parser.error("--accounts must be at least --users (every user gets an account)")
+
+    end_at = datetime.now().replace(microsecond=0)
+    start_at = end_at - timedelta(days=30 * args.months)
+    opts = {
+        "users": args.users,
+        "accounts": args.accounts,
+        "sections": args.sections,
+        "hot_accounts": min(args.hot_accounts, args.accounts),
+        "hot_share": args.hot_share,
+        "payday_share": args.payday_share,
+        "start_at": start_at,
+        "end_at": end_at,
+        "step_seconds": (end_at - start_at).total_seconds() / max(args.transactions, 1),
+        "seed": args.seed
+    }
+    volumes = {"users": args.users, "accounts": args.accounts, "transactions": args.transactions,
+               "ticket_availability": args.sections, "ticket_transactions": args.tickets}
+
+    conn = connect()
+    prepare_tables(conn, args.truncate)
+
+    started = time.perf_counter()
+    with Pool(args.workers, initializer=init_worker, initargs=(opts,)) as pool:
+        for table in PHASES:
+            tasks = [(table, lo, min(volumes[table], lo + args.chunk_rows - 1))
+                     for lo in range(1, volumes[table] + 1, args.chunk_rows)]
+            phase_started = time.perf_counter()
+            loaded = 0
+            for _, rows, _ in pool.imap_unordered(load_chunk, tasks):
+                loaded += rows
+                print(f"  {table_name(table)}: {loaded:,}/{volumes[table]:,} rows")
+            seconds = time.perf_counter() - phase_started
+            print(f"{table_name(table)}: {loaded:,} rows in {seconds:.1f}s ({loaded / max(seconds, 1e-9):,.0f} rows/s)")
+
+    reset_sequences(conn)
+    # With Postgresql_DDLs_ForSeatMaps.txt applied, number the sold seats per section and mark them in the maps
+    if conn.run("SELECT to_regproc('public.rebuild_seat_maps') IS NOT NULL")[0][0]:
+        conn.run("SELECT public.rebuild_seat_maps()")
+    for table in PHASES:
+        conn.run(f"ANALYZE {table_name(table)}")
+    conn.close()
+    print(f"Done in {time.perf_counter() - started:.1f}s")
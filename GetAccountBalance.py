@@ -1,52 +1,85 @@
-import os
 import json
-import pg8000.native
+from Instrumentation import instrument, log_event, mark
+from DbConnection import connect_read
+from Ledger import balance_column, balance_join
+from RequestValidator import RequestValidator, RequestValidationError
 
 # GetAccountBalance function
 
+# Compiled once per container from ActionGroup_OpenAPIschema_JSON_GetAccountBalance.txt
+VALIDATOR = RequestValidator("GetAccountBalance")
+
+
+@instrument("GetAccountBalance")
 def lambda_handler(event, context):
     try:
-        print(f"Received event: {json.dumps(event, default=str)}")
+        log_event(event)
 
-        # Default account_id if none provided
-        account_id = 1
-        
-        # Parse the accountId from requestBody in Bedrock format
-        if 'requestBody' in event and 'content' in event['requestBody']:
-            properties = event['requestBody']['content']['application/json']['properties']
-            for prop in properties:
-                if prop['name'] == 'accountId':
-                    account_id = int(prop['value'])  # Convert string to int
+        # Validate the accountId / accountIds against the OpenAPI schema before any I/O (400 on bad input)
+        params = VALIDATOR.validate(event)
+        account_id = params.get('accountId')
+        account_ids = params.get('accountIds')
 
-        if account_id is None:
-            raise ValueError("Account ID must be provided")
+        if account_id is None and not account_ids:
+            raise RequestValidationError("accountId or accountIds must be provided")
 
-        print(f"Fetching balance for accountId: {account_id}")
+        mark("parse")
 
         # Connect to PostgreSQL 
-        conn = pg8000.native.Connection(
-            host=os.environ['PG_HOST'],
-            database=os.environ['PG_DATABASE'],
-            user=os.environ['PG_USER'],
-            password=os.environ['PG_PASSWORD']
-        )
-
-        # Query to get the balance for the given account ID
-        query = """
-            SELECT balance
-            FROM public.accounts
-            WHERE accountid = :account_id
-        """
-
-        rows = conn.run(query, account_id=account_id)
-        conn.close()
-
-        # rows is a list of rows, each row is a list of columns
-        if rows and len(rows) > 0:
-            balance = rows[0][0]  # Extract the balance value from first row, first column
-            response_text = f"Account balance for account {account_id} is ${balance:.2f}"
+        conn = connect_read(event)
+
+        if account_ids:
+            print(f"Fetching balances for accountIds: {account_ids}")
+
+            # One round trip for every requested account
+            query = f"""
+                SELECT a.accountid, a.userid, a.accounttype, a.currency, {balance_column()}
+                FROM public.accounts a {balance_join()}
+                WHERE a.accountid = ANY(:account_ids)
+            """
+
+            try:
+                rows = conn.run(query, account_ids=account_ids)
+            finally:
+                conn.close()
+
+            accounts = {}
+            for row in rows:
+                accounts[str(row[0])] = {
+                    "userId": row[1],
+                    "accountType": row[2],
+                    "currency": row[3],
+                    "balance": float(row[4])  # Convert Decimal to float for JSON serialization
+                }
+
+            response_data = {
+                "accounts": accounts,
+                "notFound": [a for a in account_ids if str(a) not in accounts]
+            }
+            response_text = json.dumps(response_data)
         else:
-            response_text = f"No account found with account ID {account_id}"
+            print(f"Fetching balance for accountId: {account_id}")
+
+            # Query to get the balance for the given account ID
+            query = f"""
+                SELECT {balance_column()}
+                FROM public.accounts a {balance_join()}
+                WHERE a.accountid = :account_id
+            """
+
+            try:
+                rows = conn.run(query, account_id=account_id)
+            finally:
+                conn.close()
+
+            # rows is a list of rows, each row is a list of columns
+            if rows and len(rows) > 0:
+                balance = rows[0][0]  # Extract the balance value from first row, first column
+                response_text = f"Account balance for account {account_id} is ${balance:.2f}"
+            else:
+                response_text = f"No account found with account ID {account_id}"
+
+        mark("format")
 
         # Return in Bedrock's expected format
         return {
@@ -64,6 +97,10 @@ def lambda_handler(event, context):
             }
         }
 
+    except RequestValidationError as e:
+        print(f"Invalid request: {str(e)}")
+        return VALIDATOR.error_response(event, e)
+
     except Exception as e:
         print(f"Error: {str(e)}")
         return {
@@ -0,0 +1,195 @@
+import os
+import json
+from datetime import datetime, timedelta
+from Instrumentation import instrument, log_event, mark
+from DbConnection import connect_read
+from RequestValidator import RequestValidator, RequestValidationError
+from OutputBudget import Budget, encode_cursor, fit, size
+
+# GetAccountSummary function
+# Answers "how much did I spend on X this month" with one aggregate query instead of
+# returning raw transaction rows for the agent to add up. A long range at day granularity can still give many
+# byPeriod rows, so those follow the maxRows/maxBytes output budget (OutputBudget.py); totals and
+# topCounterparties always cover the whole range.
+
+# Compiled once per container from ActionGroup_OpenAPIschema_JSON_GetAccountSummary.txt
+VALIDATOR = RequestValidator("GetAccountSummary")
+
+# Row source for the aggregates: either the raw ledger or the daily rollup table kept up to date
+# by the trigger in Postgresql_DDLs_ForAccountSummary.txt (ACCOUNT_SUMMARY_SOURCE=rollup). The rollup only has
+# whole days, so an end inside a day (the default end, now) includes that day (:end_day). The rollup stores a
+# missing relatedparty as '' (it is part of its key), so both sources read '' back as NULL.
+LEDGER_SOURCE = """
+    SELECT date_trunc(CAST(:period AS text), createdat) AS period_start,
+           transactiontype, NULLIF(relatedparty, '') AS relatedparty,
+           1 AS txn_count, amount AS total,
+           GREATEST(amount, 0) AS inflow, LEAST(amount, 0) AS outflow
+    FROM public.transactions
+    WHERE accountid = :account_id
+    AND createdat >= :start_date AND createdat < :end_date
+"""
+
+ROLLUP_SOURCE = """
+    SELECT date_trunc(CAST(:period AS text), day) AS period_start,
+           transactiontype, NULLIF(relatedparty, '') AS relatedparty,
+           txn_count, total, inflow, outflow
+    FROM public.transaction_daily_summary
+    WHERE accountid = :account_id
+    AND day >= CAST(:start_date AS date) AND day < CAST(:end_day AS date)
+"""
+
+# Keyset condition for a cursor: byPeriod rows after the last one shown
+AFTER_CURSOR = """
+    WHERE (CAST(period_start AS date), transactiontype) > (CAST(:after_period AS date), CAST(:after_type AS text))"""
+
+SUMMARY_QUERY = """
+WITH tx AS ({source}),
+by_period AS (
+    SELECT period_start, transactiontype, SUM(txn_count) AS txn_count, SUM(total) AS total
+    FROM tx
+    GROUP BY period_start, transactiontype
+),
+listed_periods AS (
+    SELECT by_period.*, row_number() OVER (ORDER BY period_start, transactiontype) AS n
+    FROM by_period {after}
+),
+top_parties AS (
+    SELECT relatedparty, SUM(txn_count) AS txn_count, SUM(total) AS total
+    FROM tx
+    GROUP BY relatedparty
+    ORDER BY ABS(SUM(total)) DESC, relatedparty
+    LIMIT :top_n
+)
+SELECT json_build_object(
+    'totals', (SELECT json_build_object(
+                   'count', COALESCE(SUM(txn_count), 0),
+                   'inflow', COALESCE(ROUND(SUM(inflow), 2), 0),
+                   'outflow', COALESCE(ROUND(SUM(outflow), 2), 0),
+                   'net', COALESCE(ROUND(SUM(total), 2), 0))
+               FROM tx),
+    'byPeriod', (SELECT COALESCE(json_agg(json_build_object(
+                     'period', to_char(period_start, 'YYYY-MM-DD'),
+                     'type', transactiontype,
+                     'count', txn_count,
+                     'total', ROUND(total, 2)) ORDER BY n), '[]')
+                 FROM listed_periods
+                 WHERE n <= :max_rows),
+    'listedPeriods', (SELECT count(*) FROM listed_periods),
+    'topCounterparties', (SELECT COALESCE(json_agg(json_build_object(
+                              'relatedParty', relatedparty,
+                              'count', txn_count,
+                              'total', ROUND(total, 2)) ORDER BY ABS(total) DESC, relatedparty), '[]')
+                          FROM top_parties)
+)
+"""
+
+
+@instrument("GetAccountSummary")
+def lambda_handler(event, context):
+    try:
+        log_event(event)
+
+        # Validate the parameters against the OpenAPI schema before any I/O (400 on bad input);
+        # period is checked against the schema enum and the dates arrive as datetime.date
+        params = VALIDATOR.validate(event)
+        account_id = params['accountId']
+        period = params.get('period', "month")  # default
+        start_date = params.get('startDate')
+        end_date = params.get('endDate')
+        top_n = params.get('topN', 5)  # default
+        budget = Budget.from_params(params)
+        after = budget.after(2)
+
+        # Default range is the current calendar month up to now
+        now = datetime.now()
+        start = datetime.combine(start_date, datetime.min.time()) if start_date else now.replace(
+            day=1, hour=0, minute=0, second=0, microsecond=0)
+        end = datetime.combine(end_date, datetime.min.time()) if end_date else now
+        end_day = end.date() if end == datetime.combine(end.date(), datetime.min.time()) else end.date() + timedelta(days=1)
+
+        print(f"Summarising accountId: {account_id}, period: {period}, from {start} to {end}")
+
+        mark("parse")
+
+        # Connect to PostgreSQL
+        conn = connect_read(event)
+
+        source = ROLLUP_SOURCE if os.environ.get('ACCOUNT_SUMMARY_SOURCE') == 'rollup' else LEDGER_SOURCE
+        cursor_params = {"after_period": after[0], "after_type": after[1]} if after else {}
+        try:
+            rows = conn.run(SUMMARY_QUERY.format(source=source, after=AFTER_CURSOR if after else ""),
+                            account_id=account_id,
+                            period=period,
+                            start_date=start,
+                            end_date=end,
+                            end_day=end_day,
+                            top_n=top_n,
+                            max_rows=budget.max_rows,
+                            **cursor_params)
+        finally:
+            conn.close()
+
+        summary = rows[0][0]
+        listed_periods = summary.pop("listedPeriods")
+        response_data = {
+            "accountId": account_id,
+            "period": period,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            **summary
+        }
+        response_text = json.dumps(response_data, separators=(",", ":"))
+
+        # Over the maxRows/maxBytes budget (OutputBudget.py): the byPeriod rows that fit and a cursor for the rest
+        by_period = summary["byPeriod"]
+        if listed_periods > len(by_period) or size(response_text) > budget.max_bytes:
+            def render(shown):
+                response_data["byPeriod"] = by_period[:shown]
+                response_data["truncated"] = {
+                    "shownPeriods": shown,
+                    "remainingPeriods": listed_periods - shown,
+                    "nextCursor": encode_cursor(by_period[shown - 1]["period"], by_period[shown - 1]["type"])
+                                  if shown else budget.cursor
+                }
+                return json.dumps(response_data, separators=(",", ":"))
+
+            response_text = render(fit(render, len(by_period), budget.max_bytes))
+
+        mark("format")
+
+        # Return in Bedrock's expected format
+        return {
+            "messageVersion": "1.0",
+            "response": {
+                "actionGroup": event["actionGroup"],
+                "apiPath": event["apiPath"],
+                "httpMethod": event["httpMethod"],
+                "httpStatusCode": 200,
+                "responseBody": {
+                    "application/json": {
+                        "body": response_text
+                    }
+                }
+            }
+        }
+
+    except RequestValidationError as e:
+        print(f"Invalid request: {str(e)}")
+        return VALIDATOR.error_response(event, e)
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return {
+            "messageVersion": "1.0",
+            "response": {
+                "actionGroup": event.get("actionGroup", "GetAccountSummary"),
+                "apiPath": event.get("apiPath", "/account-summary"),
+                "httpMethod": event.get("httpMethod", "POST"),
+                "httpStatusCode": 500,
+                "responseBody": {
+                    "application/json": {
+                        "body": f"Error retrieving account summary: {str(e)}"
+                    }
+                }
+            }
+        }
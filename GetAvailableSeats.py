@@ -1,46 +1,99 @@
-import os
-import json
-import pg8000.native
+from Instrumentation import instrument, log_event, mark
+from DbConnection import connect_read, session_attributes
+from AdmissionControl import admit, waiting_room_response
+from SeatMap import format_ranges, free_ranges, largest_block
+from RequestValidator import RequestValidator, RequestValidationError
+from OutputBudget import Budget, encode_cursor, fit, size, truncation_marker
 
 # GetAvailableSeats function
 
+# Compiled once per container from ActionGroup_OpenAPIschema_JSON_GetAvailableSeats.txt (query parameters)
+VALIDATOR = RequestValidator("GetAvailableSeats")
+
+# Sections with free seats in section order, at most :max_rows of them (after the cursor). The section count,
+# seat total and price range of all of them are window aggregates in the same statement, and only the seat maps
+# of the rows returned are converted to text.
+SECTIONS_QUERY = """
+SELECT section_number, total_available_seats, how_far_is_it_from_ground, ticket_price, CAST(seat_map AS text),
+       listed_sections, listed_seats, min_price, max_price
+FROM (
+    SELECT section_number, total_available_seats, how_far_is_it_from_ground, ticket_price, seat_map,
+           row_number() OVER (ORDER BY section_number) AS n,
+           count(*) OVER () AS listed_sections,
+           SUM(total_available_seats) OVER () AS listed_seats,
+           min(ticket_price) OVER () AS min_price,
+           max(ticket_price) OVER () AS max_price
+    FROM public.ticket_availability
+    WHERE total_available_seats > 0 {after}
+) s
+WHERE n <= :max_rows
+ORDER BY n
+"""
+
+# Keyset condition for a cursor: sections after the last one shown
+AFTER_CURSOR = "\n    AND section_number > CAST(:after_section AS int)"
+
+
+def section_line(row):
+    # Free seat ranges from the section's seat map; group bookings need a block of adjacent seats
+    ranges = free_ranges(row[4])
+    return f"• Section {row[0]}: {row[1]} seats available, {row[2]}, ${row[3]}; free seats {format_ranges(ranges)} (largest block of adjacent seats: {largest_block(ranges)})\n"
+
+@instrument("GetAvailableSeats")
 def lambda_handler(event, context):
     try:
-        print(f"My Received event: {json.dumps(event, default=str)}")
+        log_event(event)
         
+        # Validate the query parameters against the OpenAPI schema before any I/O (400 on bad input)
+        params = VALIDATOR.validate(event)
+        budget = Budget.from_params(params)
+        after = budget.after(1)
+
         print("Fetching available seats from ticket_availability")
         
+        mark("parse")
+
+        # Waiting room (AdmissionControl.py): during an on-sale, callers not admitted yet get their place in line
+        admission = admit(event)
+        if not admission.admitted:
+            return waiting_room_response(event, admission, "GetAvailableSeats", "/available-seats", "GET")
+        mark("admission")
+
         # Connect to PostgreSQL 
-        conn = pg8000.native.Connection(
-            host=os.environ['PG_HOST'],
-            database=os.environ['PG_DATABASE'],
-            user=os.environ['PG_USER'],
-            password=os.environ['PG_PASSWORD']
-        )
+        conn = connect_read(event)
         
         # Query ticket_availability for rows with total_available_seats > 0
-        query = """
-        SELECT section_number, total_available_seats, how_far_is_it_from_ground, ticket_price
-        FROM public.ticket_availability 
-        WHERE total_available_seats > 0 
-        ORDER BY section_number ASC
-        """
-        
-        rows = conn.run(query)
-        conn.close()
+        cursor_params = {"after_section": after[0]} if after else {}
+        try:
+            rows = conn.run(SECTIONS_QUERY.format(after=AFTER_CURSOR if after else ""), max_rows=budget.max_rows,
+                            **cursor_params)
+        finally:
+            conn.close()
         
-        # Format response for Bedrock
+        # Format response for Bedrock; over the maxRows/maxBytes budget the sections that fit are shown with the
+        # totals of all of them and a cursor for the rest
         if rows:
-            response_text = f"Available sections with seats (total: {len(rows)} sections):\n\n"
+            listed_sections, listed_seats, min_price, max_price = rows[0][5:9]
+            response_text = f"Available sections with seats (total: {listed_sections} sections):\n\n"
             for row in rows:
-                section_number = row[0]
-                available_seats = row[1]
-                distance_from_ground = row[2]
-                price = row[3]
-                response_text += f"• Section {section_number}: {available_seats} seats available, {distance_from_ground}, ${price}\n"
+                response_text += section_line(row)
+            if listed_sections > len(rows) or size(response_text) > budget.max_bytes:
+                header = (f"Available sections with seats (total: {listed_sections} sections, {listed_seats} seats, "
+                          f"${min_price} to ${max_price}):\n\n")
+
+                def render(shown):
+                    cursor = encode_cursor(rows[shown - 1][0]) if shown else budget.cursor
+                    return (header + "".join(section_line(row) for row in rows[:shown])
+                            + truncation_marker(shown, listed_sections, "sections", cursor))
+
+                response_text = render(fit(render, len(rows), budget.max_bytes))
+        elif after:
+            response_text = "No more sections with available seats found"
         else:
             response_text = "No sections with available seats found"
         
+        mark("format")
+
         # Return in Bedrock's expected format
         return {
             "messageVersion": "1.0",
@@ -54,9 +107,14 @@ def lambda_handler(event, context):
                         "body": response_text
                     }
                 }
-            }
+            },
+            "sessionAttributes": session_attributes(event)
         }
         
+    except RequestValidationError as e:
+        print(f"Invalid request: {str(e)}")
+        return VALIDATOR.error_response(event, e)
+
     except Exception as e:
         print(f"Error: {str(e)}")
         return {
@@ -1,57 +1,142 @@
 import os
-import json
-import pg8000.native
+from datetime import datetime, timedelta
+from Instrumentation import instrument, log_event, mark
+from DbConnection import connect_read
+from RequestValidator import RequestValidator, RequestValidationError
+from OutputBudget import Budget, encode_cursor, fit, head_and_tail, size, truncation_marker
 
 # GetRecentTransactions function
 
+# Recent history is read from the last N days first. With public.transactions range-partitioned by createdat
+# (Postgresql_DDLs_PartitionedTransactions.txt) this only touches the newest partitions; older partitions
+# are read only when the window holds fewer rows than requested.
+LOOKBACK_DAYS = int(os.environ.get('RECENT_TRANSACTIONS_LOOKBACK_DAYS', '90'))
+
+# Compiled once per container from ActionGroup_OpenAPIschema_JSON_GetRecentTransactions.txt
+VALIDATOR = RequestValidator("GetRecentTransactions")
+
+# One statement for the page of up to :limit_val transactions (newest first). "older" only runs when "recent"
+# came up short (its LIMIT is 0 otherwise). The totals are window aggregates over the whole page, but only the
+# first :head_rows and last :tail_rows rows are returned when the page is over the maxRows budget
+# (OutputBudget.py). {after} continues from a cursor.
+PAGE_QUERY = """
+WITH recent AS (
+    SELECT transactionid, amount, transactiontype, description, relatedparty, createdat
+    FROM public.transactions
+    WHERE accountid = :account_id
+    AND createdat >= :since {after}
+    ORDER BY createdat DESC, transactionid DESC
+    LIMIT :limit_val
+),
+older AS (
+    SELECT transactionid, amount, transactiontype, description, relatedparty, createdat
+    FROM public.transactions
+    WHERE accountid = :account_id
+    AND createdat < :since {after}
+    ORDER BY createdat DESC, transactionid DESC
+    LIMIT CAST(:limit_val AS bigint) - (SELECT count(*) FROM recent)
+),
+page AS (
+    SELECT p.*,
+           row_number() OVER (ORDER BY createdat DESC, transactionid DESC) AS n,
+           count(*) OVER () AS page_rows,
+           count(*) FILTER (WHERE amount >= 0) OVER () AS credit_count,
+           COALESCE(SUM(amount) FILTER (WHERE amount >= 0) OVER (), 0) AS credit_total,
+           count(*) FILTER (WHERE amount < 0) OVER () AS debit_count,
+           COALESCE(SUM(amount) FILTER (WHERE amount < 0) OVER (), 0) AS debit_total,
+           min(createdat) OVER () AS first_at,
+           max(createdat) OVER () AS last_at
+    FROM (SELECT * FROM recent UNION ALL SELECT * FROM older) p
+)
+SELECT transactionid, amount, transactiontype, description, relatedparty, createdat,
+       n, page_rows, credit_count, credit_total, debit_count, debit_total, first_at, last_at
+FROM page
+WHERE page_rows <= :max_rows OR n <= :head_rows OR n > page_rows - :tail_rows
+ORDER BY n
+"""
+
+# Keyset condition for a cursor: strictly older than the last transaction shown
+AFTER_CURSOR = """
+    AND createdat <= CAST(:before_at AS timestamp)
+    AND (createdat < CAST(:before_at AS timestamp) OR transactionid < :before_id)"""
+
+
+def transaction_line(row):
+    return f"• ${row[1]} - {row[3]} ({row[4]}) on {str(row[5])[:10]}\n"
+
+
+def summary_text(account_id, rows, budget):
+    # Compact answer for a page over the budget: totals for the whole page, then the newest and oldest rows that fit
+    page_rows, credit_count, credit_total, debit_count, debit_total, first_at, last_at = rows[0][7:14]
+    if page_rows > budget.max_rows:
+        head_rows, _ = budget.head_and_tail_rows()
+        head, tail = [row for row in rows if row[6] <= head_rows], [row for row in rows if row[6] > head_rows]
+    else:
+        head, tail = rows, []
+
+    header = (f"Recent transactions for My account {account_id} (summary of {page_rows} transactions from "
+              f"{str(first_at)[:10]} to {str(last_at)[:10]}: {credit_count} credits totalling ${credit_total}, "
+              f"{debit_count} debits totalling ${debit_total}, net ${credit_total + debit_total}):\n\n")
+
+    def render(shown):
+        newest, oldest = head_and_tail(head, tail, shown)
+        # Continue after the newest rows shown; the oldest ones are only a preview of the end of the page
+        cursor = encode_cursor(newest[-1][5], newest[-1][0]) if newest else budget.cursor
+        text = header + "".join(transaction_line(row) for row in newest)
+        hidden = page_rows - len(newest) - len(oldest)
+        if oldest and hidden:
+            text += f"  ... {hidden} more transactions ...\n"
+        text += "".join(transaction_line(row) for row in oldest)
+        return text + truncation_marker(len(newest) + len(oldest), page_rows, "transactions", cursor,
+                                        "after the newest transactions shown")
+
+    return render(fit(render, len(head) + len(tail), budget.max_bytes))
+
+
+@instrument("GetRecentTransactions")
 def lambda_handler(event, context):
     try:
-        print(f"My Received event: {json.dumps(event, default=str)}")
-        
-        # Extract parameters from Bedrock's format.
-        account_id = 1  # default
-        limit = 100      # default
+        log_event(event)
         
-        # Parse the requestBody properties
-        if 'requestBody' in event and 'content' in event['requestBody']:
-            properties = event['requestBody']['content']['application/json']['properties']
-            for prop in properties:
-                if prop['name'] == 'accountId':
-                    account_id = int(prop['value'])  # Convert string to int
-                elif prop['name'] == 'limit':
-                    limit = int(prop['value'])
+        # Validate the parameters against the OpenAPI schema before any I/O (400 on bad input)
+        params = VALIDATOR.validate(event)
+        account_id = params['accountId']
+        limit = params.get('limit', 100)  # default
+        budget = Budget.from_params(params)
+        after = budget.after(2)
         
-        print(f"My accountId: {account_id}, limit: {limit}")
+        print(f"My accountId: {account_id}, limit: {limit}, maxRows: {budget.max_rows}, maxBytes: {budget.max_bytes}")
         
+        mark("parse")
+
         # Connect to PostgreSQL 
-        conn = pg8000.native.Connection(
-            host=os.environ['PG_HOST'],
-            database=os.environ['PG_DATABASE'],
-            user=os.environ['PG_USER'],
-            password=os.environ['PG_PASSWORD']
-        )
-        
-        # Query transactions
-        query = """
-        SELECT transactionid, amount, transactiontype, description, 
-               relatedparty, createdat
-        FROM public.transactions 
-        WHERE accountid = :account_id 
-        ORDER BY createdat DESC 
-        LIMIT :limit_val
-        """
+        conn = connect_read(event)
         
-        rows = conn.run(query, account_id=account_id, limit_val=limit)
-        conn.close()
+        # Query transactions and the page totals in one round trip
+        head_rows, tail_rows = budget.head_and_tail_rows()
+        cursor_params = {"before_at": after[0], "before_id": after[1]} if after else {}
+        since = datetime.now() - timedelta(days=LOOKBACK_DAYS)
+        try:
+            rows = conn.run(PAGE_QUERY.format(after=AFTER_CURSOR if after else ""),
+                            account_id=account_id, since=since, limit_val=limit, max_rows=budget.max_rows,
+                            head_rows=head_rows, tail_rows=tail_rows, **cursor_params)
+        finally:
+            conn.close()
         
-        # Format response for Bedrock
+        # Format response for Bedrock; pages over the maxRows/maxBytes budget are summarised
         if rows:
             response_text = f"Recent transactions for My account {account_id}:\n\n"
             for row in rows:
-                response_text += f"• ${row[1]} - {row[3]} ({row[4]}) on {str(row[5])[:10]}\n"
+                response_text += transaction_line(row)
+            if rows[0][7] > len(rows) or size(response_text) > budget.max_bytes:
+                response_text = summary_text(account_id, rows, budget)
+        elif after:
+            response_text = f"No more transactions found for My account {account_id}"
         else:
             response_text = f"No transactions found for My account {account_id}"
         
+        mark("format")
+
         # Return in Bedrock's expected format
         return {
             "messageVersion": "1.0",
@@ -68,6 +153,10 @@ def lambda_handler(event, context):
             }
         }
         
+    except RequestValidationError as e:
+        print(f"Invalid request: {str(e)}")
+        return VALIDATOR.error_response(event, e)
+
     except Exception as e:
         print(f"Error: {str(e)}")
         return {
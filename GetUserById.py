@@ -1,63 +1,89 @@
-import os
 import json
-import pg8000.native
+from Instrumentation import instrument, log_event, mark
+from DbConnection import connect_read
+from RequestValidator import RequestValidator, RequestValidationError
 
 # GetByUserID function
 
+# Compiled once per container from ActionGroup_OpenAPIschema_JSON_GetUserById.txt
+VALIDATOR = RequestValidator("GetUserById")
+
+
+def format_user(user_row):
+    return {
+        "userId": user_row[0],
+        "fullName": user_row[1],
+        "email": user_row[2],
+        "phone": user_row[3],
+        "createdAt": user_row[4].isoformat() if user_row[4] else None
+    }
+
+
+@instrument("GetUserById")
 def lambda_handler(event, context):
     try:
-        print(f"Received event: {json.dumps(event, default=str)}")
+        log_event(event)
 
-        # Default user_id if none provided
-        user_id = None
-        
-        # Parse the userId from requestBody in Bedrock format
-        if 'requestBody' in event and 'content' in event['requestBody']:
-            properties = event['requestBody']['content']['application/json']['properties']
-            for prop in properties:
-                if prop['name'] == 'userId':
-                    user_id = int(prop['value'])  # Convert string to int
+        # Validate the userId / userIds against the OpenAPI schema before any I/O (400 on bad input)
+        params = VALIDATOR.validate(event)
+        user_id = params.get('userId')
+        user_ids = params.get('userIds')
 
-        if user_id is None:
-            raise ValueError("User ID must be provided")
+        if user_id is None and not user_ids:
+            raise RequestValidationError("userId or userIds must be provided")
 
-        print(f"Fetching user details for userId: {user_id}")
+        mark("parse")
 
         # Connect to PostgreSQL 
-        conn = pg8000.native.Connection(
-            host=os.environ['PG_HOST'],
-            database=os.environ['PG_DATABASE'],
-            user=os.environ['PG_USER'],
-            password=os.environ['PG_PASSWORD']
-        )
-
-        # Query to get user details for the given user ID
-        query = """
-            SELECT userid, fullname, email, phone, createdat
-            FROM public.users
-            WHERE userid = :user_id
-        """
-
-        rows = conn.run(query, user_id=user_id)
-        conn.close()
-
-        # rows is a list of rows, each row is a list of columns
-        if rows and len(rows) > 0:
-            user_row = rows[0]  # Get the first (and should be only) row
-            user_details = {
-                "userId": user_row[0],
-                "fullName": user_row[1],
-                "email": user_row[2],
-                "phone": user_row[3],
-                "createdAt": user_row[4].isoformat() if user_row[4] else None
-            }
-            
-            response_text = json.dumps(user_details)
-        else:
+        conn = connect_read(event)
+
+        if user_ids:
+            print(f"Fetching user details for userIds: {user_ids}")
+
+            # One round trip for every requested user
+            query = """
+                SELECT userid, fullname, email, phone, createdat
+                FROM public.users
+                WHERE userid = ANY(:user_ids)
+            """
+
+            try:
+                rows = conn.run(query, user_ids=user_ids)
+            finally:
+                conn.close()
+
+            users = {str(row[0]): format_user(row) for row in rows}
             response_data = {
-                "error": f"No user found with user ID {user_id}"
+                "users": users,
+                "notFound": [u for u in user_ids if str(u) not in users]
             }
             response_text = json.dumps(response_data)
+        else:
+            print(f"Fetching user details for userId: {user_id}")
+
+            # Query to get user details for the given user ID
+            query = """
+                SELECT userid, fullname, email, phone, createdat
+                FROM public.users
+                WHERE userid = :user_id
+            """
+
+            try:
+                rows = conn.run(query, user_id=user_id)
+            finally:
+                conn.close()
+
+            # rows is a list of rows, each row is a list of columns
+            if rows and len(rows) > 0:
+                user_details = format_user(rows[0])  # Get the first (and should be only) row
+                response_text = json.dumps(user_details)
+            else:
+                response_data = {
+                    "error": f"No user found with user ID {user_id}"
+                }
+                response_text = json.dumps(response_data)
+
+        mark("format")
 
         # Return in Bedrock's expected format
         return {
@@ -75,6 +101,10 @@ def lambda_handler(event, context):
             }
         }
 
+    except RequestValidationError as e:
+        print(f"Invalid request: {str(e)}")
+        return VALIDATOR.error_response(event, e)
+
     except Exception as e:
         print(f"Error: {str(e)}")
         return {
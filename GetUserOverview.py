@@ -0,0 +1,211 @@
+import json
+from decimal import Decimal
+from datetime import datetime, timedelta
+from Instrumentation import instrument, log_event, mark
+from DbConnection import connect_read
+from Ledger import balance_column, balance_join
+from FxRates import consolidated_total, refresh
+from RequestValidator import RequestValidator, RequestValidationError
+from OutputBudget import Budget, encode_cursor, fit, size
+
+# GetUserOverview function
+# Answers "give me an overview of my money" in one call instead of GetUserById -> ListAccounts ->
+# GetAccountBalance -> GetRecentTransactions per account. The profile, the accounts with their balances and each
+# account's recent activity come from one statement: LATERAL subqueries per account, each reading only the
+# newest rows of that account through the (accountid, createdat) index (and only the newest partitions with
+# Postgresql_DDLs_PartitionedTransactions.txt), assembled into one JSON document by Postgres.
+# Users with many accounts get at most maxRows of them (maxRows/maxBytes output budget, OutputBudget.py) with a
+# cursor for the rest; the account count and the consolidated total always cover all of them.
+
+# Compiled once per container from ActionGroup_OpenAPIschema_JSON_GetUserOverview.txt
+VALIDATOR = RequestValidator("GetUserOverview")
+
+# Keyset condition for a cursor: accounts created after the last one shown
+AFTER_CURSOR = """
+    WHERE (createdat, accountid) > (CAST(:after_at AS timestamp), CAST(:after_id AS int))"""
+
+OVERVIEW_QUERY = """
+WITH accounts AS (
+    SELECT a.accountid, a.accounttype, a.currency, {balance} AS balance, a.createdat
+    FROM public.accounts a {balance_join}
+    WHERE a.userid = :user_id
+),
+listed AS (
+    SELECT accounts.*, row_number() OVER (ORDER BY createdat, accountid) AS n
+    FROM accounts {after}
+)
+SELECT json_build_object(
+    'user', (SELECT json_build_object(
+                 'userId', u.userid,
+                 'fullName', u.fullname,
+                 'email', u.email,
+                 'phone', u.phone,
+                 'createdAt', u.createdat)
+             FROM public.users u
+             WHERE u.userid = :user_id),
+    'totalAccounts', (SELECT count(*) FROM accounts),
+    'balancesByCurrency', (SELECT json_object_agg(currency, CAST(balance AS text) ORDER BY currency)
+                           FROM (SELECT currency, SUM(balance) AS balance FROM accounts GROUP BY currency) c),
+    'listedAccounts', (SELECT count(*) FROM listed),
+    'accounts', (SELECT COALESCE(json_agg(json_build_object(
+                     'accountId', l.accountid,
+                     'accountType', l.accounttype,
+                     'currency', l.currency,
+                     'balance', l.balance,
+                     'createdAt', l.createdat,
+                     'activity', json_build_object(
+                         'count', s.txn_count,
+                         'inflow', s.inflow,
+                         'outflow', s.outflow),
+                     'recentTransactions', r.recent) ORDER BY l.n), '[]')
+                 FROM listed l
+                 CROSS JOIN LATERAL (
+                     SELECT count(*) AS txn_count,
+                            COALESCE(SUM(GREATEST(t.amount, 0)), 0) AS inflow,
+                            COALESCE(SUM(LEAST(t.amount, 0)), 0) AS outflow
+                     FROM public.transactions t
+                     WHERE t.accountid = l.accountid
+                     AND t.createdat >= :since
+                 ) s
+                 CROSS JOIN LATERAL (
+                     SELECT COALESCE(json_agg(json_build_object(
+                                'date', to_char(t.createdat, 'YYYY-MM-DD'),
+                                'type', t.transactiontype,
+                                'amount', t.amount,
+                                'description', t.description,
+                                'relatedParty', t.relatedparty) ORDER BY t.createdat DESC, t.transactionid DESC),
+                            '[]') AS recent
+                     FROM (
+                         SELECT transactionid, amount, transactiontype, description, relatedparty, createdat
+                         FROM public.transactions
+                         WHERE accountid = l.accountid
+                         AND createdat >= :since
+                         ORDER BY createdat DESC, transactionid DESC
+                         LIMIT :recent_n
+                     ) t
+                 ) r
+                 WHERE l.n <= :max_rows)
+)
+"""
+
+
+@instrument("GetUserOverview")
+def lambda_handler(event, context):
+    try:
+        log_event(event)
+
+        # Validate the parameters against the OpenAPI schema before any I/O (400 on bad input)
+        params = VALIDATOR.validate(event)
+        user_id = params['userId']
+        days = params.get('days', 30)  # default
+        recent_n = params.get('recentTransactions', 3)  # default
+        total_currency = params.get('totalCurrency', "USD").upper()  # default
+        budget = Budget.from_params(params)
+        after = budget.after(2)
+
+        since = datetime.now() - timedelta(days=days)
+        print(f"Overview for userId: {user_id}, last {days} days, {recent_n} recent transactions per account")
+
+        mark("parse")
+
+        # Connect to PostgreSQL
+        conn = connect_read(event)
+
+        cursor_params = {"after_at": after[0], "after_id": after[1]} if after else {}
+        try:
+            rows = conn.run(OVERVIEW_QUERY.format(balance=balance_column(), balance_join=balance_join(),
+                                                  after=AFTER_CURSOR if after else ""),
+                            user_id=user_id,
+                            since=since,
+                            recent_n=recent_n,
+                            max_rows=budget.max_rows,
+                            **cursor_params)
+            overview = rows[0][0]
+            balances = [(Decimal(amount), currency)
+                        for currency, amount in (overview["balancesByCurrency"] or {}).items()]
+
+            # Rates come from the per-container cache (one version check every FX_VERSION_CHECK_SECONDS)
+            rates, fx_version = refresh(conn) if balances else ({}, None)
+        finally:
+            conn.close()
+
+        if overview["user"] is None:
+            response_data = {
+                "error": f"No user found with user ID {user_id}"
+            }
+        else:
+            accounts = overview["accounts"]
+            total, missing_rates = consolidated_total(balances, total_currency, rates)
+            response_data = {
+                "user": overview["user"],
+                "activitySince": since.date().isoformat(),
+                "totalAccounts": overview["totalAccounts"],
+                "accounts": accounts,
+                "consolidatedTotal": {
+                    "currency": total_currency,
+                    "amount": float(total),
+                    "ratesVersion": fx_version
+                }
+            }
+            if missing_rates:
+                # Accounts in these currencies are left out of the total
+                response_data["consolidatedTotal"]["missingRates"] = missing_rates
+        response_text = json.dumps(response_data, separators=(",", ":"))
+
+        # Over the maxRows/maxBytes budget (OutputBudget.py): the accounts that fit, the balance per currency of
+        # all accounts and a cursor for the rest
+        if overview["user"] is not None and (overview["listedAccounts"] > len(overview["accounts"]) or
+                                             size(response_text) > budget.max_bytes):
+            accounts = overview["accounts"]
+            response_data["balancesByCurrency"] = {currency: float(amount) for amount, currency in balances}
+
+            def render(shown):
+                response_data["accounts"] = accounts[:shown]
+                response_data["truncated"] = {
+                    "shownAccounts": shown,
+                    "remainingAccounts": overview["listedAccounts"] - shown,
+                    "nextCursor": encode_cursor(accounts[shown - 1]["createdAt"], accounts[shown - 1]["accountId"])
+                                  if shown else budget.cursor
+                }
+                return json.dumps(response_data, separators=(",", ":"))
+
+            response_text = render(fit(render, len(accounts), budget.max_bytes))
+
+        mark("format")
+
+        # Return in Bedrock's expected format
+        return {
+            "messageVersion": "1.0",
+            "response": {
+                "actionGroup": event["actionGroup"],
+                "apiPath": event["apiPath"],
+                "httpMethod": event["httpMethod"],
+                "httpStatusCode": 200,
+                "responseBody": {
+                    "application/json": {
+                        "body": response_text
+                    }
+                }
+            }
+        }
+
+    except RequestValidationError as e:
+        print(f"Invalid request: {str(e)}")
+        return VALIDATOR.error_response(event, e)
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return {
+            "messageVersion": "1.0",
+            "response": {
+                "actionGroup": event.get("actionGroup", "GetUserOverview"),
+                "apiPath": event.get("apiPath", "/user-overview"),
+                "httpMethod": event.get("httpMethod", "POST"),
+                "httpStatusCode": 500,
+                "responseBody": {
+                    "application/json": {
+                        "body": f"Error retrieving user overview: {str(e)}"
+                    }
+                }
+            }
+        }
@@ -1,81 +1,87 @@
-import os
-import json
-import pg8000.native
 from datetime import datetime
+from Instrumentation import instrument, log_event, mark
+from DbConnection import connect_primary, session_attributes
+from Ledger import append_only
+from VelocityCheck import VelocityLimitExceeded, rejection_response, release_velocity, reserve_velocity
+from RequestValidator import RequestValidator, RequestValidationError
 
 # InsertTransaction function
 
+# Compiled once per container from ActionGroup_OpenAPIschema_JSON_InsertTransaction.txt
+VALIDATOR = RequestValidator("InsertTransaction")
+
+@instrument("InsertTransaction")
 def lambda_handler(event, context):
     try:
-        print(f"My Received event: {json.dumps(event, default=str)}")
-        
-        # Extract parameters from Bedrock's format (same as GetRecentTransactions)
-        account_id = None
-        amount = None
-        transaction_type = "Debit"  # default
-        description = ""
-        related_party = ""
-        
-        # Parse the requestBody properties
-        if 'requestBody' in event and 'content' in event['requestBody']:
-            properties = event['requestBody']['content']['application/json']['properties']
-            for prop in properties:
-                if prop['name'] == 'accountId':
-                    account_id = int(prop['value'])
-                elif prop['name'] == 'amount':
-                    amount = float(prop['value'])
-                elif prop['name'] == 'transactionType':
-                    transaction_type = prop['value']
-                elif prop['name'] == 'description':
-                    description = prop['value']
-                elif prop['name'] == 'relatedParty':
-                    related_party = prop['value']
+        log_event(event)
         
-        # Validate required parameters
-        if account_id is None or amount is None:
-            raise ValueError("accountId and amount are required parameters")
+        # Validate the parameters against the OpenAPI schema before any I/O (400 on bad input)
+        params = VALIDATOR.validate(event)
+        account_id = params['accountId']
+        amount = params['amount']
+        transaction_type = params.get('transactionType', "Debit")  # default
+        description = params.get('description', "")
+        related_party = params.get('relatedParty', "")
         
         print(f"Processing: accountId={account_id}, amount={amount}, type={transaction_type}")
+        mark("parse")
+
         # Connect to PostgreSQL 
-        conn = pg8000.native.Connection(
-            host=os.environ['PG_HOST'],
-            database=os.environ['PG_DATABASE'],
-            user=os.environ['PG_USER'],
-            password=os.environ['PG_PASSWORD']
-        )        
-        
-        # Insert transaction
-        insert_query = """
-        INSERT INTO public.transactions 
-        (accountid, amount, transactiontype, description, relatedparty, createdat)
-        VALUES (:account_id, :amount, :transaction_type, :description, :related_party, :created_at)
-        RETURNING transactionid
-        """
-        
-        result = conn.run(insert_query,
-                         account_id=account_id,
-                         amount=amount,
-                         transaction_type=transaction_type,
-                         description=description,
-                         related_party=related_party,
-                         created_at=datetime.now())
+        conn = connect_primary()
         
-        transaction_id = result[0][0]
+        try:
+            # Velocity limits apply to debits and are checked (and the amount reserved) in memory before any write SQL runs
+            reservation = reserve_velocity(conn, account_id, -amount)
+            mark("velocity")
         
-        # Update account balance
-        update_query = """
-        UPDATE public.accounts 
-        SET balance = balance + :amount 
-        WHERE accountid = :account_id
-        """
+            # Insert the ledger row and update the balance atomically so the ledger and
+            # public.accounts never disagree (see ReconcileBalances.py)
+            try:
+                conn.run("BEGIN")
+
+                # Insert transaction
+                insert_query = """
+                INSERT INTO public.transactions 
+                (accountid, amount, transactiontype, description, relatedparty, createdat)
+                VALUES (:account_id, :amount, :transaction_type, :description, :related_party, :created_at)
+                RETURNING transactionid
+                """
+            
+                result = conn.run(insert_query,
+                                 account_id=account_id,
+                                 amount=amount,
+                                 transaction_type=transaction_type,
+                                 description=description,
+                                 related_party=related_party,
+                                 created_at=datetime.now())
+            
+                transaction_id = result[0][0]
+            
+                # Update account balance (append-only ledger mode derives it from the ledger instead)
+                if not append_only():
+                    update_query = """
+                    UPDATE public.accounts 
+                    SET balance = balance + :amount 
+                    WHERE accountid = :account_id
+                    """
+                
+                    conn.run(update_query, amount=amount, account_id=account_id)
+                conn.run("COMMIT")
+            except Exception as transaction_error:
+                release_velocity(reservation)
+                conn.run("ROLLBACK")
+                raise transaction_error
         
-        conn.run(update_query, amount=amount, account_id=account_id)
-        conn.close()
+            attributes = session_attributes(event, conn)
+        finally:
+            conn.close()
         
         # Format response (friendly message)
         action_word = "credited to" if amount >= 0 else "debited from" 
         response_text = f"Transaction #{transaction_id} successfully created! ${abs(amount):.2f} {action_word} account {account_id}. Description: {description} ({related_party})"
         
+        mark("format")
+
         # Return in Bedrock's expected format (EXACT same as GetRecentTransactions)
         return {
             "messageVersion": "1.0",
@@ -89,9 +95,17 @@ def lambda_handler(event, context):
                         "body": response_text
                     }
                 }
-            }
+            },
+            "sessionAttributes": attributes
         }
         
+    except RequestValidationError as e:
+        print(f"Invalid request: {str(e)}")
+        return VALIDATOR.error_response(event, e)
+
+    except VelocityLimitExceeded as e:
+        return rejection_response(event, e, "InsertTransaction", "/insert-transaction", "POST")
+
     except Exception as e:
         print(f"Error: {str(e)}")
         return {
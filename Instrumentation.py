@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import random
+import threading
+import functools
+
+# Lightweight per-invocation instrumentation shared by the Lambda handlers
+# Deploy this file next to each handler (same zip or a Lambda layer).
+#
+# Each invocation is split into phases with mark(): the time since the previous mark is charged to the named
+# phase. Queries run through an instrumented connection are timed individually and reset the mark clock, so
+# "parse", "connect" and "format" never include query time. At the end of the invocation one JSON line in
+# CloudWatch Embedded Metric Format is printed.
+#
+# Environment:
+#   LOG_EVENT_SAMPLE_RATE  fraction of invocations that log the full event JSON (default 0 = never)
+#   METRICS_NAMESPACE      CloudWatch namespace for the EMF metrics (default BankOfMars/ActionGroups)
+#   METRICS_ENABLED        set to "false" to turn the metric line off
+
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "BankOfMars/ActionGroups")
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() != "false"
+LOG_EVENT_SAMPLE_RATE = float(os.environ.get("LOG_EVENT_SAMPLE_RATE", "0"))
+
+_state = threading.local()
+_cold_start = True
+_cold_start_lock = threading.Lock()
+
+
+class Invocation:
+    def __init__(self, function_name, cold_start):
+        self.function_name = function_name
+        self.cold_start = cold_start
+        self.started = time.perf_counter()
+        self.last_mark = self.started
+        self.phases = {}
+        self.queries = []
+        self.rows = 0
+
+    def add_phase(self, name, elapsed_ms):
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed_ms
+
+
+def current():
+    return getattr(_state, "invocation", None)
+
+
+def mark(phase_name):
+    # Charge the time since the previous mark (or query) to phase_name
+    invocation = current()
+    if invocation is None:
+        return
+    now = time.perf_counter()
+    invocation.add_phase(phase_name, (now - invocation.last_mark) * 1000.0)
+    invocation.last_mark = now
+
+
+def log_event(event):
+    # Full-event logging costs a json.dumps per call, so it is sampled and off by default
+    if LOG_EVENT_SAMPLE_RATE > 0 and random.random() < LOG_EVENT_SAMPLE_RATE:
+        print(f"Received event: {json.dumps(event, default=str)}")
+
+
+class InstrumentedConnection:
+    # Wraps a pg8000.native.Connection and times every run() call
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def run(self, sql, **params):
+        invocation = current()
+        if invocation is None:
+            return self._conn.run(sql, **params)
+
+        mark("app")
+        started = time.perf_counter()
+        try:
+            result = self._conn.run(sql, **params)
+        finally:
+            finished = time.perf_counter()
+            elapsed_ms = (finished - started) * 1000.0
+            invocation.last_mark = finished
+        rows = len(result) if isinstance(result, list) else max(self._conn.row_count or 0, 0)
+        invocation.add_phase("query", elapsed_ms)
+        invocation.queries.append({"ms": round(elapsed_ms, 3), "rows": rows})
+        invocation.rows += rows
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def instrument_connection(conn):
+    return InstrumentedConnection(conn)
+
+
+def emit(invocation, status_code):
+    total_ms = (time.perf_counter() - invocation.started) * 1000.0
+    metrics = {
+        "DurationMs": round(total_ms, 3),
+        "Queries": len(invocation.queries),
+        "Rows": invocation.rows,
+        "ColdStart": 1 if invocation.cold_start else 0,
+        "Errors": 1 if status_code >= 400 else 0
+    }
+    for name, elapsed_ms in invocation.phases.items():
+        metrics[f"{name.capitalize()}Ms"] = round(elapsed_ms, 3)
+
+    units = {"Queries": "Count", "Rows": "Count", "ColdStart": "Count", "Errors": "Count"}
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [["FunctionName"]],
+                "Metrics": [{"Name": name, "Unit": units.get(name, "Milliseconds")} for name in metrics]
+            }]
+        },
+        "FunctionName": invocation.function_name,
+        "StatusCode": status_code,
+        "QueryTimings": invocation.queries,
+        **metrics
+    }
+    print(json.dumps(record, separators=(",", ":")))
+
+
+def instrument(function_name):
+    # Decorator for lambda_handler: times the invocation and emits one EMF line
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _cold_start
+            with _cold_start_lock:
+                cold_start = _cold_start
+                _cold_start = False
+
+            invocation = Invocation(function_name, cold_start)
+            _state.invocation = invocation
+            status_code = 500
+            try:
+                response = handler(event, context)
+                if isinstance(response, dict):
+                    status_code = response.get("response", {}).get("httpStatusCode", 200)
+                return response
+            finally:
+                _state.invocation = None
+                if METRICS_ENABLED:
+                    emit(invocation, status_code)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,158 @@
+import re
+import json
+import time
+import importlib
+
+# Fast-path intent router for the Streamlit app (Bank-of-Mars_Banking_AI_Assistant.py)
+# A handful of deterministic lookups are recognised with regular expressions and answered by calling the
+# action-group handler directly with the same event the agent would have built, skipping the supervisor,
+# the collaborator and their model calls. Anything that does not match a pattern completely goes to the agent.
+#
+# Handlers can be called two ways:
+#   LambdaInvoker     invokes the deployed Lambda functions (one hop, needs lambda:InvokeFunction)
+#   InProcessInvoker  imports the handler modules and calls lambda_handler (needs the PG_* environment and the
+#                     handler files on the path, like LoadTest.py)
+
+ACCOUNT = r"(?:account|acct|a/c)\s*(?:id|number|no\.?)?\s*#?\s*(?P<id>\d+)"
+USER = r"user\s*(?:id)?\s*#?\s*(?P<id>\d+)"
+POLITE = r"(?:please\s+|can you\s+|could you\s+)?"
+END = r"\s*(?:please)?\s*[?.!]*"
+
+
+class Intent:
+    def __init__(self, name, handler, api_path, http_method, patterns, properties, formatter=None):
+        self.name = name
+        self.handler = handler
+        self.api_path = api_path
+        self.http_method = http_method
+        self.patterns = [re.compile(rf"^\s*{POLITE}{pattern}{END}$", re.IGNORECASE) for pattern in patterns]
+        self.properties = properties
+        self.formatter = formatter
+
+    def match(self, query):
+        for pattern in self.patterns:
+            matched = pattern.match(query)
+            if matched:
+                return self.properties(matched)
+        return None
+
+
+class Route:
+    def __init__(self, intent, properties):
+        self.intent = intent
+        self.properties = properties
+
+    def describe(self):
+        arguments = ", ".join(f"{name}={value}" for name, value in self.properties.items())
+        return f"{self.intent.name} → {self.intent.handler} {self.intent.api_path}({arguments})"
+
+
+def format_accounts(body):
+    data = json.loads(body)
+    lines = [f"Account List for User ID {data['userId']}:"]
+    for index, account in enumerate(data["accounts"], 1):
+        lines.append(f"{index}. Account ID: {account['accountId']} ; Type: {account['accountType']} ; "
+                     f"Currency: {account['currency']} ; Balance: {account['balance']:.2f}")
+    if not data["accounts"]:
+        lines.append("No accounts found.")
+    truncated = data.get("truncated")
+    if truncated and truncated["remainingAccounts"]:
+        lines.append(f"... and {truncated['remainingAccounts']} more accounts ({data['totalAccounts']} in total).")
+    total = data.get("consolidatedTotal")
+    if total:
+        lines.append(f"Total across accounts: {total['amount']:.2f} {total['currency']}")
+    return "\n".join(lines)
+
+
+INTENTS = [
+    Intent("account balance", "GetAccountBalance", "/accountBalance", "POST",
+           [rf"(?:what(?:'s| is)\s+)?(?:show\s+|get\s+|check\s+)?(?:me\s+)?(?:the\s+)?(?:current\s+)?balance\s+(?:of|for|on|in)\s+{ACCOUNT}",
+            rf"(?:what(?:'s| is)\s+)?{ACCOUNT}(?:'s)?\s+balance",
+            rf"how much (?:money\s+)?is (?:there\s+)?in\s+{ACCOUNT}"],
+           lambda m: {"accountId": int(m.group("id"))}),
+    Intent("list accounts", "ListAccounts", "/listAccounts", "POST",
+           [rf"(?:list|show|get)\s+(?:me\s+)?(?:all\s+)?(?:the\s+)?accounts\s+(?:of|for)\s+{USER}",
+            rf"(?:what|which)\s+accounts\s+does\s+{USER}\s+have",
+            rf"{USER}(?:'s)?\s+accounts"],
+           lambda m: {"userId": int(m.group("id"))},
+           format_accounts),
+    Intent("available seats", "GetAvailableSeats", "/available-seats", "GET",
+           [r"(?:what|which|show|list|get)?\s*(?:me\s+)?(?:are\s+)?(?:the\s+)?(?:available|open|free)\s+(?:seats|sections|tickets)(?:\s+are there)?",
+            r"(?:are there\s+)?any\s+(?:seats|tickets)\s+(?:left|available)",
+            r"(?:check\s+)?seat availability"],
+           lambda m: {})
+]
+
+
+def route(query):
+    # Returns a Route for a fast-path intent, or None when the query should go to the agent
+    query = (query or "").strip()
+    if not query or "\n" in query:
+        return None
+    for intent in INTENTS:
+        properties = intent.match(query)
+        if properties is not None:
+            return Route(intent, properties)
+    return None
+
+
+def build_event(route, session_id):
+    # Same shape as the action-group events Bedrock sends (see LoadTest.build_event)
+    event = {
+        "messageVersion": "1.0",
+        "agent": {"name": "FastPathRouter", "id": "FASTPATH", "alias": "local", "version": "DRAFT"},
+        "sessionId": session_id,
+        "actionGroup": route.intent.handler,
+        "apiPath": route.intent.api_path,
+        "httpMethod": route.intent.http_method,
+        "sessionAttributes": {},
+        "promptSessionAttributes": {}
+    }
+    if route.properties:
+        event["requestBody"] = {"content": {"application/json": {"properties": [
+            {"name": name, "type": "integer" if isinstance(value, int) else "string", "value": str(value)}
+            for name, value in route.properties.items()
+        ]}}}
+    return event
+
+
+class LambdaInvoker:
+    def __init__(self, lambda_client, function_prefix=""):
+        self.lambda_client = lambda_client
+        self.function_prefix = function_prefix
+
+    def __call__(self, handler, event):
+        response = self.lambda_client.invoke(FunctionName=f"{self.function_prefix}{handler}",
+                                             InvocationType="RequestResponse",
+                                             Payload=json.dumps(event).encode("utf-8"))
+        payload = json.loads(response["Payload"].read())
+        if response.get("FunctionError"):
+            raise Exception(payload.get("errorMessage", "Lambda function error"))
+        return payload
+
+
+class InProcessInvoker:
+    def __init__(self):
+        self.handlers = {}
+
+    def __call__(self, handler, event):
+        if handler not in self.handlers:
+            self.handlers[handler] = importlib.import_module(handler).lambda_handler
+        return self.handlers[handler](event, None)
+
+
+def call(route, invoker, session_id):
+    # Returns (status code, text to show, elapsed ms)
+    started = time.perf_counter()
+    result = invoker(route.intent.handler, build_event(route, session_id))
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+
+    response = result["response"]
+    body = response["responseBody"]["application/json"]["body"]
+    status = response.get("httpStatusCode", 200)
+    if status == 200 and route.intent.formatter:
+        try:
+            body = route.intent.formatter(body)
+        except (ValueError, KeyError, TypeError):
+            pass
+    return status, body, elapsed_ms
@@ -1,49 +1,80 @@
-import os
 import json
-import pg8000.native
+from decimal import Decimal
+from Instrumentation import instrument, log_event, mark
+from DbConnection import connect_read
+from Ledger import balance_column, balance_join
+from FxRates import consolidated_total, refresh
+from RequestValidator import RequestValidator, RequestValidationError
+from OutputBudget import Budget, encode_cursor, fit, size
 
 # ListAccounts function
 
+# Compiled once per container from ActionGroup_OpenAPIschema_JSON_ListAccounts.txt
+VALIDATOR = RequestValidator("ListAccounts")
+
+# Keyset condition for a cursor: accounts created after the last one shown
+AFTER_CURSOR = """
+                WHERE (createdat, accountid) > (CAST(:after_at AS timestamp), CAST(:after_id AS int))"""
+
+@instrument("ListAccounts")
 def lambda_handler(event, context):
     try:
-        print(f"Received event: {json.dumps(event, default=str)}")
+        log_event(event)
 
-        # Default user_id if none provided
-        user_id = None
-        
-        # Parse the userId from requestBody in Bedrock format
-        if 'requestBody' in event and 'content' in event['requestBody']:
-            properties = event['requestBody']['content']['application/json']['properties']
-            for prop in properties:
-                if prop['name'] == 'userId':
-                    user_id = int(prop['value'])  # Convert string to int
-
-        if user_id is None:
-            raise ValueError("User ID must be provided")
+        # Validate the userId against the OpenAPI schema before any I/O (400 on bad input)
+        params = VALIDATOR.validate(event)
+        user_id = params['userId']
+        total_currency = params.get('totalCurrency', "USD").upper()  # default
+        budget = Budget.from_params(params)
+        after = budget.after(2)
 
         print(f"Fetching accounts for userId: {user_id}")
 
+        mark("parse")
+
         # Connect to PostgreSQL 
-        conn = pg8000.native.Connection(
-            host=os.environ['PG_HOST'],
-            database=os.environ['PG_DATABASE'],
-            user=os.environ['PG_USER'],
-            password=os.environ['PG_PASSWORD']
-        )
-
-        # Query to get all accounts for the given user ID
-        query = """
-            SELECT accountid, accounttype, currency, balance, createdat
-            FROM public.accounts
-            WHERE userid = :user_id
-            ORDER BY createdat ASC
+        conn = connect_read(event)
+
+        # Accounts of the user, at most maxRows of them (after the cursor), with the account count and the balance
+        # per currency of all of them computed in the same statement. Always returns at least one row.
+        query = f"""
+            WITH accounts AS (
+                SELECT a.accountid, a.accounttype, a.currency, {balance_column()} AS balance, a.createdat
+                FROM public.accounts a {balance_join()}
+                WHERE a.userid = :user_id
+            ),
+            totals AS (
+                SELECT (SELECT count(*) FROM accounts) AS account_count,
+                       json_object_agg(currency, CAST(balance AS text) ORDER BY currency)
+                           FILTER (WHERE currency IS NOT NULL) AS by_currency
+                FROM (SELECT currency, SUM(balance) AS balance FROM accounts GROUP BY currency) c
+            ),
+            listed AS (
+                SELECT accounts.*, row_number() OVER (ORDER BY createdat, accountid) AS n,
+                       count(*) OVER () AS listed_rows
+                FROM accounts {AFTER_CURSOR if after else ""}
+            )
+            SELECT l.accountid, l.accounttype, l.currency, l.balance, l.createdat, l.listed_rows,
+                   t.account_count, t.by_currency
+            FROM totals t
+            LEFT JOIN listed l ON l.n <= :max_rows
+            ORDER BY l.n
         """
 
-        rows = conn.run(query, user_id=user_id)
-        conn.close()
+        cursor_params = {"after_at": after[0], "after_id": after[1]} if after else {}
+        try:
+            rows = conn.run(query, user_id=user_id, max_rows=budget.max_rows, **cursor_params)
+            total_accounts = int(rows[0][6] or 0)
+            balances = [(Decimal(amount), currency) for currency, amount in (rows[0][7] or {}).items()]
+            rows = [row for row in rows if row[0] is not None]
+
+            # Rates come from the per-container cache (one version check every FX_VERSION_CHECK_SECONDS)
+            rates, fx_version = refresh(conn) if balances else ({}, None)
+        finally:
+            conn.close()
 
         # rows is a list of rows, each row is a list of columns
-        if rows and len(rows) > 0:
+        if total_accounts > 0:
             accounts = []
             for row in rows:
                 account = {
@@ -55,12 +86,38 @@ def lambda_handler(event, context):
                 }
                 accounts.append(account)
             
+            total, missing_rates = consolidated_total(balances, total_currency, rates)
             response_data = {
                 "userId": user_id,
-                "totalAccounts": len(accounts),
-                "accounts": accounts
+                "totalAccounts": total_accounts,
+                "accounts": accounts,
+                "consolidatedTotal": {
+                    "currency": total_currency,
+                    "amount": float(total),
+                    "ratesVersion": fx_version
+                }
             }
+            if missing_rates:
+                # Accounts in these currencies are left out of the total
+                response_data["consolidatedTotal"]["missingRates"] = missing_rates
             response_text = json.dumps(response_data)
+
+            # Over the maxRows/maxBytes budget (OutputBudget.py): the accounts that fit, the balance per currency of
+            # all accounts and a cursor for the rest
+            listed_accounts = rows[0][5] if rows else 0
+            if listed_accounts > len(accounts) or size(response_text) > budget.max_bytes:
+                response_data["balancesByCurrency"] = {currency: float(amount) for amount, currency in balances}
+
+                def render(shown):
+                    response_data["accounts"] = accounts[:shown]
+                    response_data["truncated"] = {
+                        "shownAccounts": shown,
+                        "remainingAccounts": listed_accounts - shown,
+                        "nextCursor": encode_cursor(rows[shown - 1][4], rows[shown - 1][0]) if shown else budget.cursor
+                    }
+                    return json.dumps(response_data)
+
+                response_text = render(fit(render, len(accounts), budget.max_bytes))
         else:
             response_data = {
                 "userId": user_id,
@@ -69,6 +126,8 @@ def lambda_handler(event, context):
             }
             response_text = json.dumps(response_data)
 
+        mark("format")
+
         # Return in Bedrock's expected format
         return {
             "messageVersion": "1.0",
@@ -85,6 +144,10 @@ def lambda_handler(event, context):
             }
         }
 
+    except RequestValidationError as e:
+        print(f"Invalid request: {str(e)}")
+        return VALIDATOR.error_response(event, e)
+
     except Exception as e:
         print(f"Error: {str(e)}")
         return {
@@ -0,0 +1,351 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import importlib
+import threading
+import urllib.request
+import urllib.error
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+import pg8000.native
+
+# Local load test for the action-group Lambdas
+# Plays the part of the Bedrock agent: builds action-group events for a weighted mix of tool calls and
+# invokes every lambda_handler in-process against a local Postgres loaded with Postgresql_DDLs.txt and
+# Postgresql_DDLs_ForTicketMaster.txt. SES is replaced by a stub, so nothing leaves the machine.
+#
+#   PG_HOST=localhost PG_DATABASE=bank PG_USER=postgres PG_PASSWORD=postgres \
+#       python LoadTest.py --concurrency 16 --duration 60
+#
+# Writes (transfers, inserts, ticket purchases) really change the database; reload the sample data between runs
+# when comparing numbers.
+#
+# With --url the same workload is sent over HTTP to LocalServer.py instead (connects and round trips per call
+# are then not counted).
+
+DEFAULT_MIX = "balance=30,accounts=10,user=5,history=20,summary=5,insert=10,transfer=10,seats=5,ticket=3,email=2"
+
+SCENARIO_HANDLERS = {
+    "balance": "GetAccountBalance",
+    "accounts": "ListAccounts",
+    "user": "GetUserById",
+    "history": "GetRecentTransactions",
+    "summary": "GetAccountSummary",
+    "insert": "InsertTransaction",
+    "transfer": "TransferFunds",
+    "seats": "GetAvailableSeats",
+    "ticket": "TicketPurchase",
+    "email": "SendEmail",
+    "overview": "GetUserOverview"
+}
+
+BEDROCK_TYPES = {int: "integer", float: "number", str: "string"}
+
+_calls = threading.local()
+
+
+class CountingConnection(pg8000.native.Connection):
+    # Counts connects and round trips for the handler call running on this thread
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _calls.connects = getattr(_calls, "connects", 0) + 1
+
+    def run(self, sql, stream=None, types=None, **params):
+        _calls.round_trips = getattr(_calls, "round_trips", 0) + 1
+        return super().run(sql, stream=stream, types=types, **params)
+
+
+class StubSesClient:
+    def __init__(self, latency_ms):
+        self.latency_ms = latency_ms
+
+    def send_email(self, **kwargs):
+        time.sleep(self.latency_ms / 1000.0)
+        return {"MessageId": f"loadtest-{random.getrandbits(48):012x}"}
+
+
+class StubBoto3:
+    def __init__(self, latency_ms):
+        self.latency_ms = latency_ms
+
+    def client(self, service_name, **kwargs):
+        return StubSesClient(self.latency_ms)
+
+
+def build_event(action_group, api_path, properties, http_method="POST"):
+    return {
+        "messageVersion": "1.0",
+        "agent": {"name": "LoadTestAgent", "id": "LOADTEST", "alias": "local", "version": "DRAFT"},
+        "sessionId": f"loadtest-{threading.get_ident()}",
+        "actionGroup": action_group,
+        "apiPath": api_path,
+        "httpMethod": http_method,
+        "requestBody": {
+            "content": {
+                "application/json": {
+                    "properties": [
+                        {"name": name, "type": BEDROCK_TYPES[type(value)], "value": str(value)}
+                        for name, value in properties.items()
+                    ]
+                }
+            }
+        },
+        "sessionAttributes": {},
+        "promptSessionAttributes": {}
+    }
+
+
+class Workload:
+    # Builds realistic events: a few hot accounts take most of the traffic, as in a real bank
+
+    def __init__(self, max_account_id, max_user_id, seed):
+        self.max_account_id = max_account_id
+        self.max_user_id = max_user_id
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def account(self):
+        with self.lock:
+            if self.rng.random() < 0.5:
+                return self.rng.randint(1, min(5, self.max_account_id))
+            return self.rng.randint(1, self.max_account_id)
+
+    def user(self):
+        with self.lock:
+            return self.rng.randint(1, self.max_user_id)
+
+    def amount(self, low, high):
+        with self.lock:
+            return round(self.rng.uniform(low, high), 2)
+
+    def choice(self, values):
+        with self.lock:
+            return self.rng.choice(values)
+
+    def scenario(self, scenarios, weights):
+        with self.lock:
+            return self.rng.choices(scenarios, weights, k=1)[0]
+
+    def event(self, scenario):
+        if scenario == "balance":
+            return "GetAccountBalance", build_event("GetAccountBalance", "/accountBalance",
+                                                    {"accountId": self.account()})
+        if scenario == "accounts":
+            return "ListAccounts", build_event("ListAccounts", "/listAccounts", {"userId": self.user()})
+        if scenario == "user":
+            return "GetUserById", build_event("GetUserById", "/getUserById", {"userId": self.user()})
+        if scenario == "history":
+            return "GetRecentTransactions", build_event("GetRecentTransactions", "/transactions",
+                                                        {"accountId": self.account(),
+                                                         "limit": self.choice([5, 10, 25, 100])})
+        if scenario == "summary":
+            return "GetAccountSummary", build_event("GetAccountSummary", "/account-summary",
+                                                    {"accountId": self.account(), "period": "month",
+                                                     "startDate": "2025-01-01"})
+        if scenario == "insert":
+            return "InsertTransaction", build_event("InsertTransaction", "/insert-transaction",
+                                                    {"accountId": self.account(),
+                                                     "amount": -self.amount(1, 60),
+                                                     "transactionType": "Debit",
+                                                     "description": self.choice(["Coffee", "Groceries", "Metro fare"]),
+                                                     "relatedParty": self.choice(["Starlite Café", "Galactic Grocers",
+                                                                                  "Mars Metro"])})
+        if scenario == "transfer":
+            from_account = self.account()
+            to_account = self.account()
+            if to_account == from_account:
+                to_account = from_account % self.max_account_id + 1
+            return "TransferFunds", build_event("TransferFunds", "/transfer-funds",
+                                                {"fromAccountId": from_account, "toAccountId": to_account,
+                                                 "amount": self.amount(1, 20), "description": "Load test transfer"})
+        if scenario == "seats":
+            return "GetAvailableSeats", build_event("GetAvailableSeats", "/available-seats", {}, "GET")
+        if scenario == "ticket":
+            return "TicketPurchase", build_event("TicketPurchase", "/purchase-ticket",
+                                                 {"user_desired_section_number": self.choice([100, 400]),
+                                                  "user_desired_number_of_seats": 1,
+                                                  "person_name": "Load Tester",
+                                                  "person_phone": "1001-MRS",
+                                                  "person_email": "load.tester@bankofmars.mrs"})
+        if scenario == "overview":
+            return "GetUserOverview", build_event("GetUserOverview", "/user-overview", {"userId": self.user()})
+        if scenario == "email":
+            return "SendEmail", build_event("SendEmail", "/sendEmail",
+                                            {"subject": "Load test", "messageBody": "Load test notification"})
+        raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def load_handlers(names, ses_latency_ms):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    # One EMF metric line per call would swamp the report (see Instrumentation.py)
+    os.environ.setdefault("METRICS_ENABLED", "false")
+    # The hot accounts would trip the velocity limits (see VelocityCheck.py) within seconds
+    os.environ.setdefault("VELOCITY_MODE", "off")
+    pg8000.native.Connection = CountingConnection
+    handlers = {}
+    for name in names:
+        module = importlib.import_module(name)
+        if name == "SendEmail":
+            module.boto3 = StubBoto3(ses_latency_ms)
+            os.environ.setdefault("SENDER_EMAIL", "loadtest@bankofmars.mrs")
+            os.environ.setdefault("RECIPIENT_EMAIL", "loadtest@bankofmars.mrs")
+        handlers[name] = module.lambda_handler
+    return handlers
+
+
+def http_handler(url):
+    # Calls LocalServer.py and returns its answer in the Lambda response shape
+    def call(event, context):
+        properties = event.get("requestBody", {}).get("content", {}).get("application/json", {}).get("properties", [])
+        parameters = {p["name"]: p["value"] for p in properties + (event.get("parameters") or [])}
+        target = f"{url.rstrip('/')}{event['apiPath']}"
+        if event["httpMethod"] == "GET":
+            request = urllib.request.Request(f"{target}?{urlencode(parameters)}" if parameters else target)
+        else:
+            request = urllib.request.Request(target, method=event["httpMethod"],
+                                             data=json.dumps({"parameters": parameters,
+                                                              "sessionAttributes": event.get("sessionAttributes", {}),
+                                                              "sessionId": event.get("sessionId")}).encode("utf-8"),
+                                             headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                status, payload = response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, json.loads(e.read() or b"{}")
+        return {"response": {"httpStatusCode": status,
+                             "responseBody": {"application/json": {"body": payload.get("body")}}},
+                "sessionAttributes": payload.get("sessionAttributes", {})}
+    return call
+
+
+def run_load_test(concurrency, duration, total_requests, mix, max_account_id, max_user_id, ses_latency_ms, seed,
+                  url=None):
+    weights = parse_mix(mix)
+    workload = Workload(max_account_id, max_user_id, seed)
+    scenarios = list(weights)
+    scenario_weights = [weights[s] for s in scenarios]
+
+    names = sorted({SCENARIO_HANDLERS[s] for s in scenarios})
+    handlers = {name: http_handler(url) for name in names} if url else load_handlers(names, ses_latency_ms)
+
+    results = []
+    results_lock = threading.Lock()
+    issued = [0]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_scenario():
+        with results_lock:
+            if total_requests and issued[0] >= total_requests:
+                return None
+            issued[0] += 1
+        if deadline and time.perf_counter() >= deadline:
+            return None
+        return workload.scenario(scenarios, scenario_weights)
+
+    def worker():
+        while True:
+            scenario = next_scenario()
+            if scenario is None:
+                return
+            name, event = workload.event(scenario)
+            _calls.connects = 0
+            _calls.round_trips = 0
+            started = time.perf_counter()
+            response = handlers[name](event, None)
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            status = response.get("response", {}).get("httpStatusCode", 0)
+            with results_lock:
+                results.append((name, elapsed_ms, status, _calls.connects, _calls.round_trips))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(worker) for _ in range(concurrency)]
+        for future in futures:
+            future.result()
+    wall_seconds = time.perf_counter() - started
+
+    return summarise(results, wall_seconds, concurrency)
+
+
+def summarise(results, wall_seconds, concurrency):
+    by_handler = {}
+    for name, elapsed_ms, status, connects, round_trips in results:
+        by_handler.setdefault(name, []).append((elapsed_ms, status, connects, round_trips))
+
+    report = {
+        "concurrency": concurrency,
+        "wallSeconds": round(wall_seconds, 3),
+        "requests": len(results),
+        "throughputPerSecond": round(len(results) / wall_seconds, 1) if wall_seconds else 0.0,
+        "handlers": {}
+    }
+    for name, rows in sorted(by_handler.items()):
+        latencies = sorted(r[0] for r in rows)
+        report["handlers"][name] = {
+            "requests": len(rows),
+            "errors": sum(1 for r in rows if r[1] != 200),
+            "throughputPerSecond": round(len(rows) / wall_seconds, 1) if wall_seconds else 0.0,
+            "p50Ms": round(percentile(latencies, 50), 2),
+            "p95Ms": round(percentile(latencies, 95), 2),
+            "p99Ms": round(percentile(latencies, 99), 2),
+            "maxMs": round(latencies[-1], 2),
+            "connectsPerCall": round(sum(r[2] for r in rows) / len(rows), 2),
+            "roundTripsPerCall": round(sum(r[3] for r in rows) / len(rows), 2)
+        }
+    return report
+
+
+def print_report(report):
+    print(f"\n{report['requests']} requests in {report['wallSeconds']}s at concurrency {report['concurrency']} "
+          f"({report['throughputPerSecond']} req/s)\n")
+    header = f"{'handler':<24}{'reqs':>7}{'errs':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}" \
+             f"{'conn/call':>11}{'rt/call':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, row in report["handlers"].items():
+        print(f"{name:<24}{row['requests']:>7}{row['errors']:>6}{row['throughputPerSecond']:>9}"
+              f"{row['p50Ms']:>9}{row['p95Ms']:>9}{row['p99Ms']:>9}"
+              f"{row['connectsPerCall']:>11}{row['roundTripsPerCall']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a mix of action-group events against the Lambda handlers")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run (0 = use --requests)")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many calls")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight list, e.g. balance=50,transfer=50")
+    parser.add_argument("--max-account-id", type=int, default=39)
+    parser.add_argument("--max-user-id", type=int, default=20)
+    parser.add_argument("--ses-latency-ms", type=float, default=40.0, help="simulated SES send_email latency")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--url", help="send the calls to LocalServer.py at this URL instead of in-process")
+    args = parser.parse_args()
+    if args.duration <= 0 and args.requests <= 0:
+        parser.error("give a --duration or a --requests count greater than 0, otherwise the test never stops")
+
+    report = run_load_test(args.concurrency, args.duration, args.requests, args.mix,
+                           args.max_account_id, args.max_user_id, args.ses_latency_ms, args.seed, args.url)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
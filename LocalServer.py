@@ -0,0 +1,216 @@
+import os
+import sys
+import glob
+import json
+import argparse
+import importlib
+import threading
+from urllib.parse import urlsplit, parse_qsl
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+
+# Local HTTP service for the action-group handlers
+# Runs every lambda_handler in one long-lived process: each action group is served at the apiPath and method of
+# its ActionGroup_OpenAPIschema_JSON_<ActionGroup>.txt, the handler modules are imported once at startup (no
+# cold start per request), and the connection pool (DB_POOL_SIZE, DbConnection.py) and the per-container caches
+# (FX rates, velocity counters, compiled schemas) are shared by all requests. Requests are served by a fixed
+# pool of worker threads.
+#
+#   PG_HOST=localhost PG_DATABASE=bank PG_USER=postgres PG_PASSWORD=postgres \
+#       python LocalServer.py --port 8080 --workers 16
+#
+#   curl -s localhost:8080/accountBalance -d '{"accountId": 4}'
+#   curl -s localhost:8080/available-seats
+#   curl -s localhost:8080/health
+#
+# The request body is a JSON object of parameters, or {"parameters": {...}, "sessionAttributes": {...},
+# "sessionId": "..."} to carry session attributes between calls as the agent does. Query-string parameters are
+# accepted too. The answer is {"statusCode", "body", "sessionAttributes"} with the handler's status code.
+# LoadTest.py --url replays its workload against this server.
+
+SCHEMA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Route:
+    def __init__(self, action_group, api_path, http_method, property_types, handler):
+        self.action_group = action_group
+        self.api_path = api_path
+        self.http_method = http_method
+        self.property_types = property_types
+        self.handler = handler
+
+
+def load_routes(schema_dir=SCHEMA_DIR, only=None):
+    # {(METHOD, apiPath): Route} from every ActionGroup_OpenAPIschema_JSON_<ActionGroup>.txt with a handler module
+    routes = {}
+    prefix = "ActionGroup_OpenAPIschema_JSON_"
+    for path in sorted(glob.glob(os.path.join(schema_dir, f"{prefix}*.txt"))):
+        action_group = os.path.basename(path)[len(prefix):-len(".txt")]
+        if only and action_group not in only:
+            continue
+        if not os.path.exists(os.path.join(schema_dir, f"{action_group}.py")):
+            continue
+        with open(path) as f:
+            spec = json.load(f)
+        handler = importlib.import_module(action_group).lambda_handler
+        for api_path, methods in spec["paths"].items():
+            for http_method, operation in methods.items():
+                schema = operation.get("requestBody", {}).get("content", {}).get("application/json", {}).get("schema", {})
+                property_types = {name: prop.get("type", "string")
+                                  for name, prop in schema.get("properties", {}).items()}
+                property_types.update({parameter["name"]: parameter.get("schema", {}).get("type", "string")
+                                       for parameter in operation.get("parameters", [])})
+                routes[(http_method.upper(), api_path)] = Route(action_group, api_path, http_method.upper(),
+                                                                property_types, handler)
+    return routes
+
+
+def bedrock_value(value):
+    # Bedrock sends every parameter value as a string; arrays as "[1, 2]"
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def build_event(route, parameters, session_attributes, session_id):
+    event = {
+        "messageVersion": "1.0",
+        "agent": {"name": "LocalServer", "id": "LOCAL", "alias": "local", "version": "DRAFT"},
+        "sessionId": session_id,
+        "actionGroup": route.action_group,
+        "apiPath": route.api_path,
+        "httpMethod": route.http_method,
+        "sessionAttributes": dict(session_attributes or {}),
+        "promptSessionAttributes": {}
+    }
+    if parameters:
+        properties = [
+            {"name": name, "type": route.property_types.get(name, "string"), "value": bedrock_value(value)}
+            for name, value in parameters.items()
+        ]
+        # GET operations take query parameters, which Bedrock sends as event['parameters']
+        if route.http_method == "GET":
+            event["parameters"] = properties
+        else:
+            event["requestBody"] = {"content": {"application/json": {"properties": properties}}}
+    return event
+
+
+class ActionGroupRequestHandler(BaseHTTPRequestHandler):
+    server_version = "BankOfMarsActionGroups/1.0"
+    routes = {}
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def dispatch(self):
+        url = urlsplit(self.path)
+        if self.command == "GET" and url.path == "/health":
+            from DbConnection import pool_stats
+            return self.send_json(200, {"status": "ok", "routes": sorted(f"{m} {p}" for m, p in self.routes),
+                                        "pools": pool_stats()})
+
+        route = self.routes.get((self.command, url.path))
+        if route is None:
+            return self.send_json(404, {"statusCode": 404, "body": f"No action group at {self.command} {url.path}"})
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            if not isinstance(payload, dict):
+                raise ValueError("the request body must be a JSON object")
+        except ValueError as e:
+            return self.send_json(400, {"statusCode": 400, "body": f"Invalid request: {str(e)}"})
+
+        if "parameters" in payload:
+            parameters = dict(payload.get("parameters") or {})
+            session_attributes = payload.get("sessionAttributes") or {}
+            session_id = payload.get("sessionId") or f"local-{threading.get_ident()}"
+        else:
+            parameters, session_attributes, session_id = dict(payload), {}, f"local-{threading.get_ident()}"
+        for name, value in parse_qsl(url.query):
+            parameters.setdefault(name, value)
+
+        try:
+            result = route.handler(build_event(route, parameters, session_attributes, session_id), None)
+        except Exception as e:
+            # The handlers answer their own errors; this only catches a failure outside their try blocks
+            print(f"Error: {route.action_group} {route.api_path}: {str(e)}")
+            return self.send_json(500, {"statusCode": 500, "body": f"Error: {str(e)}"})
+        response = result.get("response", {})
+        status = response.get("httpStatusCode", 500)
+        body = response.get("responseBody", {}).get("application/json", {}).get("body")
+        self.send_json(status, {"statusCode": status, "body": body,
+                                "sessionAttributes": result.get("sessionAttributes", session_attributes)})
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # The handlers already print their own lines; keep the access log off unless asked for
+        if self.server.access_log:
+            super().log_message(format, *args)
+
+
+class WorkerPoolHTTPServer(HTTPServer):
+    # Like ThreadingHTTPServer, but with a fixed number of worker threads instead of one thread per request
+
+    request_queue_size = 256
+
+    def __init__(self, address, handler_class, workers, access_log=False):
+        super().__init__(address, handler_class)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="action-group")
+        self.access_log = access_log
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_in_worker, request, client_address)
+
+    def process_request_in_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the action-group handlers over HTTP from one process")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=16, help="worker threads serving requests")
+    parser.add_argument("--pool-size", type=int, help="DB_POOL_SIZE per database host (default: --workers)")
+    parser.add_argument("--only", help="comma-separated action groups to serve (default: all)")
+    parser.add_argument("--access-log", action="store_true")
+    args = parser.parse_args()
+
+    # Read by DbConnection.py at import time, so set before the handlers are imported
+    os.environ["DB_POOL_SIZE"] = str(args.pool_size or os.environ.get("DB_POOL_SIZE") or args.workers)
+    sys.path.insert(0, SCHEMA_DIR)
+
+    ActionGroupRequestHandler.routes = load_routes(only=set(args.only.split(",")) if args.only else None)
+    server = WorkerPoolHTTPServer((args.host, args.port), ActionGroupRequestHandler, args.workers, args.access_log)
+    for method, api_path in sorted(ActionGroupRequestHandler.routes, key=lambda key: key[1]):
+        print(f"  {method:<5}{api_path} -> {ActionGroupRequestHandler.routes[(method, api_path)].action_group}")
+    print(f"Serving {len(ActionGroupRequestHandler.routes)} routes on http://{args.host}:{args.port} "
+          f"with {args.workers} workers, DB_POOL_SIZE={os.environ['DB_POOL_SIZE']}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,401 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+import contextlib
+from decimal import Decimal
+from datetime import datetime, timedelta
+
+# Micro-benchmarks: CPU time and memory the handlers spend outside the database
+# Every lambda_handler is called in-process with the database connection replaced by a stub that answers each
+# query with rows prepared in advance, so what is measured is event parsing and validation, the Decimal/datetime
+# conversions, response building, the instrumentation and logging - not Postgres or the network. The list
+# handlers run with 1 and 100 matches; the stub answers with exactly the rows their SQL would send back for that
+# many matches. For the handlers with an output budget (OutputBudget.py) that is at most one page whatever the
+# count, so larger sizes would only repeat the 100 case. The scheduled jobs, whose work grows with every row, also
+# run with 10,000.
+#
+#   python MicroBenchmarks.py                     # compare with MicroBenchmarks_baseline.json, exit 1 on regression
+#   python MicroBenchmarks.py --update-baseline   # record a new baseline after an intended change
+#   python MicroBenchmarks.py --only GetRecentTransactions,ListAccounts --sizes 100
+#
+# Each case is warmed up, then timed in --repeat rounds of enough calls for --min-time seconds each, and ops/sec
+# is taken from the median round. Peak memory per call is measured with tracemalloc in a separate call. A case
+# regresses when its ops/sec drops, or its peak memory grows, by more than --tolerance against the baseline.
+# Baselines are machine-specific: record and compare them on the same host (e.g. the CI runner), with the same
+# environment (METRICS_ENABLED, LOG_EVENT_SAMPLE_RATE, ...); the committed baseline is only a starting point,
+# re-record it on the host that runs the comparison. Without a baseline the run fails unless --update-baseline is
+# given. The scheduled jobs (ReconcileBalances, ReleaseExpiredHolds) are covered with their reports in place of a
+# Bedrock response. ExportStatement is not covered: its work is the COPY stream and the file or S3 upload, which
+# a stubbed connection cannot stand in for.
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "MicroBenchmarks_baseline.json")
+SIZES = (1, 100, 10000)
+LIST_SIZES = (1, 100)
+MEMORY_SLACK_BYTES = 4096
+
+NOW = datetime(2025, 7, 1, 12, 0, 0)
+FX_RATES = [[1, "USD", Decimal("1")], [1, "MCR", Decimal("0.25")], [1, "ECR", Decimal("1.1")]]
+FX_RULES = [("CROSS JOIN public.fx_rates", FX_RATES), ("SELECT version FROM public.fx_rates_version", [[1]])]
+
+
+class StubConnection:
+    # Answers each query with the rows of the first rule whose SQL fragment it contains; [] otherwise
+
+    rules = []
+
+    def __init__(self):
+        self.row_count = 0
+
+    def run(self, sql, stream=None, types=None, **params):
+        for fragment, rows in StubConnection.rules:
+            if fragment in sql:
+                self.row_count = len(rows)
+                return rows
+        self.row_count = 0
+        return []
+
+    def close(self):
+        pass
+
+
+def bedrock_value(value):
+    if isinstance(value, list):
+        return json.dumps(value)
+    return str(value)
+
+
+def build_event(action_group, api_path, properties, http_method="POST"):
+    # Same shape as the events Bedrock sends; GET operations get their parameters as event['parameters']
+    values = [{"name": name, "type": "integer" if isinstance(value, int) else "string", "value": bedrock_value(value)}
+              for name, value in properties.items()]
+    event = {
+        "messageVersion": "1.0",
+        "agent": {"name": "MicroBenchmarks", "id": "MICROBENCH", "alias": "local", "version": "DRAFT"},
+        "sessionId": "microbench",
+        "actionGroup": action_group,
+        "apiPath": api_path,
+        "httpMethod": http_method,
+        "sessionAttributes": {},
+        "promptSessionAttributes": {}
+    }
+    if http_method == "GET":
+        event["parameters"] = values
+    else:
+        event["requestBody"] = {"content": {"application/json": {"properties": values}}}
+    return event
+
+
+# Prepared results. Each function returns (event, stub rules) for a result of n rows.
+
+def account_balance(n):
+    if n == 1:
+        return (build_event("GetAccountBalance", "/accountBalance", {"accountId": 1}),
+                [("FROM public.accounts", [[Decimal("1234.56")]])])
+    rows = [[i, 1 + i // 3, "Checking", "USD", Decimal("1234.56") + i] for i in range(1, n + 1)]
+    return (build_event("GetAccountBalance", "/accountBalance", {"accountIds": list(range(1, n + 1))}),
+            [("FROM public.accounts", rows)])
+
+
+def user_by_id(n):
+    rows = [[i, f"User {i}", f"user{i}@bankofmars.mrs", f"{i:04d}-MRS", NOW] for i in range(1, n + 1)]
+    properties = {"userId": 1} if n == 1 else {"userIds": list(range(1, n + 1))}
+    return build_event("GetUserById", "/getUserById", properties), [("FROM public.users", rows)]
+
+
+def list_accounts(n):
+    shown = min(n, 20)
+    by_currency = {"ECR": "250.00", "MCR": "1000.00", "USD": f"{n * 100:.2f}"}
+    rows = [[i, "Checking" if i % 2 else "Savings", "USD", Decimal("100.00"), NOW + timedelta(minutes=i), n, n,
+             by_currency] for i in range(1, shown + 1)]
+    return (build_event("ListAccounts", "/listAccounts", {"userId": 1}),
+            FX_RULES + [("FROM public.accounts", rows)])
+
+
+def recent_transactions(n):
+    # What PAGE_QUERY returns for a page of n transactions (limit n): all of them within maxRows (20), else 10 + 10
+    credits = (n + 1) // 2
+    rows = []
+    for i in range(1, n + 1):
+        if n <= 20 or i <= 10 or i > n - 10:
+            rows.append([100000 - i, Decimal("2500.00") if i % 2 else Decimal("-42.17"),
+                         "Credit" if i % 2 else "Debit", f"Transaction {i}", "Mars Mining Corp",
+                         NOW - timedelta(hours=i), i, n, credits, Decimal("2500.00") * credits,
+                         n - credits, Decimal("-42.17") * (n - credits), NOW - timedelta(hours=n), NOW])
+    return (build_event("GetRecentTransactions", "/transactions", {"accountId": 1, "limit": n}),
+            [("FROM public.transactions", rows)])
+
+
+def account_summary(n):
+    # What SUMMARY_QUERY returns for n byPeriod rows: the first 20 and the count of all of them
+    summary = {
+        "totals": {"count": n * 3, "inflow": 2500.0 * n, "outflow": -42.17 * n, "net": 2457.83 * n},
+        "byPeriod": [{"period": (NOW - timedelta(days=i)).strftime("%Y-%m-%d"), "type": "Debit", "count": 3,
+                      "total": -126.51} for i in range(min(n, 20))],
+        "listedPeriods": n,
+        "topCounterparties": [{"relatedParty": f"Merchant {i}", "count": 10, "total": -421.7} for i in range(5)]
+    }
+    return (build_event("GetAccountSummary", "/account-summary", {"accountId": 1, "period": "day"}),
+            [("json_build_object", [[summary]])])
+
+
+def available_seats(n):
+    # What SECTIONS_QUERY returns for n sections with free seats: the first 20
+    seat_map = ("0" * 20 + "11" + "0" * 8 + "1" * 30 + "0" * 40) * 2
+    rows = [[100 + i, 138, "0-50 feet from ground", 100 + i % 50, seat_map, n, 138 * n, 100, 149]
+            for i in range(min(n, 20))]
+    return build_event("GetAvailableSeats", "/available-seats", {}, "GET"), [("FROM public.ticket_availability", rows)]
+
+
+def user_overview(n):
+    # What OVERVIEW_QUERY returns for a user with n accounts: the first 20, the count and balances of all of them
+    overview = {
+        "user": {"userId": 1, "fullName": "User 1", "email": "user1@bankofmars.mrs", "phone": "0001-MRS",
+                 "createdAt": "2025-01-01T00:00:00"},
+        "totalAccounts": n,
+        "balancesByCurrency": {"MCR": str(Decimal("1234.56") * (n // 3)),
+                               "USD": str(Decimal("1234.56") * (n - n // 3))},
+        "listedAccounts": n,
+        "accounts": [{"accountId": i, "accountType": "Checking", "currency": "USD" if i % 3 else "MCR",
+                      "balance": 1234.56, "createdAt": f"2025-01-01T00:00:{i:02d}",
+                      "activity": {"count": 12, "inflow": 2500.0, "outflow": -506.04},
+                      "recentTransactions": [{"date": "2025-06-30", "type": "Debit", "amount": -42.17,
+                                              "description": "Groceries", "relatedParty": "Galactic Grocers"}] * 3}
+                     for i in range(1, min(n, 20) + 1)]
+    }
+    return (build_event("GetUserOverview", "/user-overview", {"userId": 1}),
+            FX_RULES + [("json_build_object", [[overview]])])
+
+
+def insert_transaction(n):
+    return (build_event("InsertTransaction", "/insert-transaction",
+                        {"accountId": 1, "amount": "-12.50", "transactionType": "Debit", "description": "Coffee",
+                         "relatedParty": "Starlite Café"}),
+            [("RETURNING transactionid", [[100001]]), ("SELECT accounttype", [["Checking"]])])
+
+
+def transfer_funds(n):
+    return (build_event("TransferFunds", "/transfer-funds",
+                        {"fromAccountId": 1, "toAccountId": 2, "amount": "25.00", "description": "Rent share"}),
+            FX_RULES + [("'Transfer Out'", [[100001]]), ("'Transfer In'", [[100002]]),
+                        ("SELECT accountid, currency", [[1, "USD"], [2, "MCR"]]),
+                        ("FROM public.accounts a", [[Decimal("5000.00")]]), ("SELECT accounttype", [["Checking"]])])
+
+
+PURCHASER = {"person_name": "Load Tester", "person_phone": "1001-MRS", "person_email": "load.tester@bankofmars.mrs"}
+TICKET_ROW = [5001, 100, 21, 2, 1000, "Load Tester", "1001-MRS", "load.tester@bankofmars.mrs"]
+
+
+def ticket_purchase(n):
+    return (build_event("TicketPurchase", "/purchase-ticket",
+                        {"user_desired_section_number": 100, "user_desired_number_of_seats": 2, **PURCHASER}),
+            [("INSERT INTO ticket_transactions", [TICKET_ROW])])
+
+
+def ticket_hold(n):
+    return (build_event("TicketHold", "/hold-seats",
+                        {"user_desired_section_number": 100, "user_desired_number_of_seats": 2, **PURCHASER}),
+            [("INSERT INTO ticket_holds", [[77, 100, 21, 2, 1000, NOW + timedelta(minutes=10)]])])
+
+
+def ticket_confirm(n):
+    return build_event("TicketHold", "/confirm-hold", {"hold_id": 77}), [("WITH confirmed", [[*TICKET_ROW]])]
+
+
+def ticket_release(n):
+    return build_event("TicketHold", "/release-hold", {"hold_id": 77}), [("DELETE FROM ticket_holds", [[77, 100, 21, 2]])]
+
+
+def release_expired_holds(n):
+    # n expired holds, swept in batches of 1000 (the stub answers every batch with a full one)
+    batch_size = min(n, 1000)
+    rows = [[i, 100 + i % 50, 1 + 2 * (i % 60), 2] for i in range(1, batch_size + 1)]
+    return ({"batchSize": batch_size, "maxBatches": -(-n // batch_size)},
+            [("DELETE FROM ticket_holds", rows)])
+
+
+def reconcile_balances(n):
+    # A caught-up run that finds n drifted accounts
+    drifts = [[i, Decimal("100.00") + i, Decimal("100.00")] for i in range(1, n + 1)]
+    return ({"repair": False},
+            [("SELECT last_transactionid", [[90000, 100000]]), ("MAX(transactionid)", [[100000]]),
+             ("AS expected", drifts)])
+
+
+def send_email(n):
+    return (build_event("SendEmail", "/sendEmail", {"subject": "Transfer confirmation",
+                                                    "messageBody": "Your transfer of $25.00 was completed."}), [])
+
+
+# (case name, handler module, prepare, sizes)
+CASES = [
+    ("GetAccountBalance", "GetAccountBalance", account_balance, (1, 100)),
+    ("GetUserById", "GetUserById", user_by_id, (1, 100)),
+    ("ListAccounts", "ListAccounts", list_accounts, LIST_SIZES),
+    ("GetRecentTransactions", "GetRecentTransactions", recent_transactions, LIST_SIZES),
+    ("GetAccountSummary", "GetAccountSummary", account_summary, LIST_SIZES),
+    ("GetAvailableSeats", "GetAvailableSeats", available_seats, LIST_SIZES),
+    ("GetUserOverview", "GetUserOverview", user_overview, LIST_SIZES),
+    ("InsertTransaction", "InsertTransaction", insert_transaction, (1,)),
+    ("TransferFunds", "TransferFunds", transfer_funds, (1,)),
+    ("TicketPurchase", "TicketPurchase", ticket_purchase, (1,)),
+    ("TicketHold/hold-seats", "TicketHold", ticket_hold, (1,)),
+    ("TicketHold/confirm-hold", "TicketHold", ticket_confirm, (1,)),
+    ("TicketHold/release-hold", "TicketHold", ticket_release, (1,)),
+    ("SendEmail", "SendEmail", send_email, (1,)),
+    ("ReleaseExpiredHolds", "ReleaseExpiredHolds", release_expired_holds, SIZES),
+    ("ReconcileBalances", "ReconcileBalances", reconcile_balances, SIZES)
+]
+
+
+def load_handler(module_name):
+    import importlib
+    module = importlib.import_module(module_name)
+    if module_name == "SendEmail":
+        from LoadTest import StubBoto3
+        module.boto3 = StubBoto3(0)
+    return module.lambda_handler
+
+
+def time_case(handler, event, repeat, min_time):
+    # Median seconds per call over repeat rounds, each long enough to measure reliably
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            handler(event, None)
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2
+
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            handler(event, None)
+        rounds.append((time.perf_counter() - started) / loops)
+    return statistics.median(rounds), loops
+
+
+def peak_memory(handler, event):
+    # Peak bytes allocated by Python during one call
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        handler(event, None)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return max(0, peak - before)
+
+
+def run(only=None, sizes=SIZES, repeat=5, min_time=0.05):
+    import DbConnection
+    DbConnection._connect = lambda host: StubConnection()
+
+    results = {}
+    with open(os.devnull, "w") as devnull:
+        for name, module_name, prepare, case_sizes in CASES:
+            if only and name not in only and module_name not in only:
+                continue
+            handler = load_handler(module_name)
+            for n in case_sizes:
+                if n not in sizes:
+                    continue
+                event, StubConnection.rules = prepare(n)
+                with contextlib.redirect_stdout(devnull):
+                    # Action-group handlers answer with a Bedrock response, the scheduled jobs with their report
+                    answer = handler(event, None)
+                    status = answer["response"]["httpStatusCode"] if "response" in answer else 200
+                    if status != 200:
+                        raise Exception(f"{name} with {n} rows answered {status}; the stub rows no longer match")
+                    seconds, loops = time_case(handler, event, repeat, min_time)
+                    peak = peak_memory(handler, event)
+                results[f"{name}[{n}]"] = {
+                    "opsPerSecond": round(1.0 / seconds, 1),
+                    "microsecondsPerCall": round(seconds * 1e6, 2),
+                    "peakBytes": peak,
+                    "loops": loops
+                }
+                print(f"{name}[{n}]: {json.dumps(results[f'{name}[{n}]'])}")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # List of (case, reason) for the cases that got slower or bigger than the baseline allows
+    regressions = []
+    for case, result in results.items():
+        base = baseline.get(case)
+        if not base:
+            continue
+        if result["opsPerSecond"] < base["opsPerSecond"] * (1 - tolerance):
+            regressions.append((case, f"{result['opsPerSecond']} ops/sec, baseline {base['opsPerSecond']}"))
+        if result["peakBytes"] > base["peakBytes"] * (1 + tolerance) + MEMORY_SLACK_BYTES:
+            regressions.append((case, f"peak {result['peakBytes']} bytes, baseline {base['peakBytes']}"))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark the handlers against a stubbed database")
+    parser.add_argument("--only", help="comma-separated cases or handler modules (default: all)")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in SIZES), help="result sizes in rows")
+    parser.add_argument("--repeat", type=int, default=5, help="timed rounds per case")
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per timed round")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown or memory growth (0.2 = 20%%)")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    # The stub answers every query; keep the handlers on the primary path and out of the waiting room
+    os.environ.setdefault("PG_HOST", "stub")
+    os.environ.pop("PG_READ_HOST", None)
+    os.environ.setdefault("VELOCITY_MODE", "off")
+    os.environ.setdefault("ADMISSION_MODE", "off")
+    os.environ.setdefault("SENDER_EMAIL", "microbench@bankofmars.mrs")
+    os.environ.setdefault("RECIPIENT_EMAIL", "microbench@bankofmars.mrs")
+
+    results = run(set(args.only.split(",")) if args.only else None,
+                  {int(n) for n in args.sizes.split(",")}, args.repeat, args.min_time)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline} ({len(results)} cases)")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to record one")
+        sys.exit(1)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    print(f"\n{'case':<34}{'ops/sec':>12}{'baseline':>12}{'change':>9}{'peak KiB':>11}")
+    for case, result in results.items():
+        base = baseline.get(case)
+        change = f"{result['opsPerSecond'] / base['opsPerSecond'] - 1:+.0%}" if base else "new"
+        print(f"{case:<34}{result['opsPerSecond']:>12}{base['opsPerSecond'] if base else '-':>12}{change:>9}"
+              f"{result['peakBytes'] / 1024:>11.1f}")
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for case, reason in regressions:
+            print(f"  {case}: {reason}")
+        sys.exit(1)
+    print("\nNo regressions")
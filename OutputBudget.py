@@ -0,0 +1,86 @@
+import os
+import json
+import base64
+from RequestValidator import RequestValidationError
+
+# Output budgets for the list handlers (GetRecentTransactions, ListAccounts, GetAvailableSeats)
+# Deploy this file next to each handler (same zip or a Lambda layer).
+#
+# A tool result goes back into the agent verbatim, so its size adds latency and cost to every later model step.
+# Each list handler accepts maxRows and maxBytes (defaults OUTPUT_MAX_ROWS and OUTPUT_MAX_BYTES) and answers as
+# before when the result fits. Otherwise it returns a compact summary: counts and totals computed by the same SQL
+# statement (window aggregates over the whole result, so only the rows shown are sent back from Postgres), the
+# first and/or last rows that fit, and a truncation marker with a cursor. Passing the cursor back continues after
+# the last row shown (keyset pagination on the query's ORDER BY, no OFFSET). The summary only depends on the data
+# and the budget, so the same call always gives the same text.
+
+DEFAULT_MAX_ROWS = int(os.environ.get('OUTPUT_MAX_ROWS', '20'))
+DEFAULT_MAX_BYTES = int(os.environ.get('OUTPUT_MAX_BYTES', '4000'))
+
+
+class Budget:
+    def __init__(self, max_rows=DEFAULT_MAX_ROWS, max_bytes=DEFAULT_MAX_BYTES, cursor=None):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.cursor = cursor
+
+    @classmethod
+    def from_params(cls, params):
+        # params as returned by RequestValidator.validate()
+        return cls(params.get('maxRows', DEFAULT_MAX_ROWS), params.get('maxBytes', DEFAULT_MAX_BYTES),
+                   params.get('cursor') or None)
+
+    def head_and_tail_rows(self):
+        # How a summary splits maxRows between the first and the last rows of the result
+        return self.max_rows - self.max_rows // 2, self.max_rows // 2
+
+    def after(self, size):
+        # Keyset values of the incoming cursor (a list of size values), or None for the first page
+        if not self.cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(self.cursor + "=" * (-len(self.cursor) % 4)))
+        except ValueError:
+            values = None
+        if not isinstance(values, list) or len(values) != size:
+            raise RequestValidationError("cursor is not valid; pass the cursor from the previous answer unchanged")
+        return values
+
+
+def encode_cursor(*values):
+    # Opaque to the agent: the ORDER BY values of the last row shown, e.g. (createdat, transactionid)
+    text = json.dumps([value.isoformat() if hasattr(value, "isoformat") else value for value in values],
+                      separators=(",", ":"))
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def size(text):
+    return len(text.encode("utf-8"))
+
+
+def fit(render, most, max_bytes):
+    # Largest shown in [0, most] with size(render(shown)) <= max_bytes (0 if even that is over). render(shown)
+    # builds the whole answer with that many rows, and grows with shown, so a binary search is enough.
+    low, high = 0, most
+    while low < high:
+        middle = (low + high + 1) // 2
+        if size(render(middle)) <= max_bytes:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def head_and_tail(head, tail, shown):
+    # First and last rows to show when only shown of them fit: half from each end, the rest from the head
+    from_tail = min(len(tail), shown // 2)
+    from_head = min(len(head), shown - from_tail)
+    from_tail = min(len(tail), shown - from_head)
+    return head[:from_head], tail[len(tail) - from_tail:]
+
+
+def truncation_marker(shown, total, noun, cursor, continues="after the last one shown"):
+    if cursor:
+        return (f"[truncated: showing {shown} of {total} {noun}; call again with cursor=\"{cursor}\" to continue "
+                f"{continues}]")
+    return f"[truncated: showing {shown} of {total} {noun}; call again with a larger maxBytes or maxRows to see more]"
@@ -0,0 +1,181 @@
+import json
+import argparse
+from Instrumentation import instrument, log_event
+from DbConnection import connect_primary
+from Ledger import append_only
+
+# ReconcileBalances function
+# Scheduled job (EventBridge) that checks public.accounts.balance against the public.transactions ledger.
+# Tables are created by Postgresql_DDLs_ForReconciliation.txt. Can also be run locally:
+#   python ReconcileBalances.py [--repair] [--batch-size N]
+# With LEDGER_MODE=append_only (Ledger.py) accounts.balance is only the opening balance, so there is nothing to
+# drift: the job just compacts the checkpoints forward, which keeps derived balance reads short.
+
+DEFAULT_BATCH_SIZE = 5000000   # max ledger rows (by transactionid) folded into the checkpoints per run
+MAX_REPORTED_DRIFTS = 100
+
+# Fold ledger rows in (lo, hi] into the existing checkpoints with one range scan on the primary key
+APPLY_DELTA_QUERY = """
+UPDATE public.balance_checkpoints c
+SET ledger_balance = c.ledger_balance + d.delta,
+    last_transactionid = :hi,
+    reconciledat = CURRENT_TIMESTAMP
+FROM (
+    SELECT accountid, SUM(amount) AS delta
+    FROM public.transactions
+    WHERE transactionid > :lo AND transactionid <= :hi
+    GROUP BY accountid
+) d
+WHERE c.accountid = d.accountid
+"""
+
+# Accounts seen for the first time are baselined from their current balance minus the ledger rows after hi
+BASELINE_QUERY = """
+INSERT INTO public.balance_checkpoints (accountid, last_transactionid, ledger_balance)
+SELECT a.accountid, :hi,
+       a.balance - COALESCE((SELECT SUM(t.amount)
+                             FROM public.transactions t
+                             WHERE t.accountid = a.accountid AND t.transactionid > :hi), 0)
+FROM public.accounts a
+WHERE NOT EXISTS (SELECT 1 FROM public.balance_checkpoints c WHERE c.accountid = a.accountid)
+"""
+
+# In append_only mode accounts.balance is the opening balance, so the checkpoint is it plus the ledger up to hi
+APPEND_ONLY_BASELINE_QUERY = """
+INSERT INTO public.balance_checkpoints (accountid, last_transactionid, ledger_balance)
+SELECT a.accountid, :hi,
+       a.balance + COALESCE((SELECT SUM(t.amount)
+                             FROM public.transactions t
+                             WHERE t.accountid = a.accountid AND t.transactionid <= :hi), 0)
+FROM public.accounts a
+WHERE NOT EXISTS (SELECT 1 FROM public.balance_checkpoints c WHERE c.accountid = a.accountid)
+"""
+
+# Expected balance = checkpoint + ledger rows after the watermark (only the tail since the last run is scanned)
+DRIFT_QUERY = """
+SELECT a.accountid, a.balance, c.ledger_balance + COALESCE(t.tail, 0) AS expected
+FROM public.accounts a
+JOIN public.balance_checkpoints c ON c.accountid = a.accountid
+LEFT JOIN (
+    SELECT accountid, SUM(amount) AS tail
+    FROM public.transactions
+    WHERE transactionid > :hi
+    GROUP BY accountid
+) t ON t.accountid = a.accountid
+WHERE a.balance <> c.ledger_balance + COALESCE(t.tail, 0)
+ORDER BY a.accountid
+"""
+
+REPAIR_QUERY = """
+UPDATE public.accounts a
+SET balance = c.ledger_balance + COALESCE((SELECT SUM(t.amount)
+                                           FROM public.transactions t
+                                           WHERE t.accountid = a.accountid
+                                           AND t.transactionid > c.last_transactionid), 0)
+FROM public.balance_checkpoints c
+WHERE c.accountid = a.accountid AND a.accountid = ANY(:account_ids)
+RETURNING a.accountid, a.balance
+"""
+
+
+def reconcile(conn, repair=False, batch_size=DEFAULT_BATCH_SIZE):
+    # One REPEATABLE READ snapshot so balances, checkpoints and ledger are read at the same point in time
+    conn.run("BEGIN ISOLATION LEVEL REPEATABLE READ")
+    try:
+        state = conn.run("""
+            SELECT last_transactionid, pending_transactionid
+            FROM public.reconciliation_state
+            FOR UPDATE
+        """)
+        last_id, pending_id = state[0]
+        current_max = conn.run("SELECT COALESCE(MAX(transactionid), 0) FROM public.transactions")[0][0]
+
+        if last_id is None:
+            # First run: only record the watermark. Ids below it may still be uncommitted, so accounts
+            # are baselined on the next run once they have settled.
+            conn.run("""
+                UPDATE public.reconciliation_state
+                SET last_transactionid = :hi, pending_transactionid = :hi, ranat = CURRENT_TIMESTAMP
+            """, hi=current_max)
+            conn.run("COMMIT")
+            return {"initialized": True, "toTransactionId": current_max}
+
+        hi = max(last_id, min(pending_id, last_id + batch_size))
+
+        conn.run(APPLY_DELTA_QUERY, lo=last_id, hi=hi)
+        accounts_updated = conn.row_count
+        conn.run(APPEND_ONLY_BASELINE_QUERY if append_only() else BASELINE_QUERY, hi=hi)
+        accounts_baselined = conn.row_count
+
+        # While catching up on a large backlog the tail after hi is still big, so drift is only checked once caught up
+        caught_up = hi >= pending_id
+        drift_rows = conn.run(DRIFT_QUERY, hi=hi) if caught_up and not append_only() else []
+
+        conn.run("""
+            UPDATE public.reconciliation_state
+            SET last_transactionid = :hi, pending_transactionid = :pending, ranat = CURRENT_TIMESTAMP
+        """, hi=hi, pending=current_max)
+        conn.run("COMMIT")
+    except Exception:
+        conn.run("ROLLBACK")
+        raise
+
+    drifted = [
+        {
+            "accountId": row[0],
+            "balance": float(row[1]),
+            "expected": float(row[2]),
+            "drift": float(row[1] - row[2])
+        }
+        for row in drift_rows
+    ]
+
+    repaired = []
+    if repair and drifted:
+        # Lock the drifted rows first so the recomputation sees every committed ledger row for them
+        account_ids = [d["accountId"] for d in drifted]
+        conn.run("BEGIN")
+        try:
+            conn.run("SELECT accountid FROM public.accounts WHERE accountid = ANY(:account_ids) FOR UPDATE",
+                     account_ids=account_ids)
+            repaired = conn.run(REPAIR_QUERY, account_ids=account_ids)
+            conn.run("COMMIT")
+        except Exception:
+            conn.run("ROLLBACK")
+            raise
+
+    return {
+        "fromTransactionId": last_id,
+        "toTransactionId": hi,
+        "caughtUp": caught_up,
+        "accountsUpdated": accounts_updated,
+        "accountsBaselined": accounts_baselined,
+        "driftedAccounts": len(drifted),
+        "drifts": drifted[:MAX_REPORTED_DRIFTS],
+        "repairedAccounts": [{"accountId": row[0], "balance": float(row[1])} for row in repaired]
+    }
+
+
+@instrument("ReconcileBalances")
+def lambda_handler(event, context):
+    event = event or {}
+    log_event(event)
+
+    conn = connect_primary()
+    try:
+        report = reconcile(conn,
+                           repair=bool(event.get("repair", False)),
+                           batch_size=int(event.get("batchSize", DEFAULT_BATCH_SIZE)))
+    finally:
+        conn.close()
+
+    print(f"Reconciliation report: {json.dumps(report)}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile account balances against the transactions ledger")
+    parser.add_argument("--repair", action="store_true", help="reset drifted balances to the ledger value")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+    lambda_handler({"repair": args.repair, "batchSize": args.batch_size}, None)
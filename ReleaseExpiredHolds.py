@@ -0,0 +1,74 @@
+import json
+import time
+import argparse
+from Instrumentation import instrument, log_event
+from DbConnection import connect_primary
+from SeatMap import release_query
+
+# ReleaseExpiredHolds function
+# Scheduled job (EventBridge, e.g. every minute) that returns lapsed seat holds (TicketHold.py) to inventory.
+# Tables are created by Postgresql_DDLs_ForSeatHolds.txt. Can also be run locally:
+#   python ReleaseExpiredHolds.py [--batch-size N] [--max-batches N]
+# Each batch is one statement: the oldest expired holds are picked through idx_ticket_holds_expires_at with
+# SKIP LOCKED (a hold being confirmed right now is left alone), deleted, and their seats cleared from the seat
+# maps with one UPDATE per section.
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_MAX_BATCHES = 100
+
+SWEEP_QUERY = release_query("""hold_id IN (
+            SELECT hold_id
+            FROM ticket_holds
+            WHERE expires_at <= CURRENT_TIMESTAMP
+            ORDER BY expires_at
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )""")
+
+
+def release_expired(conn, batch_size=DEFAULT_BATCH_SIZE, max_batches=DEFAULT_MAX_BATCHES):
+    started = time.perf_counter()
+    holds = seats = batches = 0
+    sections = set()
+
+    while batches < max_batches:
+        rows = conn.run(SWEEP_QUERY, batch_size=batch_size)
+        batches += 1
+        holds += len(rows)
+        seats += sum(row[3] for row in rows)
+        sections.update(row[1] for row in rows)
+        if len(rows) < batch_size:
+            break
+
+    return {
+        "releasedHolds": holds,
+        "releasedSeats": seats,
+        "sections": sorted(sections),
+        "batches": batches,
+        "durationMs": round((time.perf_counter() - started) * 1000.0, 1)
+    }
+
+
+@instrument("ReleaseExpiredHolds")
+def lambda_handler(event, context):
+    event = event or {}
+    log_event(event)
+
+    conn = connect_primary()
+    try:
+        report = release_expired(conn,
+                                 batch_size=int(event.get("batchSize", DEFAULT_BATCH_SIZE)),
+                                 max_batches=int(event.get("maxBatches", DEFAULT_MAX_BATCHES)))
+    finally:
+        conn.close()
+
+    print(f"Expired hold report: {json.dumps(report)}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Return expired seat holds to inventory")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=DEFAULT_MAX_BATCHES)
+    args = parser.parse_args()
+    lambda_handler({"batchSize": args.batch_size, "maxBatches": args.max_batches}, None)
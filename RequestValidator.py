@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import math
+from datetime import date
+
+# Request validation shared by the action-group handlers
+# Deploy this file next to each handler (same zip or a Lambda layer), together with the handler's
+# ActionGroup_OpenAPIschema_JSON_<ActionGroup>.txt.
+#
+# The OpenAPI schema the agent is configured with is read and compiled once per container at import time.
+# validate(event) converts the Bedrock properties (always sent as strings) to Python values and checks types,
+# required fields, enums, ranges, lengths and formats, so malformed calls are answered with a 400 before a
+# database connection is opened. Query parameters of GET operations ("parameters" in the schema) are read from
+# event['parameters'] and checked the same way.
+#
+# Supported keywords: type (integer, number, string, boolean, array of those), required, enum, minimum, maximum,
+# exclusiveMinimum/exclusiveMaximum (OpenAPI 3.0 boolean form), minLength, maxLength, minItems, maxItems and
+# format (date -> datetime.date, email). Properties not in the schema are ignored; defaults are left to the
+# handler.
+
+SCHEMA_DIR = os.path.dirname(os.path.abspath(__file__))
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+class RequestValidationError(ValueError):
+    pass
+
+
+def to_integer(value):
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, int):
+        return value
+    number = float(str(value).strip())
+    if not number.is_integer():
+        raise ValueError
+    return int(number)
+
+
+def to_number(value):
+    if isinstance(value, bool):
+        raise ValueError
+    number = float(str(value).strip())
+    if not math.isfinite(number):
+        raise ValueError
+    return number
+
+
+def to_boolean(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text not in ("true", "false"):
+        raise ValueError
+    return text == "true"
+
+
+def to_string(value):
+    return value if isinstance(value, str) else str(value)
+
+
+def split_array(value):
+    # Bedrock passes array parameters as strings such as "[1, 2, 3]" or "1,2,3"
+    if isinstance(value, list):
+        return value
+    text = str(value).strip()
+    if text.startswith("["):
+        try:
+            parsed = json.loads(text)
+            if isinstance(parsed, list):
+                return parsed
+        except ValueError:
+            pass
+    return [v.strip().strip('"\'') for v in text.strip('[]').split(',') if v.strip()]
+
+
+CONVERTERS = {"integer": to_integer, "number": to_number, "boolean": to_boolean, "string": to_string}
+
+
+def compile_scalar(name, spec):
+    # Returns a function converting and checking one value; raises RequestValidationError with a readable reason
+    type_name = spec.get("type", "string")
+    convert = CONVERTERS.get(type_name, to_string)
+    enum = spec.get("enum")
+    enum_lookup = {str(v).lower(): v for v in enum} if enum else None
+    minimum, maximum = spec.get("minimum"), spec.get("maximum")
+    exclusive_minimum, exclusive_maximum = spec.get("exclusiveMinimum", False), spec.get("exclusiveMaximum", False)
+    min_length, max_length = spec.get("minLength"), spec.get("maxLength")
+    value_format = spec.get("format")
+
+    def check(value):
+        try:
+            value = convert(value)
+        except (TypeError, ValueError):
+            raise RequestValidationError(f"{name} must be {'an' if type_name[0] in 'aeiou' else 'a'} {type_name}")
+
+        if enum_lookup is not None:
+            if str(value).lower() not in enum_lookup:
+                raise RequestValidationError(f"{name} must be one of: {', '.join(str(v) for v in enum)}")
+            value = enum_lookup[str(value).lower()]
+
+        if minimum is not None and (value <= minimum if exclusive_minimum else value < minimum):
+            raise RequestValidationError(f"{name} must be {'greater than' if exclusive_minimum else 'at least'} {minimum}")
+        if maximum is not None and (value >= maximum if exclusive_maximum else value > maximum):
+            raise RequestValidationError(f"{name} must be {'less than' if exclusive_maximum else 'at most'} {maximum}")
+
+        if min_length is not None and len(value) < min_length:
+            raise RequestValidationError(f"{name} must be at least {min_length} characters")
+        if max_length is not None and len(value) > max_length:
+            raise RequestValidationError(f"{name} must be at most {max_length} characters")
+
+        if value_format == "date":
+            try:
+                value = date.fromisoformat(value.strip()[:10])
+            except ValueError:
+                raise RequestValidationError(f"{name} must be a date (YYYY-MM-DD)")
+        elif value_format == "email" and not EMAIL_PATTERN.match(value):
+            raise RequestValidationError(f"{name} must be an email address")
+        return value
+
+    return check
+
+
+def compile_property(name, spec):
+    if spec.get("type") != "array":
+        return compile_scalar(name, spec)
+
+    check_item = compile_scalar(f"each {name} entry", spec.get("items", {}))
+    min_items, max_items = spec.get("minItems"), spec.get("maxItems")
+
+    def check(value):
+        items = [check_item(item) for item in split_array(value)]
+        if min_items is not None and len(items) < min_items:
+            raise RequestValidationError(f"{name} must have at least {min_items} entries")
+        if max_items is not None and len(items) > max_items:
+            raise RequestValidationError(f"{name} must have at most {max_items} entries")
+        return items
+
+    return check
+
+
+class Operation:
+    def __init__(self, api_path, http_method, schema):
+        self.api_path = api_path
+        self.http_method = http_method
+        self.required = list(schema.get("required", []))
+        self.checks = {name: compile_property(name, spec) for name, spec in schema.get("properties", {}).items()}
+
+    def validate(self, properties):
+        params = {}
+        errors = []
+        invalid = set()
+        for prop in properties:
+            check = self.checks.get(prop.get('name'))
+            if check is None:
+                continue
+            try:
+                params[prop['name']] = check(prop.get('value'))
+            except RequestValidationError as e:
+                errors.append(str(e))
+                invalid.add(prop['name'])
+
+        missing = [name for name in self.required if name not in params and name not in invalid]
+        if missing:
+            errors.insert(0, f"missing required parameter{'s' if len(missing) > 1 else ''}: {', '.join(missing)}")
+        if errors:
+            raise RequestValidationError("; ".join(errors))
+        return params
+
+
+def query_schema(schema, parameters):
+    # Adds the query parameters of an operation to its request body schema
+    schema = {"properties": dict(schema.get("properties", {})), "required": list(schema.get("required", []))}
+    for parameter in parameters:
+        schema["properties"][parameter["name"]] = parameter.get("schema", {})
+        if parameter.get("required"):
+            schema["required"].append(parameter["name"])
+    return schema
+
+
+class RequestValidator:
+    # One per handler module: VALIDATOR = RequestValidator("TransferFunds")
+
+    def __init__(self, action_group, schema_dir=SCHEMA_DIR):
+        self.action_group = action_group
+        with open(os.path.join(schema_dir, f"ActionGroup_OpenAPIschema_JSON_{action_group}.txt")) as f:
+            spec = json.load(f)
+
+        self.operations = {}
+        for api_path, methods in spec["paths"].items():
+            for http_method, operation in methods.items():
+                schema = operation.get("requestBody", {}).get("content", {}).get("application/json", {}).get("schema", {})
+                if operation.get("parameters"):
+                    schema = query_schema(schema, operation["parameters"])
+                self.operations[(api_path, http_method.upper())] = Operation(api_path, http_method.upper(), schema)
+        self.default_operation = next(iter(self.operations.values()))
+
+    def operation(self, event):
+        key = (event.get("apiPath"), str(event.get("httpMethod", "")).upper())
+        if key in self.operations:
+            return self.operations[key]
+        # Events without a matching path/method (local tests) fall back to the first operation of the schema
+        for operation in self.operations.values():
+            if operation.api_path == event.get("apiPath"):
+                return operation
+        return self.default_operation
+
+    def validate(self, event):
+        # Returns {name: converted value} for the properties present; raises RequestValidationError
+        properties = event.get('requestBody', {}).get('content', {}).get('application/json', {}).get('properties', [])
+        return self.operation(event).validate((properties or []) + (event.get('parameters') or []))
+
+    def error_response(self, event, error):
+        operation = self.operation(event)
+        return {
+            "messageVersion": "1.0",
+            "response": {
+                "actionGroup": event.get("actionGroup", self.action_group),
+                "apiPath": event.get("apiPath", operation.api_path),
+                "httpMethod": event.get("httpMethod", operation.http_method),
+                "httpStatusCode": 400,
+                "responseBody": {
+                    "application/json": {
+                        "body": f"Invalid request: {str(error)}"
+                    }
+                }
+            }
+        }
@@ -0,0 +1,97 @@
+import re
+
+# Section seat maps shared by TicketPurchase, TicketHold, ReleaseExpiredHolds and GetAvailableSeats
+# Deploy this file next to each handler (same zip or a Lambda layer). The columns are added by
+# Postgresql_DDLs_ForSeatMaps.txt, the holds table by Postgresql_DDLs_ForSeatHolds.txt.
+#
+# ticket_availability.seat_map has one bit per seat (1 = sold). N adjacent seats are found and taken in a single
+# UPDATE: position() finds the first run of N free bits and overlay() sets them, under the one row lock of the
+# section, and total_available_seats is decremented in the same statement.
+
+# Usable as "WITH {ALLOCATE_CTE} <statement using allocated>" so callers can record the booking in the same
+# statement. Parameters: :section_number, :seats. allocated has section_number, first_seat and ticket_price and
+# is empty when the section has no run of :seats free seats.
+ALLOCATE_CTE = """
+section AS (
+    SELECT section_number,
+           position(CAST(repeat('0', CAST(:seats AS int)) AS varbit) IN seat_map) AS first_seat
+    FROM ticket_availability
+    WHERE section_number = :section_number
+    FOR UPDATE
+),
+allocated AS (
+    UPDATE ticket_availability t
+    SET seat_map = overlay(t.seat_map PLACING CAST(repeat('1', CAST(:seats AS int)) AS varbit) FROM s.first_seat),
+        total_available_seats = t.total_available_seats - CAST(:seats AS int)
+    FROM section s
+    WHERE t.section_number = s.section_number
+    AND s.first_seat > 0
+    RETURNING t.section_number, s.first_seat, t.ticket_price
+)
+"""
+
+
+def release_query(hold_filter):
+    # Deletes the ticket_holds rows matching hold_filter and gives their seats back in one statement. Holds of the
+    # same section are OR-ed into one mask (bit_or), so each section row is updated once however many holds
+    # lapse. Returns one row per hold: hold_id, section_number, first_seat, seat_count.
+    return f"""
+    WITH released AS (
+        DELETE FROM ticket_holds
+        WHERE {hold_filter}
+        RETURNING hold_id, section_number, first_seat, seat_count
+    ),
+    masks AS (
+        SELECT r.section_number,
+               bit_or(CAST(repeat('0', r.first_seat - 1) || repeat('1', r.seat_count)
+                           || repeat('0', a.seat_capacity - r.first_seat - r.seat_count + 1) AS varbit)) AS mask,
+               CAST(SUM(r.seat_count) AS int) AS seats
+        FROM released r
+        JOIN ticket_availability a ON a.section_number = r.section_number
+        GROUP BY r.section_number
+    ),
+    freed AS (
+        UPDATE ticket_availability a
+        SET seat_map = a.seat_map & ~m.mask,
+            total_available_seats = a.total_available_seats + m.seats
+        FROM masks m
+        WHERE a.section_number = m.section_number
+    )
+    SELECT hold_id, section_number, first_seat, seat_count FROM released
+    """
+
+
+FREE_RUN = re.compile(r"0+")
+
+
+def free_ranges(seat_map):
+    # seat_map as text ("1100111000") -> [(first seat, last seat)] of the free runs, seats counted from 1
+    return [(match.start() + 1, match.end()) for match in FREE_RUN.finditer(seat_map or "")]
+
+
+def largest_block(ranges):
+    return max((last - first + 1 for first, last in ranges), default=0)
+
+
+def seat_label(first_seat, seat_count):
+    return str(first_seat) if seat_count == 1 else f"{first_seat}-{first_seat + seat_count - 1}"
+
+
+def format_ranges(ranges, limit=10):
+    # "1-20, 35, 40-44 and 3 more ranges"
+    text = ", ".join(seat_label(first, last - first + 1) for first, last in ranges[:limit])
+    if len(ranges) > limit:
+        text += f" and {len(ranges) - limit} more ranges"
+    return text
+
+
+def section_map(conn, section_number):
+    # (total_available_seats, free ranges) of one section, or None if the section does not exist
+    rows = conn.run("""
+        SELECT total_available_seats, CAST(seat_map AS text)
+        FROM ticket_availability
+        WHERE section_number = :section_number
+    """, section_number=section_number)
+    if not rows:
+        return None
+    return rows[0][0], free_ranges(rows[0][1])
@@ -2,29 +2,27 @@ import json
 import boto3
 from botocore.exceptions import ClientError
 import os
+from Instrumentation import instrument, log_event, mark
+from RequestValidator import RequestValidator, RequestValidationError
 
 # SendEmail function
 
+# Compiled once per container from ActionGroup_OpenAPIschema_JSON_SendEmail.txt
+VALIDATOR = RequestValidator("SendEmail")
+
+@instrument("SendEmail")
 def lambda_handler(event, context):
     try:
-        print(f"Received event: {json.dumps(event, default=str)}")
+        log_event(event)
+        
+        # Validate the parameters against the OpenAPI schema before any I/O (400 on bad input)
+        params = VALIDATOR.validate(event)
+        subject = params.get('subject', "Banking Notification")  # default
+        message_body = params['messageBody']
         
         # Initialize SES client
         ses_client = boto3.client('ses', region_name=os.environ.get('MY_AWS_REGION', 'us-east-1'))
         
-        # Default values
-        subject = "Banking Notification"
-        message_body = "This is a test email from your banking system."
-        
-        # Parse parameters from requestBody in Bedrock format
-        if 'requestBody' in event and 'content' in event['requestBody']:
-            properties = event['requestBody']['content']['application/json']['properties']
-            for prop in properties:
-                if prop['name'] == 'subject':
-                    subject = prop['value']
-                elif prop['name'] == 'messageBody':
-                    message_body = prop['value']
-        
         # Get sender email from environment variable
         sender_email = os.environ.get('SENDER_EMAIL')
         if not sender_email:
@@ -35,6 +33,8 @@ def lambda_handler(event, context):
         if not recipient_email:
             raise ValueError("RECIPIENT_EMAIL environment variable must be set")
         
+        mark("parse")
+
         print(f"Sending email from {sender_email} to {recipient_email}")
         print(f"Subject: {subject}")
         
@@ -71,9 +71,12 @@ def lambda_handler(event, context):
             }
         )
         
+        mark("send")
+
         message_id = response['MessageId']
         success_message = f"Email sent successfully to {recipient_email}. Message ID: {message_id}"
         print(success_message)
+        mark("format")
         
         # Return success response in Bedrock format
         return {
@@ -96,6 +99,10 @@ def lambda_handler(event, context):
             }
         }
         
+    except RequestValidationError as e:
+        print(f"Invalid request: {str(e)}")
+        return VALIDATOR.error_response(event, e)
+        
     except ClientError as e:
         error_code = e.response['Error']['Code']
         error_message = e.response['Error']['Message']
@@ -0,0 +1,214 @@
+import os
+import json
+from Instrumentation import instrument, log_event, mark
+from DbConnection import connect_primary, session_attributes
+from AdmissionControl import Admission, admit, purchase_slot, waiting_room_response
+from SeatMap import ALLOCATE_CTE, format_ranges, largest_block, release_query, section_map, seat_label
+from RequestValidator import RequestValidator, RequestValidationError
+
+# TicketHold function
+# Two-phase checkout: /hold-seats takes adjacent seats for HOLD_TTL_SECONDS, /confirm-hold turns the hold into a
+# ticket after payment, /release-hold gives the seats back. Holds that are neither confirmed nor released are
+# returned to inventory by ReleaseExpiredHolds.py. Every step is one statement, so no row lock is held between
+# the agent's calls. Tables are created by Postgresql_DDLs_ForSeatHolds.txt.
+
+HOLD_TTL_SECONDS = int(os.environ.get('HOLD_TTL_SECONDS', '600'))
+
+# Compiled once per container from ActionGroup_OpenAPIschema_JSON_TicketHold.txt
+VALIDATOR = RequestValidator("TicketHold")
+
+HOLD_QUERY = f"""
+WITH {ALLOCATE_CTE}
+INSERT INTO ticket_holds (
+    section_number, first_seat, seat_count, hold_price, purchaser_name, purchaser_phone, purchaser_email, expires_at
+)
+SELECT section_number, first_seat, CAST(:seats AS int), ticket_price, :purchaser_name, :purchaser_phone, :purchaser_email,
+       CURRENT_TIMESTAMP + make_interval(secs => CAST(:ttl_seconds AS int))
+FROM allocated
+RETURNING hold_id, section_number, first_seat, seat_count, hold_price, expires_at
+"""
+
+# Only an unexpired hold can be confirmed; deleting it and inserting the ticket is one statement
+CONFIRM_QUERY = """
+WITH confirmed AS (
+    DELETE FROM ticket_holds
+    WHERE hold_id = :hold_id
+    AND expires_at > CURRENT_TIMESTAMP
+    RETURNING hold_id, section_number, first_seat, seat_count, hold_price, purchaser_name, purchaser_phone, purchaser_email
+)
+INSERT INTO ticket_transactions (
+    hold_id, section_number, seat_number, seat_count, purchased_price, purchaser_name, purchaser_phone, purchaser_email
+)
+SELECT hold_id, section_number, first_seat, seat_count, hold_price, purchaser_name, purchaser_phone, purchaser_email
+FROM confirmed
+RETURNING transaction_id, section_number, seat_number, seat_count, purchased_price,
+          purchaser_name, purchaser_phone, purchaser_email
+"""
+
+CONFIRMED_QUERY = """
+SELECT transaction_id, section_number, seat_number, seat_count, purchased_price,
+       purchaser_name, purchaser_phone, purchaser_email
+FROM ticket_transactions
+WHERE hold_id = :hold_id
+"""
+
+
+def ticket_details(row):
+    return """Transaction Number: {}
+section_number: {}
+seat_number: {}
+number_of_seats: {}
+purchased_price: {}
+total_price: {}
+purchaser_name: {}
+purchaser_phone: {}
+purchaser_email: {}""".format(row[0], row[1], seat_label(row[2], row[3]), row[3], row[4], row[4] * row[3],
+                              row[5], row[6], row[7])
+
+
+def hold_seats(conn, params):
+    section_number = params['user_desired_section_number']
+    seats = params['user_desired_number_of_seats']
+
+    rows = conn.run(HOLD_QUERY,
+                    section_number=section_number,
+                    seats=seats,
+                    purchaser_name=params['person_name'],
+                    purchaser_phone=params['person_phone'],
+                    purchaser_email=params['person_email'],
+                    ttl_seconds=HOLD_TTL_SECONDS)
+    if not rows:
+        availability = section_map(conn, section_number)
+        if availability is None or availability[0] < seats:
+            return "Your requested section seats are all sold out. Please choose a different section."
+        available_seats, ranges = availability
+        return (f"Your requested section has {available_seats} seats left, but not {seats} seats next to each other. "
+                f"The largest block of adjacent seats is {largest_block(ranges)} (free seats: {format_ranges(ranges)}). "
+                f"Please choose fewer seats or a different section.")
+
+    hold_id, section_number, first_seat, seat_count, price, expires_at = rows[0]
+    return f"""Your seats are on hold. Complete the payment, then confirm the hold to purchase the tickets.
+
+Hold Number: {hold_id}
+section_number: {section_number}
+seat_number: {seat_label(first_seat, seat_count)}
+number_of_seats: {seat_count}
+price_per_seat: {price}
+total_price: {price * seat_count}
+hold_expires_at: {expires_at.isoformat()} ({HOLD_TTL_SECONDS // 60} minutes)"""
+
+
+def confirm_hold(conn, params):
+    hold_id = params['hold_id']
+
+    rows = conn.run(CONFIRM_QUERY, hold_id=hold_id)
+    if rows:
+        return ("We have successfully purchased your ticket. Congratulations. Here is your seat details.\n\n"
+                + ticket_details(rows[0]))
+
+    # A retried confirm returns the ticket created the first time
+    rows = conn.run(CONFIRMED_QUERY, hold_id=hold_id)
+    if rows:
+        return "This hold was already confirmed. Here is your seat details.\n\n" + ticket_details(rows[0])
+
+    # Expired but not swept yet: give the seats back now
+    expired = conn.run(release_query("hold_id = :hold_id AND expires_at <= CURRENT_TIMESTAMP"), hold_id=hold_id)
+    if expired:
+        return f"Hold {hold_id} has expired and its seats were released. Please hold the seats again."
+    return f"No active hold found with hold number {hold_id}. It may have expired; please hold the seats again."
+
+
+def release_hold(conn, params):
+    hold_id = params['hold_id']
+
+    rows = conn.run(release_query("hold_id = :hold_id"), hold_id=hold_id)
+    if rows:
+        _, section_number, first_seat, seat_count = rows[0]
+        return f"Hold {hold_id} released. Seats {seat_label(first_seat, seat_count)} in section {section_number} are available again."
+
+    if conn.run(CONFIRMED_QUERY, hold_id=hold_id):
+        return f"Hold {hold_id} was already confirmed and cannot be released."
+    return f"No active hold found with hold number {hold_id}. It was already released or has expired."
+
+
+OPERATIONS = {
+    "/hold-seats": hold_seats,
+    "/confirm-hold": confirm_hold,
+    "/release-hold": release_hold
+}
+
+
+@instrument("TicketHold")
+def lambda_handler(event, context):
+    try:
+        log_event(event)
+
+        # Validate the parameters against the OpenAPI schema of the called path before any I/O (400 on bad input)
+        params = VALIDATOR.validate(event)
+        operation = OPERATIONS.get(event.get("apiPath"))
+        if operation is None:
+            raise RequestValidationError(f"unknown apiPath {event.get('apiPath')}; expected one of: {', '.join(OPERATIONS)}")
+
+        print(f"Processing {event.get('apiPath')}: {json.dumps({k: str(v) for k, v in params.items()})}")
+
+        mark("parse")
+
+        # Waiting room (AdmissionControl.py) in front of new holds; confirm and release finish an admitted checkout
+        if event.get("apiPath") == "/hold-seats":
+            admission = admit(event)
+            if not admission.admitted:
+                return waiting_room_response(event, admission, "TicketHold", "/hold-seats", "POST")
+            mark("admission")
+
+        # At most ADMISSION_MAX_CONCURRENT ticket writes hold a database connection at once
+        with purchase_slot() as slot:
+            if not slot:
+                return waiting_room_response(event, Admission(True), "TicketHold", event.get("apiPath"), "POST")
+
+            # Connect to PostgreSQL
+            conn = connect_primary()
+
+            try:
+                response_text = operation(conn, params)
+                attributes = session_attributes(event, conn)
+            finally:
+                conn.close()
+
+        mark("format")
+
+        return {
+            "messageVersion": "1.0",
+            "response": {
+                "actionGroup": event.get("actionGroup", "TicketHold"),
+                "apiPath": event.get("apiPath"),
+                "httpMethod": event.get("httpMethod", "POST"),
+                "httpStatusCode": 200,
+                "responseBody": {
+                    "application/json": {
+                        "body": response_text
+                    }
+                }
+            },
+            "sessionAttributes": attributes
+        }
+
+    except RequestValidationError as e:
+        print(f"Invalid request: {str(e)}")
+        return VALIDATOR.error_response(event, e)
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return {
+            "messageVersion": "1.0",
+            "response": {
+                "actionGroup": event.get("actionGroup", "TicketHold"),
+                "apiPath": event.get("apiPath", "/hold-seats"),
+                "httpMethod": event.get("httpMethod", "POST"),
+                "httpStatusCode": 500,
+                "responseBody": {
+                    "application/json": {
+                        "body": f"Error processing ticket hold: {str(e)}"
+                    }
+                }
+            }
+        }
@@ -1,109 +1,167 @@
-import os
-import json
-import pg8000.native
 from datetime import datetime
+from Instrumentation import instrument, log_event, mark
+from DbConnection import connect_primary, session_attributes
+from Ledger import append_only, lock_accounts, locked_balance
+from VelocityCheck import VelocityLimitExceeded, rejection_response, release_velocity, reserve_velocity
+from FxRates import account_currencies, convert, refresh
+from RequestValidator import RequestValidator, RequestValidationError
 
 # TransferFunds function
 
+# Compiled once per container from ActionGroup_OpenAPIschema_JSON_TransferFunds.txt
+VALIDATOR = RequestValidator("TransferFunds")
+
+@instrument("TransferFunds")
 def lambda_handler(event, context):
     try:
-        print(f"Received event: {json.dumps(event, default=str)}")
-        
-        # Extract parameters from Bedrock's format
-        from_account_id = None
-        to_account_id = None
-        amount = None
-        description = "Account transfer"  # default
-        
-        # Parse the requestBody properties
-        if 'requestBody' in event and 'content' in event['requestBody']:
-            properties = event['requestBody']['content']['application/json']['properties']
-            for prop in properties:
-                if prop['name'] == 'fromAccountId':
-                    from_account_id = int(prop['value'])
-                elif prop['name'] == 'toAccountId':
-                    to_account_id = int(prop['value'])
-                elif prop['name'] == 'amount':
-                    amount = float(prop['value'])
-                elif prop['name'] == 'description':
-                    description = prop['value']
-        
-        # Validate required parameters
-        if from_account_id is None or to_account_id is None or amount is None:
-            raise ValueError("fromAccountId, toAccountId, and amount are required parameters")
-        
-        if amount <= 0:
-            raise ValueError("Transfer amount must be positive")
+        log_event(event)
+        
+        # Validate the parameters against the OpenAPI schema before any I/O (400 on bad input)
+        params = VALIDATOR.validate(event)
+        from_account_id = params['fromAccountId']
+        to_account_id = params['toAccountId']
+        amount = params['amount']  # schema enforces amount > 0
+        description = params.get('description', "Account transfer")  # default
+        
+        if from_account_id == to_account_id:
+            raise RequestValidationError("fromAccountId and toAccountId must be different accounts")
             
         print(f"Transfer: ${amount} from account {from_account_id} to account {to_account_id}")
  
+        mark("parse")
+
         # Connect to PostgreSQL 
-        conn = pg8000.native.Connection(
-            host=os.environ['PG_HOST'],
-            database=os.environ['PG_DATABASE'],
-            user=os.environ['PG_USER'],
-            password=os.environ['PG_PASSWORD']
-        )
+        conn = connect_primary()
+        
+        try:
+            # Velocity limits are checked (and the amount reserved) against in-memory counters before any write SQL runs
+            reservation = reserve_velocity(conn, from_account_id, amount)
+            mark("velocity")
+
+            # Cross-currency transfers credit the destination in its own currency, converted with the cached rates
+            try:
+                currencies = account_currencies(conn, [from_account_id, to_account_id])
+                from_currency = currencies.get(from_account_id)
+                to_currency = currencies.get(to_account_id)
+                # Same-currency transfers (and unknown accounts, reported below) never read the FX tables
+                cross_currency = bool(from_currency and to_currency and from_currency != to_currency)
+                credit_amount = amount
+                fx_version = None
+                if cross_currency:
+                    rates, fx_version = refresh(conn)
+                    credit_amount = float(convert(amount, from_currency, to_currency, rates))
+            except Exception:
+                release_velocity(reservation)
+                raise
+            mark("fx")
               
-        current_time = datetime.now()
+            current_time = datetime.now()
         
-        # Step 1: Check source account balance
-        balance_query = "SELECT balance FROM public.accounts WHERE accountid = :account_id"
-        balance_result = conn.run(balance_query, account_id=from_account_id)
+            # Run the balance check, both ledger rows and both balance updates in one transaction.
+            # Both accounts are locked in a fixed order so concurrent transfers cannot overdraw or deadlock.
+            try:
+                conn.run("BEGIN")
+
+                # Step 1: Lock both accounts in accountid order, then check the source account balance
+                lock_accounts(conn, [from_account_id, to_account_id])
+                source_balance = locked_balance(conn, from_account_id)
         
-        if not balance_result:
-            raise Exception(f"Source account {from_account_id} not found")
+                if source_balance is None:
+                    raise Exception(f"Source account {from_account_id} not found")
             
-        current_balance = float(balance_result[0][0])
-        if current_balance < amount:
-            raise Exception(f"Insufficient funds. Current balance: ${current_balance:.2f}, Transfer amount: ${amount:.2f}")
-        
-        # Step 2: Create debit transaction (source account)
-        debit_query = """
-        INSERT INTO public.transactions 
-        (accountid, amount, transactiontype, description, relatedparty, createdat)
-        VALUES (:account_id, :amount, 'Transfer Out', :description, :related_party, :created_at)
-        RETURNING transactionid
-        """
-        
-        debit_result = conn.run(debit_query,
-                               account_id=from_account_id,
-                               amount=-amount,  # Negative for debit
-                               description=description,
-                               related_party=f"Transfer to Account {to_account_id}",
-                               created_at=current_time)
-        
-        debit_transaction_id = debit_result[0][0]
-        
-        # Step 3: Create credit transaction (destination account)
-        credit_query = """
-        INSERT INTO public.transactions 
-        (accountid, amount, transactiontype, description, relatedparty, createdat)
-        VALUES (:account_id, :amount, 'Transfer In', :description, :related_party, :created_at)
-        RETURNING transactionid
-        """
-        
-        credit_result = conn.run(credit_query,
-                                account_id=to_account_id,
-                                amount=amount,  # Positive for credit
-                                description=description,
-                                related_party=f"Transfer from Account {from_account_id}",
-                                created_at=current_time)
-        
-        credit_transaction_id = credit_result[0][0]
-        
-        # Step 4: Update account balances
-        update_source = "UPDATE public.accounts SET balance = balance - :amount WHERE accountid = :account_id"
-        conn.run(update_source, amount=amount, account_id=from_account_id)
-        
-        update_dest = "UPDATE public.accounts SET balance = balance + :amount WHERE accountid = :account_id"
-        conn.run(update_dest, amount=amount, account_id=to_account_id)
-        
-        conn.close()
+                current_balance = float(source_balance)
+                if current_balance < amount:
+                    raise Exception(f"Insufficient funds. Current balance: ${current_balance:.2f}, Transfer amount: ${amount:.2f}")
+        
+                # Step 2: Create debit transaction (source account)
+                debit_query = """
+                INSERT INTO public.transactions 
+                (accountid, amount, transactiontype, description, relatedparty, createdat)
+                VALUES (:account_id, :amount, 'Transfer Out', :description, :related_party, :created_at)
+                RETURNING transactionid
+                """
+        
+                debit_result = conn.run(debit_query,
+                                       account_id=from_account_id,
+                                       amount=-amount,  # Negative for debit
+                                       description=description,
+                                       related_party=f"Transfer to Account {to_account_id}",
+                                       created_at=current_time)
+        
+                debit_transaction_id = debit_result[0][0]
+        
+                # Step 3: Create credit transaction (destination account).
+                # A converted credit is only inserted if the rates used for the conversion are still current; if they
+                # changed in the meantime the cache is refreshed and the conversion redone once, inside the same
+                # transaction. Same-currency credits are a plain insert, so they work without the FX tables.
+                credit_query = """
+                INSERT INTO public.transactions 
+                (accountid, amount, transactiontype, description, relatedparty, createdat)
+                VALUES (:account_id, :amount, 'Transfer In', :description, :related_party, :created_at)
+                RETURNING transactionid
+                """
+
+                fx_credit_query = """
+                INSERT INTO public.transactions 
+                (accountid, amount, transactiontype, description, relatedparty, createdat)
+                SELECT :account_id, :amount, 'Transfer In', :description, :related_party, :created_at
+                FROM public.fx_rates_version
+                WHERE version = CAST(:fx_version AS bigint)
+                RETURNING transactionid
+                """
+        
+                if not cross_currency:
+                    credit_result = conn.run(credit_query,
+                                            account_id=to_account_id,
+                                            amount=credit_amount,  # Positive for credit
+                                            description=description,
+                                            related_party=f"Transfer from Account {from_account_id}",
+                                            created_at=current_time)
+                else:
+                    for attempt in range(2):
+                        credit_result = conn.run(fx_credit_query,
+                                                account_id=to_account_id,
+                                                amount=credit_amount,  # Positive for credit
+                                                description=description,
+                                                related_party=f"Transfer from Account {from_account_id}",
+                                                created_at=current_time,
+                                                fx_version=fx_version)
+                        if credit_result or attempt == 1:
+                            break
+                        rates, fx_version = refresh(conn, force=True)
+                        credit_amount = float(convert(amount, from_currency, to_currency, rates))
+        
+                    if not credit_result:
+                        raise Exception("FX rates changed during the transfer, please retry")
+        
+                credit_transaction_id = credit_result[0][0]
+        
+                # Step 4: Update account balances (append-only ledger mode derives them from the ledger instead)
+                if not append_only():
+                    update_source = "UPDATE public.accounts SET balance = balance - :amount WHERE accountid = :account_id"
+                    conn.run(update_source, amount=amount, account_id=from_account_id)
+            
+                    update_dest = "UPDATE public.accounts SET balance = balance + :amount WHERE accountid = :account_id"
+                    conn.run(update_dest, amount=credit_amount, account_id=to_account_id)
+            
+                conn.run("COMMIT")
+            except Exception as transaction_error:
+                release_velocity(reservation)
+                conn.run("ROLLBACK")
+                raise transaction_error
+        
+            attributes = session_attributes(event, conn)
+        finally:
+            conn.close()
         
         # Format response
-        response_text = f"Transfer completed successfully! ${amount:.2f} transferred from account {from_account_id} to account {to_account_id}. Transactions created: #{debit_transaction_id} (debit) and #{credit_transaction_id} (credit). Description: {description}"
+        conversion = ""
+        if cross_currency:
+            conversion = f" Converted {amount:.2f} {from_currency} to {credit_amount:.2f} {to_currency} (rates version {fx_version})."
+        response_text = f"Transfer completed successfully! ${amount:.2f} transferred from account {from_account_id} to account {to_account_id}.{conversion} Transactions created: #{debit_transaction_id} (debit) and #{credit_transaction_id} (credit). Description: {description}"
         
+        mark("format")
+
         # Return in Bedrock's expected format
         return {
             "messageVersion": "1.0",
@@ -117,9 +175,17 @@ def lambda_handler(event, context):
                         "body": response_text
                     }
                 }
-            }
+            },
+            "sessionAttributes": attributes
         }
         
+    except RequestValidationError as e:
+        print(f"Invalid request: {str(e)}")
+        return VALIDATOR.error_response(event, e)
+
+    except VelocityLimitExceeded as e:
+        return rejection_response(event, e, "TransferFunds", "/transfer-funds", "POST")
+
     except Exception as e:
         print(f"Error: {str(e)}")
         return {
@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import threading
+from decimal import Decimal
+
+# Pre-commit velocity checks shared by the write handlers (TransferFunds, InsertTransaction)
+# Deploy this file next to each handler (same zip or a Lambda layer).
+#
+# Outgoing amounts are counted per account in sliding windows (count and amount per minute and per day) held in
+# memory, so a check is a few dictionary lookups and never queries the ledger. Each window is split into buckets
+# (6 x 10s for the minute, 24 x 1h for the day) and only the buckets inside the window are summed.
+#
+# A Lambda container only sees its own traffic, so with VELOCITY_TABLE set the counters are also kept in a shared
+# DynamoDB table (partition key "pk" (S), sort key "sk" (S), TTL attribute "expiresAt"). The shared counters are
+# read when an account is first seen by the container and again every VELOCITY_SYNC_SECONDS.
+#
+# reserve_velocity() checks the limits and adds the amount to the counters in one step under the lock, so two
+# concurrent writes in the same container cannot both pass on the same headroom. The reservation is added to the
+# shared counters right away (DynamoDB ADD, atomic per bucket) and taken back with release_velocity() when the
+# write does not commit.
+#
+# Environment:
+#   VELOCITY_MODE          flag (default): only log outliers; enforce: reject the write (HTTP 422); off: skip the
+#                          checks. Review DEFAULT_LIMITS / VELOCITY_LIMITS before switching to enforce.
+#   VELOCITY_LIMITS        JSON overriding DEFAULT_LIMITS per accounttype, e.g. {"Checking": {"perDay": {"amount": 5000}}}
+#   VELOCITY_TABLE         DynamoDB table for the shared counters (optional)
+#   VELOCITY_SYNC_SECONDS  how long in-memory counters are trusted before re-reading the shared ones (default 10)
+#
+# More checks can be added with register_check(fn): fn(account_type, limits, amount, totals) returns a reason
+# string for an outlier, or None.
+
+VELOCITY_MODE = os.environ.get('VELOCITY_MODE', 'flag')
+VELOCITY_TABLE = os.environ.get('VELOCITY_TABLE')
+SYNC_SECONDS = float(os.environ.get('VELOCITY_SYNC_SECONDS', '10'))
+
+# window name: (length in seconds, number of buckets)
+WINDOWS = {"perMinute": (60, 6), "perDay": (86400, 24)}
+
+DEFAULT_LIMITS = {
+    "Checking": {"maxAmount": 10000, "perMinute": {"count": 10, "amount": 5000}, "perDay": {"count": 200, "amount": 20000}},
+    "Savings": {"maxAmount": 25000, "perMinute": {"count": 5, "amount": 25000}, "perDay": {"count": 20, "amount": 50000}},
+    "Credit": {"maxAmount": 5000, "perMinute": {"count": 10, "amount": 3000}, "perDay": {"count": 100, "amount": 10000}},
+    "default": {"maxAmount": 5000, "perMinute": {"count": 5, "amount": 2000}, "perDay": {"count": 50, "amount": 5000}}
+}
+
+MAX_CACHED_ACCOUNTS = 100000
+
+
+class VelocityLimitExceeded(Exception):
+    pass
+
+
+def load_limits():
+    limits = {account_type: dict(values) for account_type, values in DEFAULT_LIMITS.items()}
+    for account_type, overrides in json.loads(os.environ.get('VELOCITY_LIMITS', '{}')).items():
+        merged = limits.setdefault(account_type, dict(DEFAULT_LIMITS["default"]))
+        for key, value in overrides.items():
+            merged[key] = {**merged.get(key, {}), **value} if isinstance(value, dict) else value
+    return limits
+
+
+LIMITS = load_limits()
+
+_lock = threading.Lock()
+_account_types = {}
+_counters = {}   # account id -> {window: {bucket start: [count, amount]}}
+_synced_at = {}  # account id -> time the shared counters were last read
+_shared_table = None
+
+
+def bucket_seconds(window):
+    length, buckets = WINDOWS[window]
+    return length // buckets
+
+
+def window_totals(account_counters, now):
+    totals = {}
+    for window, (length, _) in WINDOWS.items():
+        buckets = account_counters.get(window, {})
+        oldest = now - length
+        for start in [s for s in buckets if s + bucket_seconds(window) <= oldest]:
+            del buckets[start]
+        totals[window] = {"count": sum(b[0] for b in buckets.values()),
+                          "amount": sum(b[1] for b in buckets.values())}
+    return totals
+
+
+def shared_table():
+    global _shared_table
+    if _shared_table is None:
+        import boto3
+        _shared_table = boto3.resource('dynamodb', region_name=os.environ.get('MY_AWS_REGION', 'us-east-1')).Table(
+            VELOCITY_TABLE)
+    return _shared_table
+
+
+def read_shared(account_id, now):
+    # All buckets of the account still inside the day window, in one query
+    from boto3.dynamodb.conditions import Key
+    oldest = int(now - WINDOWS["perDay"][0]) - bucket_seconds("perDay")
+    response = shared_table().query(
+        KeyConditionExpression=Key('pk').eq(f"account#{account_id}") & Key('sk').gte(f"{oldest:012d}")
+    )
+    account_counters = {window: {} for window in WINDOWS}
+    for item in response.get('Items', []):
+        start, window = item['sk'].split('#')
+        account_counters[window][int(start)] = [int(item['count']), float(item['amount'])]
+    return account_counters
+
+
+def add_shared(account_id, buckets, count, amount):
+    # buckets: {window: bucket start}; count and amount are negative when a reservation is released
+    table = shared_table()
+    for window, start in buckets.items():
+        length, _ = WINDOWS[window]
+        table.update_item(
+            Key={"pk": f"account#{account_id}", "sk": f"{start:012d}#{window}"},
+            UpdateExpression="ADD #count :count, amount :amount SET expiresAt = :expires_at",
+            ExpressionAttributeNames={"#count": "count"},
+            ExpressionAttributeValues={":count": count, ":amount": Decimal(str(round(amount, 2))),
+                                       ":expires_at": start + length + bucket_seconds(window)}
+        )
+
+
+def account_type(conn, account_id):
+    # accounttype never changes, so it is cached for the life of the container
+    cached = _account_types.get(account_id)
+    if cached is not None:
+        return cached
+    rows = conn.run("SELECT accounttype FROM public.accounts WHERE accountid = :account_id", account_id=account_id)
+    if not rows:
+        return None
+    if len(_account_types) >= MAX_CACHED_ACCOUNTS:
+        _account_types.clear()
+    _account_types[account_id] = rows[0][0]
+    return rows[0][0]
+
+
+def max_amount_check(account_type_name, limits, amount, totals):
+    if amount > limits.get("maxAmount", float("inf")):
+        return f"single {account_type_name} payment of ${amount:.2f} is above the ${limits['maxAmount']:.2f} limit"
+    return None
+
+
+def window_check(account_type_name, limits, amount, totals):
+    for window, window_limits in ((w, limits.get(w, {})) for w in WINDOWS):
+        if "count" in window_limits and totals[window]["count"] + 1 > window_limits["count"]:
+            return f"more than {window_limits['count']} payments {window} from this {account_type_name} account"
+        if "amount" in window_limits and totals[window]["amount"] + amount > window_limits["amount"]:
+            return f"more than ${window_limits['amount']:.2f} {window} from this {account_type_name} account"
+    return None
+
+
+CHECKS = [max_amount_check, window_check]
+
+
+def register_check(check):
+    CHECKS.append(check)
+
+
+def add_local(account_id, buckets, count, amount):
+    # Caller holds _lock
+    if len(_counters) >= MAX_CACHED_ACCOUNTS and account_id not in _counters:
+        _counters.clear()
+        _synced_at.clear()
+    account_counters = _counters.setdefault(account_id, {window: {} for window in WINDOWS})
+    for window, start in buckets.items():
+        bucket = account_counters[window].get(start)
+        if bucket is None:
+            if count < 0:
+                # The bucket already left the window, nothing to take back
+                continue
+            bucket = account_counters[window][start] = [0, 0.0]
+        bucket[0] += count
+        bucket[1] += amount
+
+
+def reserve_velocity(conn, account_id, amount):
+    # Call before the write SQL with the outgoing amount (positive). Checks the limits and counts the amount in
+    # one step; raises VelocityLimitExceeded in enforce mode. Returns the reservation to pass to
+    # release_velocity() if the write does not commit (None when nothing was counted).
+    if VELOCITY_MODE == "off" or amount <= 0:
+        return None
+
+    account_type_name = account_type(conn, account_id)
+    if account_type_name is None:
+        # Unknown account: the write itself reports "not found"
+        return None
+    limits = LIMITS.get(account_type_name, LIMITS["default"])
+
+    now = time.time()
+    if VELOCITY_TABLE and now - _synced_at.get(account_id, 0) > SYNC_SECONDS:
+        shared = read_shared(account_id, now)
+        with _lock:
+            _counters[account_id] = shared
+            _synced_at[account_id] = now
+
+    buckets = {window: int(now) - int(now) % bucket_seconds(window) for window in WINDOWS}
+    with _lock:
+        totals = window_totals(_counters.setdefault(account_id, {window: {} for window in WINDOWS}), now)
+        reasons = [reason for reason in (check(account_type_name, limits, amount, totals) for check in CHECKS)
+                   if reason]
+        rejected = reasons and VELOCITY_MODE == "enforce"
+        if not rejected:
+            add_local(account_id, buckets, 1, amount)
+
+    if reasons:
+        print(f"Velocity {'rejected' if rejected else 'flagged'} account {account_id}: {'; '.join(reasons)}")
+        if rejected:
+            raise VelocityLimitExceeded(f"Velocity limit exceeded: {reasons[0]}")
+
+    reservation = (account_id, buckets, amount)
+    if VELOCITY_TABLE:
+        try:
+            add_shared(account_id, buckets, 1, amount)
+        except Exception as e:
+            # This container still counts it; other containers see it at their next sync
+            print(f"Could not update shared velocity counters: {str(e)}")
+    return reservation
+
+
+def release_velocity(reservation):
+    # Call when the write reserved by reserve_velocity() was rolled back or failed
+    if reservation is None:
+        return
+    account_id, buckets, amount = reservation
+    with _lock:
+        add_local(account_id, buckets, -1, -amount)
+
+    if VELOCITY_TABLE:
+        try:
+            add_shared(account_id, buckets, -1, -amount)
+        except Exception as e:
+            # The shared counters keep the amount until the bucket expires, which only errs on the strict side
+            print(f"Could not release shared velocity counters: {str(e)}")
+
+
+def rejection_response(event, error, action_group, api_path, http_method):
+    # Answer for a write rejected in enforce mode: the request was well formed but the payment is over a limit
+    return {
+        "messageVersion": "1.0",
+        "response": {
+            "actionGroup": event.get("actionGroup", action_group),
+            "apiPath": event.get("apiPath", api_path),
+            "httpMethod": event.get("httpMethod", http_method),
+            "httpStatusCode": 422,
+            "responseBody": {
+                "application/json": {
+                    "body": f"Payment rejected: {str(error)}"
+                }
+            }
+        }
+    }